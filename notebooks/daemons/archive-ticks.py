@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+import datetime
+import pandas as pd
+from config import app_config # pylint: disable=import-error
+from db import create_db_engine, DatabaseSchema # pylint: disable=import-error
+from logger import Logger # pylint: disable=import-error
+from market import TickArchive # pylint: disable=import-error
+from pathlib import Path
+from sqlalchemy import MetaData
+
+# initialize the logger so we see what happens
+logger_path = Path(app_config.log.path)
+logger = Logger(path = logger_path / Path(__file__).stem, level = int(app_config.log.level))
+
+# connect to the database
+meta = MetaData()
+db_schema = DatabaseSchema(meta)
+engine = create_db_engine(app_config.db)
+meta.create_all(engine)
+logger.debug('Connected to the database with URL {url}'.format(url = repr(engine.url)))
+
+archive = TickArchive(app_config.archive.path)
+
+# the archive holds only complete days, so stop before the current UTC day
+today = datetime.datetime.now(tz = datetime.timezone.utc).date()
+first = pd.read_sql('select\
+    min(stamp) as stamp\
+from\
+    {tables.TRANSACTIONS};'.format(tables = db_schema),
+    con = engine)
+if first.shape[0] < 1 or pd.isnull(first['stamp'].iloc[0]):
+    logger.debug('There are no transactions to archive.')
+else:
+    day = datetime.datetime.fromtimestamp(int(first['stamp'].iloc[0]) // 1000, tz = datetime.timezone.utc).date()
+    while day < today:
+        if not archive.is_archived(day):
+            logger.debug('Archiving the transactions from {day}.'.format(day = day))
+            exported = archive.export_day(engine, db_schema, day)
+            logger.debug('Archived {transactions} transactions from {day}.'.format(transactions = exported, day = day))
+        day += datetime.timedelta(days = 1)
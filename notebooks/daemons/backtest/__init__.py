@@ -0,0 +1,14 @@
+from .data import load_tape
+from .engine import settings_from_config, Backtester, BacktestReport, TIMER_STATES
+from .sweep import grid, random_search, sweep
+
+__all__ = [
+    'Backtester',
+    'BacktestReport',
+    'TIMER_STATES',
+    'grid',
+    'load_tape',
+    'random_search',
+    'settings_from_config',
+    'sweep'
+]
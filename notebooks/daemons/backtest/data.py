@@ -0,0 +1,42 @@
+import pandas as pd
+from db import create_db_engine, DatabaseSchema # pylint: disable=import-error
+from market import MarketTape, TickArchive # pylint: disable=import-error
+from sqlalchemy import text, MetaData
+
+def load_tape(config, begin_stamp, end_stamp):
+    """
+        Reads the ticks in [begin_stamp, end_stamp) from the tick archive, if
+        there's an [archive] section in the config file, or from the
+        `transactions` table otherwise.
+
+        :param config: The application config.
+        :type config: config.Config
+        :param begin_stamp: The first stamp, in milliseconds.
+        :type begin_stamp: int
+        :param end_stamp: The last stamp, in milliseconds (excluded).
+        :type end_stamp: int
+        :rtype: market.MarketTape
+    """
+    if hasattr(config, 'archive'):
+        return MarketTape.from_archive(TickArchive(config.archive.path), begin_stamp, end_stamp)
+
+    meta = MetaData()
+    db_schema = DatabaseSchema(meta)
+    engine = create_db_engine(config.db)
+    return MarketTape.from_frame(pd.read_sql(text('select\
+        id,\
+        price,\
+        symbol,\
+        stamp,\
+        volume\
+    from\
+        {tables.TRANSACTIONS}\
+    where\
+        stamp >= :begin and\
+        stamp < :end;'.format(tables = db_schema)),
+        con = engine,
+        params = {
+            'begin': begin_stamp,
+            'end': end_stamp
+        }
+    ))
@@ -0,0 +1,302 @@
+import numpy as np
+import pandas as pd
+import time
+from broker import match_orders, parse_commission # pylint: disable=import-error
+from db import OrderStatus # pylint: disable=import-error
+from market import indicators as market_indicators, statistics as market_statistics # pylint: disable=import-error
+from strategy import create, specs_from_config, MarketSnapshot, StrategyEngine # pylint: disable=import-error
+
+# the same rotation as timer-daemon.py
+TIMER_STATES = [
+    'trends',
+    'orders',
+    'profit',
+    'orders'
+]
+
+def settings_from_config(config):
+    """
+        Reads the backtest settings from the application config: the [buy],
+        [sell], [orders], [broker] and [indicators] options the daemons use,
+        the [strategies] section, if any, as strategy specs, and the timer
+        period from the [backtest] section, if any.
+
+        :param config: The application config.
+        :type config: config.Config
+        :return: A dict with the settings.
+        :rtype: dict
+    """
+    backtest_config = getattr(config, 'backtest', None)
+    indicators_config = getattr(config, 'indicators', None)
+    return {
+        'trend': config.buy.trend,
+        'margin': config.sell.margin,
+        'cooldown': int(config.sell.cooldown),
+        'lookbehind': int(config.orders.lookbehind),
+        'lookahead': int(config.orders.lookahead),
+        'ttl': int(getattr(config.orders, 'ttl', 0)),
+        'budget': float(config.broker.budget),
+        'reserve': float(config.broker.reserve),
+        'commission': config.broker.commission,
+        'strategies': specs_from_config(config),
+        'period': int(getattr(backtest_config, 'period', 60)),
+        'indicators': {
+            'span': int(getattr(indicators_config, 'span', 20)),
+            'window': int(getattr(indicators_config, 'window', 20)),
+            'period': int(getattr(indicators_config, 'period', 14))
+        }
+    }
+
+class BacktestReport:
+    """
+        The outcome of a backtest run: the final budget and positions, the
+        profit and loss (with the positions valued at their last price), the
+        fills and orders, and the time spent in each stage.
+    """
+    def __init__(self, initial_budget, budget, positions, prices, fills, orders, timings, steps):
+        self.initial_budget = initial_budget
+        self.budget = budget
+        self.positions = positions
+        self.fills = fills
+        self.orders = orders
+        self.timings = timings
+        self.steps = steps
+        held = positions.merge(prices[['symbol', 'price']], on = 'symbol', how = 'left')
+        self.holdings = float((-held['volume'] * held['price'].fillna(0.0)).sum()) if held.shape[0] > 0 else 0.0
+        self.equity = budget + self.holdings
+        self.pnl = self.equity - initial_budget
+
+    def summary(self):
+        """
+            :return: A dict with the main figures of the run.
+            :rtype: dict
+        """
+        summary = {
+            'pnl': self.pnl,
+            'equity': self.equity,
+            'budget': self.budget,
+            'holdings': self.holdings,
+            'orders': self.orders.shape[0],
+            'fills': self.fills.shape[0],
+            'steps': self.steps
+        }
+        for stage, seconds in self.timings.items():
+            summary['time_' + stage] = seconds
+        return summary
+
+class Backtester:
+    """
+        Replays the ticks of a MarketTape through the decision code of the
+        daemons, in one process, with a simulated clock that follows the
+        timer-daemon.py rotation every `period` seconds:
+            - trends: the regression of check-trends (market.statistics)
+                and the buy strategies;
+            - profit: the sell strategies on the positions and last prices;
+            - orders: the matching of fulfil-orders (broker.match_orders).
+        The database tables are replaced by in-memory dataframes.
+    """
+    def __init__(self, tape, settings, strategies = None):
+        """
+            :param tape: The ticks to replay.
+            :type tape: market.MarketTape
+            :param settings: The settings, as returned by settings_from_config.
+            :type settings: dict
+            :param strategies: The strategies to run, the ones of the strategies
+                setting by default, as the daemons create them from the
+                [strategies] section, with their options overridden by the
+                `<name>.<option>` settings (e.g. from a sweep), else the trend
+                and the margin strategies configured from the settings.
+            :type strategies: list
+        """
+        self.tape = tape
+        self.settings = dict(settings)
+        if strategies is None and self.settings.get('strategies'):
+            strategies = []
+            for kind, name, options in self.settings['strategies']:
+                options = dict(options)
+                prefix = name + '.'
+                options.update({key[len(prefix):]: value for key, value in self.settings.items() if key.startswith(prefix)})
+                strategies.append(create(kind, name, **options))
+        if strategies is None:
+            strategies = [
+                create('trend', trend = self.settings['trend']),
+                create('margin', margin = self.settings['margin'], cooldown = self.settings['cooldown'])
+            ]
+        self.buy = StrategyEngine([strategy for strategy in strategies if strategy.side == 'buy'], workers = 1)
+        self.sell = StrategyEngine([strategy for strategy in strategies if strategy.side == 'sell'], workers = 1)
+        self.commission = parse_commission(self.settings['commission'])
+        # the indicators are computed only for the strategies that use them
+        self.indicators = any('indicators' in strategy.requires for strategy in strategies)
+
+        self.budget = float(self.settings['budget'])
+        self.orders = pd.DataFrame(columns = ['id', 'price', 'symbol', 'stamp', 'volume', 'status'])
+        self.used = pd.DataFrame(columns = ['transaction', 'stamp', 'volume'])
+        self.fills = []
+        self.positions = {}
+        self.timings = {state: 0.0 for state in TIMER_STATES}
+
+    def _active_orders(self):
+        return self.orders[self.orders['status'].isin(OrderStatus.ACTIVE)]
+
+    def _header(self, stamp):
+        """
+            The budget and the symbols with active orders, as database-read
+            sends them.
+        """
+        active = self._active_orders()
+        buys = active[active['volume'] < 0]
+        return (
+            {
+                'amount': self.budget,
+                'stamp': stamp,
+                'pending': float((-buys['volume'] * buys['price']).sum())
+            },
+            set(active['symbol'])
+        )
+
+    def _place(self, orders, stamp):
+        if orders.shape[0] < 1:
+            return
+        first_id = self.orders.shape[0] + 1
+        self.orders = pd.concat([self.orders, pd.DataFrame({
+            'id': np.arange(first_id, first_id + orders.shape[0]),
+            'price': orders['price'].values,
+            'symbol': orders['symbol'].values,
+            'stamp': stamp,
+            'volume': orders['volume'].values,
+            'status': OrderStatus.PENDING
+        })], ignore_index = True)
+
+    def _indicators(self, begin_stamp, end_stamp):
+        if not self.indicators:
+            return None
+        return market_indicators.from_transactions(
+            self.tape.transactions(begin_stamp, end_stamp),
+            **self.settings.get('indicators', {})
+        )
+
+    def _trends(self, stamp):
+        budget, active_symbols = self._header(stamp)
+        if budget['amount'] - budget['pending'] <= 0:
+            return
+        lookahead = self.settings['lookahead'] * 1000
+        begin_stamp = stamp - self.settings['lookbehind'] * 1000 - lookahead
+        statistics = self.tape.statistics(begin_stamp, stamp - lookahead)
+        statistics = statistics[statistics['ticks'] >= 3]
+        if statistics.shape[0] < 1:
+            return
+        trends = market_statistics.solve_trends(statistics, begin_stamp)
+        indicators = self._indicators(begin_stamp, stamp - lookahead)
+        orders = self.buy.run(MarketSnapshot(stamp, budget = budget, trends = trends, indicators = indicators, active_symbols = active_symbols))
+        self._place(orders[orders['volume'] < 0], stamp)
+
+    def _portfolio(self):
+        return pd.DataFrame([{
+            'symbol': symbol,
+            'commission': position['commission'],
+            'value': -position['value'],
+            'volume': -position['volume'],
+            'stamp': position['stamp']
+        } for symbol, position in self.positions.items() if position['volume'] != 0], columns = ['symbol', 'commission', 'value', 'volume', 'stamp'])
+
+    def _profit(self, stamp):
+        budget, active_symbols = self._header(stamp)
+        portfolio = self._portfolio()
+        if portfolio.shape[0] < 1:
+            return
+        snapshot = MarketSnapshot(stamp, budget = budget, portfolio = portfolio, prices = self.tape.last_prices(stamp), indicators = self._indicators(stamp - self.settings['lookbehind'] * 1000, stamp), active_symbols = active_symbols)
+        orders = self.sell.run(snapshot)
+        self._place(orders[orders['volume'] > 0], stamp)
+
+    def _expire(self, stamp):
+        ttl = int(self.settings.get('ttl', 0))
+        if ttl <= 0:
+            return
+        stale = self.orders['status'].isin(OrderStatus.ACTIVE) & (self.orders['stamp'] <= stamp - ttl * 1000)
+        self.orders.loc[stale, 'status'] = OrderStatus.EXPIRED
+
+    def _fulfil(self, stamp):
+        # the broker closes the stale orders before matching
+        self._expire(stamp)
+        order_stamp = stamp - self.settings['lookahead'] * 1000
+        active = self._active_orders()
+        orders = active[active['stamp'] <= order_stamp]
+        if orders.shape[0] < 1:
+            return
+        transactions = self.tape.transactions(order_stamp + 1, stamp + 1, orders['symbol'].unique())
+        # the clock only moves forward, so the older used transactions won't be looked at again
+        self.used = self.used[self.used['stamp'] > order_stamp]
+        used = self.used[self.used['stamp'] <= stamp]
+        if used.shape[0] > 0:
+            used = used.groupby('transaction', as_index = False).agg({'volume': 'sum'})
+        portfolio, currently_used, update_orders, delta_budget = match_orders(
+            orders,
+            transactions,
+            used,
+            self.budget,
+            commission = self.commission,
+            reserve = self.settings['reserve'],
+            stamp = stamp
+        )
+        if currently_used.shape[0] < 1:
+            return
+
+        self.budget += delta_budget
+        self.used = pd.concat([self.used, currently_used], ignore_index = True)
+        self.fills.append(portfolio)
+        for _, fill in portfolio.iterrows():
+            position = self.positions.setdefault(fill['symbol'], {'value': 0.0, 'volume': 0.0, 'commission': 0.0, 'stamp': 0})
+            position['value'] += float(fill['price']) * float(fill['volume'])
+            position['volume'] += float(fill['volume'])
+            position['commission'] += float(fill['commission'])
+            position['stamp'] = max(position['stamp'], int(fill['stamp']))
+        for update in update_orders:
+            index = self.orders.index[self.orders['id'] == update['order_id']]
+            self.orders.loc[index, 'status'] = update['status']
+            self.orders.loc[index, 'volume'] = update['volume']
+
+    def run(self, begin_stamp = None, end_stamp = None):
+        """
+            Replays the ticks between begin_stamp and end_stamp, the whole
+            tape by default.
+
+            :param begin_stamp: The first timer stamp, in milliseconds.
+            :type begin_stamp: int
+            :param end_stamp: The last timer stamp, in milliseconds.
+            :type end_stamp: int
+            :rtype: backtest.BacktestReport
+        """
+        first_stamp, last_stamp = self.tape.bounds()
+        if begin_stamp is None:
+            begin_stamp = first_stamp + (self.settings['lookbehind'] + self.settings['lookahead']) * 1000
+        if end_stamp is None:
+            end_stamp = last_stamp
+        initial_budget = self.budget
+
+        steps = 0
+        stamp = begin_stamp
+        while stamp <= end_stamp:
+            state = TIMER_STATES[steps % len(TIMER_STATES)]
+            started = time.perf_counter()
+            if state == 'trends':
+                self._trends(stamp)
+            elif state == 'profit':
+                self._profit(stamp)
+            else:
+                self._fulfil(stamp)
+            self.timings[state] += time.perf_counter() - started
+            steps += 1
+            stamp += self.settings['period'] * 1000
+
+        positions = pd.DataFrame([dict(symbol = symbol, **position) for symbol, position in self.positions.items()], columns = ['symbol', 'value', 'volume', 'commission', 'stamp'])
+        fills = pd.concat(self.fills, ignore_index = True) if len(self.fills) > 0 else pd.DataFrame(columns = ['transaction', 'price', 'commission', 'symbol', 'stamp', 'volume'])
+        return BacktestReport(
+            initial_budget,
+            self.budget,
+            positions,
+            self.tape.last_prices(end_stamp),
+            fills,
+            self.orders,
+            self.timings,
+            steps
+        )
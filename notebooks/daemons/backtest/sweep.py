@@ -0,0 +1,93 @@
+import concurrent.futures
+import itertools
+import numpy as np
+import pandas as pd
+import time
+from market import MarketTape # pylint: disable=import-error
+from .engine import Backtester
+
+# the tape of a sweep worker process, memory-mapped once per process
+_tape = None
+
+def grid(space):
+    """
+        Expands a search space into every combination of its values.
+
+        :param space: A dict with the list of values of each setting, e.g.
+            {'trend': ['0.5%', '1%'], 'lookbehind': [1800, 3600]}.
+        :type space: dict
+        :return: A list of dicts with the settings of each run.
+        :rtype: list
+    """
+    names = list(space.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+
+def random_search(space, count, seed = None):
+    """
+        Draws random settings from a search space. A list gives the values to
+        choose from and a [low, high] dict ({'low': ..., 'high': ...}) gives a
+        uniform range, of integers when both ends are integers.
+
+        :param space: A dict with the values or the range of each setting.
+        :type space: dict
+        :param count: The number of runs.
+        :type count: int
+        :param seed: The random seed.
+        :type seed: int
+        :return: A list of dicts with the settings of each run.
+        :rtype: list
+    """
+    generator = np.random.default_rng(seed)
+    candidates = []
+    for _ in range(count):
+        candidate = {}
+        for name, values in space.items():
+            if isinstance(values, dict):
+                if isinstance(values['low'], int) and isinstance(values['high'], int):
+                    candidate[name] = int(generator.integers(values['low'], values['high'], endpoint = True))
+                else:
+                    candidate[name] = float(generator.uniform(values['low'], values['high']))
+            else:
+                candidate[name] = values[int(generator.integers(len(values)))]
+        candidates.append(candidate)
+    return candidates
+
+def _open_tape(tape_path):
+    global _tape
+    _tape = MarketTape.load(tape_path)
+
+def _run(settings, overrides):
+    started = time.perf_counter()
+    run_settings = dict(settings)
+    run_settings.update(overrides)
+    report = Backtester(_tape, run_settings).run()
+    result = dict(overrides)
+    result.update(report.summary())
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+def sweep(tape_path, settings, candidates, workers = None):
+    """
+        Runs a backtest for each candidate on a process pool. The workers
+        memory-map the tape written with MarketTape.save, so the ticks are
+        shared through the page cache instead of being copied to each one.
+
+        :param tape_path: The directory the tape was saved to.
+        :type tape_path: str
+        :param settings: The base settings, as returned by settings_from_config.
+        :type settings: dict
+        :param candidates: The settings to override in each run, from grid or random_search.
+        :type candidates: list
+        :param workers: The number of processes, the number of CPUs by default.
+        :type workers: int
+        :return: A dataframe with a row per run: the overridden settings, the
+            report summary and the run time, ranked by PnL and then by speed.
+        :rtype: pandas.DataFrame
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers, initializer = _open_tape, initargs = (str(tape_path),)) as executor:
+        results = list(executor.map(_run, itertools.repeat(settings), candidates))
+    results = pd.DataFrame(results)
+    if results.shape[0] > 0:
+        results = results.sort_values(['pnl', 'seconds'], ascending = [False, True]).reset_index(drop = True)
+        results.insert(0, 'rank', np.arange(1, results.shape[0] + 1))
+    return results
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+import datetime
+import numpy as np
+import pandas as pd
+import sys
+import time
+from broker import match_orders # pylint: disable=import-error
+from broker.matching import _SilentLogger # pylint: disable=import-error
+from db import OrderStatus # pylint: disable=import-error
+
+def _iterrows_match_orders(orders, transactions, used, budget_amount, commission, reserve, stamp = None, logger = None):
+    """
+        The matching as fulfil-orders did it before the transaction index: a
+        scan of the used records for every transaction and growing dataframes.
+    """
+    if logger is None:
+        logger = _SilentLogger()
+
+    # create two containers that will hold new data:
+    # one for transactions used to fulfil curent orders
+    currently_used = pd.DataFrame(columns = [
+        'transaction',
+        'stamp',
+        'volume'
+    ])
+    # one for the orders fulfiled, that will be added to portfolio
+    # in an order, like in portfolio, the sign of the volume gives
+    # the type of the transaction: (minus) = buy, (plus) = sell
+    portfolio = pd.DataFrame(columns = [
+        'transaction',
+        'price',
+        'commission',
+        'symbol',
+        'stamp',
+        'volume'
+    ])
+
+    transactions.sort_values(by = 'stamp')
+
+    # the variation of the budget amount
+    delta_budget = 0
+    # a list of orders to update, contains
+    # dictionaries with order_id, volume and status
+    update_orders = []
+
+    commission_value, commission_type = commission
+
+    # go through each of the orders
+    for _, order in orders.iterrows():
+        # retrieve the order symbol
+        symbol = order['symbol']
+        # get the proposed order volume
+        initial_volume = order['volume']
+        # set the remaining volume as a positive number
+        # from it, we'll substract each transaction that
+        # we can make
+        remaining_volume = abs(initial_volume)
+        # get the sign of the transaction
+        if initial_volume < 0.0:
+            volume_sign = -1.0 # this means buy
+        elif initial_volume > 0.0:
+            volume_sign = 1.0 # this means sell
+        else:
+            # if the volume is 0, go to the next order
+            continue
+
+        # retrieve only the transactions that match current symbol
+        filtered = transactions[transactions['symbol'] == symbol]
+        # if we have none, go to the next order
+        if filtered.shape[0] < 1:
+            logger.debug('For symbol {symbol} there are no potential transactions.'.format(
+                symbol = symbol
+            ))
+            continue
+
+        logger.debug('For symbol {symbol} there are {transactions} potential transactions.'.format(
+            symbol = symbol,
+            transactions = filtered.shape[0]
+        ))
+
+        # for each transaction mathing current symbol
+        for _, transaction in filtered.iterrows():
+            # check the used dataframe to see if we still have volume that we didn't use to fulfil orders
+            unavailable_volume = 0
+            if transaction['id'] in used['transaction'].values:
+                unavailable_volume += used[used['transaction'] == transaction['id']]['volume'].sum()
+            if transaction['id'] in currently_used['transaction'].values:
+                unavailable_volume += currently_used[currently_used['transaction'] == transaction['id']]['volume'].sum()
+            # the available volume is the difference
+            available_volume = transaction['volume'] - unavailable_volume
+            # if we don't have any unused volume, go to the next transaction
+            if available_volume <= 0:
+                logger.warning('All the transactions for {symbol} were used. Skipping.'.format(
+                    symbol = symbol
+                ))
+                continue
+            # the volume we can use is the minimum volume between
+            # the one that we want to trade and the one that's available
+            used_volume = min(available_volume, remaining_volume)
+            logger.debug('Using {volume} for symbol {symbol} orders.'.format(
+                symbol = symbol,
+                volume = used_volume
+            ))
+            # compute the remaining volume
+            remaining_volume -= used_volume
+
+            # get this moment in time
+            if stamp is None:
+                fulfil_stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp() * 1000)
+            else:
+                fulfil_stamp = stamp
+
+            # compute the value of the volume traded
+            value = transaction['price'] * used_volume
+            # and the commission
+            commission = 0.0
+            if commission_type == 'fixed':
+                commission = commission_value
+            elif commission_type == 'percent':
+                commission = 0.01 * commission_value * value
+
+            # don't let a transaction consume all the budget
+            if budget_amount + delta_budget + volume_sign * value - commission < reserve:
+                # if this happens, the order won't be fulfiled and go to the next order
+                logger.warning('Processing the order for {symbol} will consume the reserve. Skipping.'.format(
+                    symbol = symbol
+                ))
+                remaining_volume = abs(initial_volume)
+                break
+
+            # compute the variation in the budget
+            delta_budget += volume_sign * value - commission
+
+            # add the used transaction to the records
+            currently_used = currently_used.append({
+                'transaction': transaction['id'],
+                'stamp': transaction['stamp'],
+                'volume': used_volume
+            }, ignore_index = True)
+
+            # add this order to the records
+            portfolio = portfolio.append({
+                'transaction': transaction['id'],
+                'price': transaction['price'],
+                'commission': commission,
+                'symbol': symbol,
+                'stamp': fulfil_stamp,
+                'volume': volume_sign * used_volume
+            }, ignore_index = True)
+
+            # check if there's still some leftovers
+            if remaining_volume <= 0:
+                # if not, go to the next order
+                break
+
+        # mark the order as fulfiled if there's no remaining volume
+        # actually, remaining volume cannot be a negative number!
+        if remaining_volume <= 0:
+            logger.debug('The {requested} orders for {symbol} were completely fulfiled.'.format(
+                symbol = symbol,
+                requested = initial_volume
+            ))
+            update_orders.append({'order_id': order['id'], 'status': OrderStatus.FULFILED, 'volume': 0})
+        # mark the order as pending if part of it was processed
+        elif remaining_volume < abs(initial_volume):
+            logger.debug('The orders for {symbol} were partially fulfiled {fulfiled} from {requested}.'.format(
+                symbol = symbol,
+                fulfiled = abs(initial_volume) - remaining_volume,
+                requested = abs(initial_volume)
+            ))
+            update_orders.append({'order_id': order['id'], 'status': OrderStatus.PARTIAL, 'volume': volume_sign * remaining_volume})
+        else:
+            logger.debug('The {requested} orders for {symbol} were not fulfiled.'.format(
+                symbol = symbol,
+                requested = initial_volume
+            ))
+
+    return (
+        portfolio,
+        currently_used,
+        update_orders,
+        delta_budget
+    )
+
+def _market(orders, symbols, transactions, seed = 0):
+    """
+        Random orders, buys and sells, over random transactions already in
+        stamp order (as the database returns them), with some of their volume
+        used by earlier orders.
+    """
+    rng = np.random.default_rng(seed)
+    names = np.array(['S{index:04d}'.format(index = index) for index in range(symbols)])
+    transactions = pd.DataFrame({
+        'id': np.arange(1, transactions + 1),
+        'price': rng.uniform(1.0, 100.0, transactions),
+        'symbol': rng.choice(names, transactions),
+        'stamp': np.sort(rng.integers(0, 3600 * 1000, transactions)),
+        'volume': rng.integers(1, 100, transactions).astype(float)
+    }, columns = ['id', 'price', 'symbol', 'stamp', 'volume'])
+    picked = transactions.sample(frac = 0.1, random_state = seed)
+    used = pd.DataFrame({
+        'transaction': picked['id'].values,
+        'volume': np.minimum(picked['volume'].values, rng.integers(1, 100, picked.shape[0]))
+    }, columns = ['transaction', 'volume'])
+    orders = pd.DataFrame({
+        'id': np.arange(1, orders + 1),
+        'price': rng.uniform(1.0, 100.0, orders),
+        'symbol': rng.choice(names, orders),
+        'stamp': 0,
+        'volume': rng.integers(-300, 300, orders).astype(float),
+        'status': OrderStatus.PENDING
+    }, columns = ['id', 'price', 'symbol', 'stamp', 'volume', 'status'])
+    return (
+        orders,
+        transactions,
+        used
+    )
+
+def _same(expected, result):
+    portfolio, currently_used, update_orders, delta_budget = result
+    expected_portfolio, expected_used, expected_updates, expected_delta = expected
+    if portfolio.shape[0] != expected_portfolio.shape[0] or currently_used.shape[0] != expected_used.shape[0]:
+        return False
+    for column in ['transaction', 'price', 'commission', 'stamp', 'volume']:
+        if not np.allclose(portfolio[column].values.astype(float), expected_portfolio[column].values.astype(float)):
+            return False
+    if not np.array_equal(portfolio['symbol'].values, expected_portfolio['symbol'].values):
+        return False
+    for column in ['transaction', 'stamp', 'volume']:
+        if not np.allclose(currently_used[column].values.astype(float), expected_used[column].values.astype(float)):
+            return False
+    if len(update_orders) != len(expected_updates):
+        return False
+    for update, expected_update in zip(update_orders, expected_updates):
+        if update['order_id'] != expected_update['order_id'] or update['status'] != expected_update['status'] or not np.isclose(update['volume'], expected_update['volume']):
+            return False
+    return bool(np.isclose(delta_budget, expected_delta))
+
+if __name__ == '__main__':
+    # usage: benchmark-matching.py [<orders> ...], e.g. 10 100 1000
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10, 100, 500]
+    commission = (0.1, 'percent')
+    # check the outputs are the same, also when the budget runs into the reserve
+    for seed, budget in enumerate([1e9, 1e9, 5e4, 1e3]):
+        orders, transactions, used = _market(50, 10, 2000, seed)
+        arguments = (orders, transactions, used, budget, commission, 100.0)
+        if not _same(_iterrows_match_orders(*arguments, stamp = 1), match_orders(*arguments, stamp = 1)):
+            raise RuntimeError('The indexed matching differs from the iterrows one for seed {} and budget {}.'.format(seed, budget))
+    print('The indexed matching gives the same fills, used volumes, order updates and budget.')
+    print('{:>8} {:>13} {:>12} {:>12} {:>10} {:>8}'.format('orders', 'transactions', 'iterrows (s)', 'indexed (s)', 'speedup', 'fills'))
+    for size in sizes:
+        orders, transactions, used = _market(size, max(10, size // 5), 20 * size)
+        arguments = (orders, transactions, used, 1e9, commission, 100.0)
+        begin = time.perf_counter()
+        _iterrows_match_orders(*arguments, stamp = 1)
+        loop_seconds = time.perf_counter() - begin
+        begin = time.perf_counter()
+        portfolio, _, _, _ = match_orders(*arguments, stamp = 1)
+        indexed_seconds = time.perf_counter() - begin
+        print('{:>8} {:>13} {:>12.4f} {:>12.4f} {:>9.1f}x {:>8}'.format(size, transactions.shape[0], loop_seconds, indexed_seconds, loop_seconds / indexed_seconds, portfolio.shape[0]))
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+import numpy as np
+import pandas as pd
+import sys
+import time
+from strategy import create, MarketSnapshot, ORDER_COLUMNS # pylint: disable=import-error
+
+def _iterrows_margin(portfolio, prices, margin_value, margin_type, cooldown):
+    """
+        The profit check as check-profit did it before the margin strategy
+        was vectorized: a price lookup per held symbol and a growing dataframe.
+    """
+    orders = pd.DataFrame(columns = ORDER_COLUMNS)
+    for _, row in portfolio.iterrows():
+        symbol, commission, buy_value, volume, buy_stamp = row
+        symbol_data = prices[prices['symbol'] == symbol]
+        if symbol_data.shape[0] == 0:
+            continue
+        _, sell_price, sell_stamp = symbol_data.iloc[0]
+        if int(buy_stamp) + cooldown * 1000 >= int(sell_stamp):
+            continue
+        cogs = float(buy_value) + float(commission)
+        sales = float(sell_price) * float(volume)
+        margin = (sales - cogs) / sales
+        if (margin_type == 'fixed' and sales - cogs >= margin_value) or \
+        (margin_type == 'percent' and margin >= margin_value):
+            orders = orders.append({
+                'symbol': symbol,
+                'volume': volume,
+                'price': sell_price
+            }, ignore_index = True)
+    return orders
+
+def _market(symbols, seed = 0):
+    """
+        A portfolio of held symbols and their last prices, a few of them
+        without a price and a few still in the cooldown.
+    """
+    rng = np.random.default_rng(seed)
+    names = np.array(['S{index:05d}'.format(index = index) for index in range(symbols)])
+    volumes = rng.integers(1, 1000, symbols)
+    buy_prices = rng.uniform(1.0, 100.0, symbols)
+    stamps = rng.integers(0, 3600 * 1000, symbols)
+    portfolio = pd.DataFrame({
+        'symbol': names,
+        'commission': rng.uniform(0.0, 1.0, symbols),
+        'value': buy_prices * volumes,
+        'volume': volumes,
+        'stamp': stamps
+    }, columns = ['symbol', 'commission', 'value', 'volume', 'stamp'])
+    priced = rng.random(symbols) < 0.95
+    prices = pd.DataFrame({
+        'symbol': names[priced],
+        'price': (buy_prices * rng.uniform(0.9, 1.1, symbols))[priced],
+        'stamp': (stamps + rng.integers(0, 600 * 1000, symbols))[priced]
+    }, columns = ['symbol', 'price', 'stamp'])
+    return (
+        portfolio,
+        prices
+    )
+
+def _best_of(function, repeats):
+    best = None
+    for _ in range(repeats):
+        begin = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - begin
+        best = elapsed if best is None else min(best, elapsed)
+    return (
+        result,
+        best
+    )
+
+if __name__ == '__main__':
+    # usage: benchmark-profit.py [<held symbols> ...], e.g. 100 1000 10000
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 5000]
+    margin, cooldown = '2%', 60
+    strategy = create('margin', margin = margin, cooldown = cooldown)
+    print('{:>8} {:>12} {:>12} {:>10} {:>8}'.format('symbols', 'iterrows (s)', 'merge (s)', 'speedup', 'orders'))
+    for size in sizes:
+        portfolio, prices = _market(size)
+        snapshot = MarketSnapshot(0, portfolio = portfolio, prices = prices)
+        expected, loop_seconds = _best_of(lambda : _iterrows_margin(portfolio, prices, 0.02, 'percent', cooldown), 1)
+        orders, merge_seconds = _best_of(lambda : strategy.decide(snapshot, 0.0), 5)
+        if not np.array_equal(expected['symbol'].values, orders['symbol'].values) or \
+        not np.allclose(expected['price'].values.astype(float), orders['price'].values.astype(float)):
+            raise RuntimeError('The vectorized orders differ from the iterrows ones for {} symbols.'.format(size))
+        print('{:>8} {:>12.6f} {:>12.6f} {:>9.1f}x {:>8}'.format(size, loop_seconds, merge_seconds, loop_seconds / merge_seconds, orders.shape[0]))
@@ -0,0 +1,11 @@
+from .matching import match_orders, parse_commission, TransactionIndex
+from .partition import orders_routing_keys, SymbolRing, ORDERS_ROUTING_KEY
+
+__all__ = [
+    'match_orders',
+    'orders_routing_keys',
+    'parse_commission',
+    'SymbolRing',
+    'TransactionIndex',
+    'ORDERS_ROUTING_KEY'
+]
@@ -0,0 +1,285 @@
+import datetime
+import numpy as np
+import pandas as pd
+from db import OrderStatus # pylint: disable=import-error
+
+class _SilentLogger:
+    def debug(self, *args, **kwargs):
+        pass
+
+    def warning(self, *args, **kwargs):
+        pass
+
+def parse_commission(commission):
+    """
+        Processes the commission found in config file.
+        If the commission is a number followed by %, then the commission
+        is considered percentage of each transaction. Else, if the
+        commission is just a number, then the commission is fixed to
+        that value for every transaction.
+
+        :param commission: The commission option.
+        :type commission: str
+        :return: A tuple with the commission value as a float and the
+            commission type as a string (either 'fixed' or 'percent').
+        :rtype: tuple
+    """
+    commission_type = 'fixed'
+    commission_value = 0.0
+    if isinstance(commission, str):
+        if commission[-1] == '%':
+            try:
+                commission_value = float(commission[:-1])
+                commission_type = 'percent'
+            except:
+                pass
+        else:
+            try:
+                commission_value = float(commission)
+            except:
+                pass
+    elif isinstance(commission, (int, float)):
+        commission_value = float(commission)
+
+    return (
+        commission_value,
+        commission_type
+    )
+
+class TransactionIndex:
+    """
+        The transactions grouped by symbol and sorted by stamp, in NumPy
+        arrays, with the volume already consumed from each of them kept in a
+        dict by transaction id, so matching an order only walks the unused
+        transactions of its own symbol.
+    """
+    def __init__(self, transactions, used):
+        """
+            :param transactions: A dataframe with the id, price, symbol, stamp and volume columns.
+            :type transactions: pandas.DataFrame
+            :param used: A dataframe with the transaction and volume columns,
+                the volume already used from the transactions.
+            :type used: pandas.DataFrame
+        """
+        symbols = transactions['symbol'].values.astype(str)
+        order = np.lexsort((transactions['stamp'].values, symbols))
+        self.ids = transactions['id'].values[order].astype(np.int64)
+        self.prices = transactions['price'].values[order].astype(np.float64)
+        self.stamps = transactions['stamp'].values[order].astype(np.int64)
+        self.volumes = transactions['volume'].values[order].astype(np.float64)
+        symbols = symbols[order]
+        starts = np.flatnonzero(np.concatenate([[True], symbols[1:] != symbols[:-1]])) if symbols.shape[0] > 0 else np.empty(0, dtype = np.int64)
+        ends = np.append(starts[1:], symbols.shape[0])
+        # the range of each symbol, the begin moves past the transactions used up
+        self.ranges = {symbol: [int(begin), int(end)] for symbol, begin, end in zip(symbols[starts], starts, ends)}
+        self.consumed = {}
+        if used.shape[0] > 0:
+            for transaction, volume in zip(used['transaction'].values, used['volume'].values):
+                transaction = int(transaction)
+                self.consumed[transaction] = self.consumed.get(transaction, 0.0) + float(volume)
+
+    def count(self, symbol):
+        begin, end = self.ranges.get(symbol, (0, 0))
+        return end - begin
+
+    def available(self, position):
+        return self.volumes[position] - self.consumed.get(int(self.ids[position]), 0.0)
+
+def match_orders(orders, transactions, used, budget_amount, commission, reserve, stamp = None, logger = None):
+    """
+        For a dataframe with orders and one with transactions, will
+        match each order to one or more transactions, the oldest first, to
+        fulfil said order. The transactions are indexed by symbol, and the
+        volume used from each of them, before and during this call, is kept
+        by transaction id, so a transaction is not used multiple times.
+
+        :param orders: A dataframe containing the proposed orders.
+        :type orders: pandas.DataFrame
+        :param transactions: A dataframe containing the real transactions.
+        :type transactions: pandas.DataFrame
+        :param used: A dataframe containing the list of already used transactions.
+        :type used: pandas.DataFrame
+        :param budget_amount: The available budget.
+        :type budget_amount: float
+        :param commission: A tuple with the commission value and type, as returned by parse_commission.
+        :type commission: tuple
+        :param reserve: The amount the budget cannot go under.
+        :type reserve: float
+        :param stamp: The fulfilment stamp of all the fills, in milliseconds,
+            the current time by default.
+        :type stamp: int
+        :param logger: The logger to report the matching to.
+        :type logger: logger.Logger
+        :return: A tuple with the new portfolio records, the used transactions,
+            the list of order updates (dicts with order_id, status and volume)
+            and the variation of the budget.
+        :rtype: tuple
+    """
+    if logger is None:
+        logger = _SilentLogger()
+    # the fills of one matching share one stamp, which their transaction tells apart
+    if stamp is None:
+        stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp() * 1000)
+
+    index = TransactionIndex(transactions, used)
+    order_symbols = orders['symbol'].values
+    order_volumes = orders['volume'].values.astype(np.float64)
+    order_ids = orders['id'].values
+
+    # a fill uses one transaction of the order symbol, so this many fills at most
+    capacity = sum(index.count(symbol) for symbol in order_symbols)
+    fill_transactions = np.empty(capacity, dtype = np.int64)
+    fill_prices = np.empty(capacity, dtype = np.float64)
+    fill_commissions = np.empty(capacity, dtype = np.float64)
+    fill_symbols = np.empty(capacity, dtype = object)
+    fill_stamps = np.empty(capacity, dtype = np.int64)
+    fill_transaction_stamps = np.empty(capacity, dtype = np.int64)
+    fill_volumes = np.empty(capacity, dtype = np.float64)
+    fill_signs = np.empty(capacity, dtype = np.float64)
+    fills = 0
+
+    # the variation of the budget amount
+    delta_budget = 0
+    # a list of orders to update, contains
+    # dictionaries with order_id, volume and status
+    update_orders = []
+
+    commission_value, commission_type = commission
+
+    # go through each of the orders
+    for symbol, initial_volume, order_id in zip(order_symbols, order_volumes, order_ids):
+        # set the remaining volume as a positive number
+        # from it, we'll substract each transaction that
+        # we can make
+        remaining_volume = abs(initial_volume)
+        # get the sign of the transaction
+        if initial_volume < 0.0:
+            volume_sign = -1.0 # this means buy
+        elif initial_volume > 0.0:
+            volume_sign = 1.0 # this means sell
+        else:
+            # if the volume is 0, go to the next order
+            continue
+
+        # if there are no transactions for the symbol, go to the next order
+        if index.count(symbol) < 1:
+            logger.debug('For symbol {symbol} there are no potential transactions.'.format(
+                symbol = symbol
+            ))
+            continue
+
+        logger.debug('For symbol {symbol} there are {transactions} potential transactions.'.format(
+            symbol = symbol,
+            transactions = index.count(symbol)
+        ))
+
+        symbol_range = index.ranges[symbol]
+        # skip the transactions used up by the previous orders
+        while symbol_range[0] < symbol_range[1] and index.available(symbol_range[0]) <= 0:
+            symbol_range[0] += 1
+        if symbol_range[0] >= symbol_range[1]:
+            logger.warning('All the transactions for {symbol} were used. Skipping.'.format(
+                symbol = symbol
+            ))
+            continue
+
+        for position in range(symbol_range[0], symbol_range[1]):
+            transaction_id = int(index.ids[position])
+            available_volume = index.available(position)
+            # if we don't have any unused volume, go to the next transaction
+            if available_volume <= 0:
+                continue
+            # the volume we can use is the minimum volume between
+            # the one that we want to trade and the one that's available
+            used_volume = min(available_volume, remaining_volume)
+            logger.debug('Using {volume} for symbol {symbol} orders.'.format(
+                symbol = symbol,
+                volume = used_volume
+            ))
+            # compute the remaining volume
+            remaining_volume -= used_volume
+
+            # compute the value of the volume traded
+            value = index.prices[position] * used_volume
+            # and the commission
+            fill_commission = 0.0
+            if commission_type == 'fixed':
+                fill_commission = commission_value
+            elif commission_type == 'percent':
+                fill_commission = 0.01 * commission_value * value
+
+            # don't let a transaction consume all the budget
+            if budget_amount + delta_budget + volume_sign * value - fill_commission < reserve:
+                # if this happens, the order won't be fulfiled and go to the next order
+                logger.warning('Processing the order for {symbol} will consume the reserve. Skipping.'.format(
+                    symbol = symbol
+                ))
+                remaining_volume = abs(initial_volume)
+                break
+
+            # compute the variation in the budget
+            delta_budget += volume_sign * value - fill_commission
+
+            # add the used transaction and the fill to the records
+            index.consumed[transaction_id] = index.consumed.get(transaction_id, 0.0) + used_volume
+            fill_transactions[fills] = transaction_id
+            fill_prices[fills] = index.prices[position]
+            fill_commissions[fills] = fill_commission
+            fill_symbols[fills] = symbol
+            fill_stamps[fills] = stamp
+            fill_transaction_stamps[fills] = index.stamps[position]
+            fill_volumes[fills] = used_volume
+            fill_signs[fills] = volume_sign
+            fills += 1
+
+            # check if there's still some leftovers
+            if remaining_volume <= 0:
+                # if not, go to the next order
+                break
+
+        # mark the order as fulfiled if there's no remaining volume
+        # actually, remaining volume cannot be a negative number!
+        if remaining_volume <= 0:
+            logger.debug('The {requested} orders for {symbol} were completely fulfiled.'.format(
+                symbol = symbol,
+                requested = initial_volume
+            ))
+            update_orders.append({'order_id': order_id, 'status': OrderStatus.FULFILED, 'volume': 0})
+        # mark the order as pending if part of it was processed
+        elif remaining_volume < abs(initial_volume):
+            logger.debug('The orders for {symbol} were partially fulfiled {fulfiled} from {requested}.'.format(
+                symbol = symbol,
+                fulfiled = abs(initial_volume) - remaining_volume,
+                requested = abs(initial_volume)
+            ))
+            update_orders.append({'order_id': order_id, 'status': OrderStatus.PARTIAL, 'volume': volume_sign * remaining_volume})
+        else:
+            logger.debug('The {requested} orders for {symbol} were not fulfiled.'.format(
+                symbol = symbol,
+                requested = initial_volume
+            ))
+
+    # one container for transactions used to fulfil curent orders
+    currently_used = pd.DataFrame({
+        'transaction': fill_transactions[:fills],
+        'stamp': fill_transaction_stamps[:fills],
+        'volume': fill_volumes[:fills]
+    }, columns = ['transaction', 'stamp', 'volume'])
+    # one for the orders fulfiled, that will be added to portfolio
+    # in an order, like in portfolio, the sign of the volume gives
+    # the type of the transaction: (minus) = buy, (plus) = sell
+    portfolio = pd.DataFrame({
+        'transaction': fill_transactions[:fills],
+        'price': fill_prices[:fills],
+        'commission': fill_commissions[:fills],
+        'symbol': fill_symbols[:fills],
+        'stamp': fill_stamps[:fills],
+        'volume': fill_signs[:fills] * fill_volumes[:fills]
+    }, columns = ['transaction', 'price', 'commission', 'symbol', 'stamp', 'volume'])
+
+    return (
+        portfolio,
+        currently_used,
+        update_orders,
+        delta_budget
+    )
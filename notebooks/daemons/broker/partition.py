@@ -0,0 +1,109 @@
+import hashlib
+import numpy as np
+
+# the routing key of the orders.make messages, suffixed with the partition
+# when the symbols are split between several brokers
+ORDERS_ROUTING_KEY = 'orders.make'
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+class SymbolRing:
+    """
+        Splits the symbols between a number of partitions, each of them owned
+        by one broker, with consistent hashing: every partition has a number
+        of points on a ring of 64 bit hashes, and a symbol belongs to the
+        partition of the first point at or after its own hash. The hash doesn't
+        depend on the process (as Python's hash does), so the brokers and the
+        publishers agree on it, and when a partition is added only about 1/n
+        of the symbols move.
+    """
+    def __init__(self, partitions, replicas = 160):
+        """
+            :param partitions: The number of partitions.
+            :type partitions: int
+            :param replicas: The number of points of each partition on the
+                ring, more points spreading the symbols more evenly.
+            :type replicas: int
+        """
+        self.partitions = int(partitions)
+        if self.partitions < 1:
+            raise ValueError('There should be at least one partition, not {partitions}.'.format(partitions = partitions))
+        points = [
+            (_hash('{partition}:{replica}'.format(partition = partition, replica = replica)), partition)
+            for partition in range(self.partitions)
+            for replica in range(int(replicas))
+        ]
+        points.sort()
+        self.points = np.array([point for point, _ in points], dtype = np.uint64)
+        self.owners = np.array([partition for _, partition in points], dtype = np.int64)
+
+    def __len__(self):
+        return self.partitions
+
+    def partition(self, symbol):
+        """
+            :param symbol: The symbol.
+            :type symbol: str
+            :return: The partition the symbol belongs to.
+            :rtype: int
+        """
+        return int(self.partition_of([symbol])[0])
+
+    def partition_of(self, symbols):
+        """
+            :param symbols: The symbols.
+            :type symbols: list
+            :return: The partition of each symbol.
+            :rtype: numpy.ndarray
+        """
+        hashes = np.array([_hash(str(symbol)) for symbol in symbols], dtype = np.uint64)
+        # past the last point, the ring wraps around to the first one
+        positions = np.searchsorted(self.points, hashes) % self.points.shape[0]
+        return self.owners[positions]
+
+    def owned(self, symbols, partition):
+        """
+            :param symbols: The symbols.
+            :type symbols: list
+            :param partition: The partition.
+            :type partition: int
+            :return: The symbols that belong to the partition.
+            :rtype: list
+        """
+        symbols = list(symbols)
+        if len(symbols) < 1:
+            return []
+        owners = self.partition_of(symbols)
+        return [symbol for symbol, owner in zip(symbols, owners) if owner == int(partition)]
+
+    def routing_key(self, partition):
+        """
+            :param partition: The partition.
+            :type partition: int
+            :return: The routing key of the orders.make messages of the partition.
+            :rtype: str
+        """
+        return '{key}.{partition}'.format(key = ORDERS_ROUTING_KEY, partition = int(partition))
+
+    def routing_keys(self):
+        """
+            :return: The routing keys of all the partitions, in order.
+            :rtype: list
+        """
+        return [self.routing_key(partition) for partition in range(self.partitions)]
+
+def orders_routing_keys(partitions):
+    """
+        The routing keys a check orders message is published to: the plain
+        orders.make for a single broker, one per partition otherwise.
+
+        :param partitions: The number of partitions, as the [broker]
+            partitions option.
+        :type partitions: int
+        :rtype: list
+    """
+    partitions = int(partitions)
+    if partitions <= 1:
+        return [ORDERS_ROUTING_KEY]
+    return SymbolRing(partitions).routing_keys()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+import datetime
+import pika # pylint: disable=import-error
+import sys
+from broker import orders_routing_keys # pylint: disable=import-error
+from config import app_config # pylint: disable=import-error
+from logger import Logger # pylint: disable=import-error
+from pathlib import Path
+from rabbitmq import Publisher # pylint: disable=import-error
+
+# initialize the logger so we see what happens
+logger_path = Path(app_config.log.path)
+logger = Logger(path = logger_path / Path(__file__).stem, level = int(app_config.log.level))
+
+if __name__ == '__main__':
+    # the arguments are order ids or symbols, whose active orders are all cancelled
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if len(args) < 1:
+        print('Usage: {command} <order id or symbol> ...'.format(command = sys.argv[0]))
+        sys.exit(2)
+    cancel = {
+        'ids': [int(arg) for arg in args if arg.isdigit()],
+        'symbols': [arg for arg in args if not arg.isdigit()]
+    }
+
+    # the broker cancels the orders under its lock, so they can't be matched meanwhile;
+    # a partitioned broker only cancels the orders of its symbols, so every partition gets it
+    params = pika.ConnectionParameters(host='localhost')
+    publisher = Publisher(params)
+    publisher['queue'] = 'orders'
+
+    current_stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp()) * 1000
+    logger.debug('Sending cancel orders message for the orders {ids} and the symbols {symbols}.'.format(
+        ids = cancel['ids'],
+        symbols = cancel['symbols']
+    ))
+    for routing_key in orders_routing_keys(getattr(getattr(app_config, 'broker', None), 'partitions', 1)):
+        publisher['routing_key'] = routing_key
+        publisher.publish({
+            'stamp': current_stamp,
+            'lookahead': int(app_config.orders.lookahead),
+            'cancel': cancel
+        })
+        logger.debug('Sent cancel orders message to {routing_key}.'.format(routing_key = routing_key))
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import datetime
 import pika # pylint: disable=import-error
+from broker import orders_routing_keys # pylint: disable=import-error
 from config import app_config # pylint: disable=import-error
 from logger import Logger # pylint: disable=import-error
 from pathlib import Path
@@ -14,19 +15,22 @@ logger = Logger(path = logger_path / Path(__file__).stem, level = int(app_config
 params = pika.ConnectionParameters(host='localhost')
 publisher = Publisher(params)
 publisher['queue'] = 'orders'
-publisher['routing_key'] = 'orders.make'
-logger.debug('Initialized the Rabbit MQ connection: queue = {queue} / routing key = {routing_key}.'.format(
+# one message per symbol partition, when the brokers are partitioned
+routing_keys = orders_routing_keys(getattr(getattr(app_config, 'broker', None), 'partitions', 1))
+logger.debug('Initialized the Rabbit MQ connection: queue = {queue} / routing keys = {routing_keys}.'.format(
     queue = publisher['queue'],
-    routing_key = publisher['routing_key']
+    routing_keys = ', '.join(routing_keys)
 ))
 
 current_stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp()) * 1000
 #current_stamp = int(datetime.datetime(2020, 11, 20, 19, 20, 00, tzinfo = datetime.timezone.utc).timestamp() * 1000)
 
 # send the Rabbit MQ message
-logger.debug('Sending check orders message.')
-publisher.publish({
-    'stamp': current_stamp,
-    'lookahead': int(app_config.orders.lookahead)
-})
-logger.debug('Sent check orders message.')
+for routing_key in routing_keys:
+    publisher['routing_key'] = routing_key
+    logger.debug('Sending check orders message to {routing_key}.'.format(routing_key = routing_key))
+    publisher.publish({
+        'stamp': current_stamp,
+        'lookahead': int(app_config.orders.lookahead)
+    })
+    logger.debug('Sent check orders message.')
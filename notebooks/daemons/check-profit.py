@@ -7,12 +7,14 @@ import time
 import sys
 from config import app_config # pylint: disable=import-error
 from daemon import Daemon # pylint: disable=import-error
-from db import DatabaseSchema, OrderStatus # pylint: disable=import-error
+from db import create_db_engine, DatabaseSchema, OrderStatus # pylint: disable=import-error
 from logger import Logger # pylint: disable=import-error
+from market import IndicatorSet # pylint: disable=import-error
 from pathlib import Path
 from rabbitmq import Subscriber # pylint: disable=import-error
 from rabbitmq import Publisher # pylint: disable=import-error
-from sqlalchemy import create_engine, MetaData
+from strategy import from_config, MarketSnapshot, StrategyEngine # pylint: disable=import-error
+from sqlalchemy import MetaData
 
 # initialize the logger so we see what happens
 logger_path = Path(app_config.log.path)
@@ -21,9 +23,22 @@ logger = Logger(path = logger_path / Path(__file__).stem, level = int(app_config
 # connect to the database
 meta = MetaData()
 db_schema = DatabaseSchema(meta)
-engine = create_engine('{db.driver}://{db.username}:{db.password}@{db.host}/{db.database}'.format(db = app_config.db))
+engine = create_db_engine(app_config.db)
 meta.create_all(engine)
-logger.debug('Connected to the database with URL {db.driver}://{db.username}:{db.password}@{db.host}/{db.database}'.format(db = app_config.db))
+logger.debug('Connected to the database with URL {url}'.format(url = repr(engine.url)))
+
+# the incremental indicators, if enabled with an [indicators] section in the config file
+indicators = None
+if hasattr(app_config, 'indicators'):
+    indicators = IndicatorSet(
+        span = int(getattr(app_config.indicators, 'span', 20)),
+        window = int(getattr(app_config.indicators, 'window', 20)),
+        period = int(getattr(app_config.indicators, 'period', 14))
+    )
+
+# the sell strategies, run together over each profit snapshot
+strategies = StrategyEngine(from_config(app_config, side = 'sell'))
+logger.debug('Running the sell strategies: {names}.'.format(names = ', '.join(strategy.name for strategy in strategies.strategies)))
 
 class CheckProfitPublisher(Publisher):
     def log(self, *args, **kwargs):
@@ -35,29 +50,6 @@ class CheckProfitSubscriber(Subscriber):
         #super().log(Path(__file__).stem + ':', *args, **kwargs)
         pass
 
-    def _margin(self):
-        margin_type = 'fixed'
-        margin_value = 0.0        
-        if isinstance(app_config.sell.margin, str):
-            if app_config.sell.margin[-1] == '%':
-                try:
-                    margin_value = 0.01 * float(app_config.sell.margin[:-1])
-                    margin_type = 'percent'
-                except:
-                    pass
-            else:
-                try:
-                    margin_value = float(app_config.sell.margin)
-                except:
-                    pass
-        elif isinstance(app_config.sell.margin, (int, float)):
-            margin_value = float(app_config.sell.margin)
-        
-        return (
-            margin_value,
-            margin_type
-        )
-    
     def _make_sell_order(self, orders):
         current_stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp() * 1000)
         
@@ -86,9 +78,13 @@ class CheckProfitSubscriber(Subscriber):
             logger.warning('The check profit message does not contain the active orders.')
             return
         active_orders = body_object['active_orders']
-        if int(active_orders) > 0:
+        active_symbols = body_object.get('active_symbols')
+        if active_symbols is None and int(active_orders) > 0:
+            # without the orders by symbol, any active order holds back all of them
             logger.debug('There are active orders. Cannot compute accurate profit.')
             return
+        if int(active_orders) > 0:
+            logger.debug('The symbols {symbols} have active orders. Skipping them.'.format(symbols = ', '.join(active_symbols)))
         if 'budget' not in body_object:
             logger.warning('The check profit message does not contain the budget.')
             return
@@ -104,48 +100,25 @@ class CheckProfitSubscriber(Subscriber):
         if portfolio.shape[0] == 0:
             logger.warning('The portfolio is empty. Nothing to sell to make a profit.')
             return
+        if indicators is not None:
+            # the prices are the last tick of each symbol, added only when they're new
+            indicators.update(prices)
         
-        # retrieve the margin threshold
-        margin_value, margin_type = self._margin()
-        # create a template dataframe for orders
-        orders = pd.DataFrame(columns = ['symbol', 'volume', 'price'])
-        # iterate through the portfolio
-        for _, row in portfolio.iterrows():
-            # extract the parameters for each symbol
-            symbol, commission, buy_value, volume, buy_stamp = row
-            # get the prices for the current symbol
-            symbol_data = prices[prices['symbol'] == symbol]
-            if symbol_data.shape[0] == 0:
-                logger.debug('Could not find recent prices for the symbol {symbol}. Skipping.'.format(symbol = symbol))
-                continue
-            _, sell_price, sell_stamp = symbol_data.iloc[0]
-           
-            # check if the cooldown passed
-            if int(buy_stamp) + int(app_config.sell.cooldown) * 1000 >=  int(sell_stamp):
-                logger.debug('The symbol {symbol} was purchased less than {cooldown} seconds ago. Skipping.'.format(symbol = symbol, cooldown = app_config.sell.cooldown))
-                continue
-            
-            cogs = float(buy_value) + float(commission)
-            sales = float(sell_price) * float(volume)
-            margin = (sales - cogs) / sales
-
-            logger.debug('The symbol {symbol} makes a profit of {margin}%.'.format(
-                symbol = symbol,
-                margin = int(margin * 10000) * 0.01
+        # let the strategies decide on the same snapshot
+        snapshot = MarketSnapshot(check_stamp, budget = budget, portfolio = portfolio, prices = prices, indicators = None if indicators is None else indicators.frame(), active_symbols = active_symbols)
+        orders = strategies.run(snapshot)
+        for strategy in strategies.strategies:
+            logger.debug('The strategy {name} decided in {latency:.6f} seconds.'.format(
+                name = strategy.name,
+                latency = strategies.metrics[strategy.name]['last']
             ))
-            
-            if (margin_type == 'fixed' and sales - cogs >= margin_value) or \
-            (margin_type == 'percent' and margin >= margin_value):
-                logger.debug('The symbol {symbol} makes a profit above the set threshold.')
-                orders = orders.append({
-                    'symbol': symbol,
-                    'volume': volume,
-                    'price': sell_price
-                }, ignore_index = True)
 
+        orders = orders[orders['volume'] > 0]
         if orders.shape[0] > 0:
+            for _, row in orders.iterrows():
+                logger.debug('The strategy {strategy} decided to sell symbol {volume} x {symbol} @ {price}.'.format(strategy = row['strategy'], symbol = row['symbol'], volume = row['volume'], price = row['price']))
             logger.debug('Preparing {number} order(s) for processing.'.format(number = orders.shape[0]))
-            self._make_sell_order(orders)
+            self._make_sell_order(orders.drop(columns = ['strategy']).reset_index(drop = True))
 
 # initialize the Rabbit MQ connection
 params = pika.ConnectionParameters(host='localhost')
@@ -160,6 +133,7 @@ logger.debug('Initialized the Rabbit MQ connection: queue = {queue} / routing ke
 class CheckProfitDaemon(Daemon):
     def atexit(self):
         subscriber.stop()
+        strategies.shutdown()
         super().atexit()
 
     def run(self):
@@ -6,90 +6,119 @@ import pandas as pd
 from rabbitmq import Subscriber
 from rabbitmq import Publisher
 from config import app_config
-from db import mk_schema, OrderStatus
-from sqlalchemy import create_engine, MetaData
-
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras import layers
-from tensorflow.keras.layers.experimental import preprocessing
+from db import create_db_engine, DatabaseSchema, OrderStatus
+from logger import Logger
+from models import trend_features, ModelStore, TrendModels
+from pathlib import Path
+from sqlalchemy import MetaData
+from strategy import from_config, MarketSnapshot, StrategyEngine
 import numpy as np
 
+# initialize the logger so we see what happens
+logger_path = Path(app_config.log.path)
+logger = Logger(path = logger_path / Path(__file__).stem, level = int(app_config.log.level))
+
 meta = MetaData()
-mk_schema(meta)
-engine = create_engine('{db.driver}://{db.username}:{db.password}@{db.host}/{db.database}'.format(db = app_config.db))
+db_schema = DatabaseSchema(meta)
+engine = create_db_engine(app_config.db)
 meta.create_all(engine)
 
+# the per-symbol models, kept between messages; TensorFlow is only imported
+# when the first model is built, with the thread pools set in [tensorflow]
+tf_config = getattr(app_config, 'tensorflow', None)
+models = TrendModels(
+    epochs = int(getattr(tf_config, 'epochs', 5)),
+    fine_tune_epochs = int(getattr(tf_config, 'fine_tune_epochs', 1)),
+    refit_interval = float(getattr(tf_config, 'refit_interval', 0)),
+    max_models = int(getattr(tf_config, 'max_models', 1024)),
+    intra_op_threads = int(getattr(tf_config, 'intra_op_threads', 0)),
+    inter_op_threads = int(getattr(tf_config, 'inter_op_threads', 0))
+)
+
+# the models trained by train-models.py, if [tensorflow] models is set; then
+# this daemon only runs the inference and switches to each new version
+store = None
+if tf_config is not None and hasattr(tf_config, 'models'):
+    store = ModelStore(tf_config.models)
+
+# the buy strategies, run over the trends of the models
+strategies = StrategyEngine(from_config(app_config, side = 'buy'))
+
 class CheckTrendsSubscriber(Subscriber):
     def __setitem__(self, key, value):
         if key == 'publisher':
             self.publisher = value
         else:
             super().__setitem__(key, value)
-    
+
     def __getitem__(self, key):
         if key == 'publisher':
             return self.publisher
         else:
             return super().__getitem__(key)
-    
-    def _make_buy_order(self, orders):
-        current_stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp())
+
+    def _make_buy_orders(self, orders):
+        current_stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp()) * 1000
+        orders['stamp'] = orders.shape[0] * [ current_stamp ]
+        orders['status'] = orders.shape[0] * [ OrderStatus.PENDING ]
         message = {
-            'stamp': current_stamp,
-            'type': 'buy',
-            'orders': orders.to_dict()
+            'table_name': DatabaseSchema.ORDERS,
+            'table_desc': orders.to_dict()
         }
-        self.publisher['routing_key'] = 'orders.make'
+        self.publisher['routing_key'] = 'database.save'
         self.publisher.publish(message)
-    
-    def _compute_trend(self, transactions):
-        # extract the features
-        features = transactions[['stamp', 'volume']].values
-        # make the stamps more manageble
-        features[:,0] -= min(features[:,0])
-        features[:,0] /= 3600 * 1000
-        # extract the outputs
-        prices = transactions['price'].values
-        # use a tensorflow normalizer for the inputs
-        normalizer = preprocessing.Normalization(input_shape = [2,])
-        normalizer.adapt(features)
-        # as models work best with small number, outputs will also be normalized
-        mu_price = np.mean(prices)
-        sigma_price = np.mean(prices)
-        # build a linear regression model
-        model = tf.keras.Sequential([
-            normalizer,
-            layers.Dense(1, activation = 'linear'),
-            layers.Lambda(lambda output : output * sigma_price + mu_price)
-        ])
-        # choose an optimizer and a loss
-        model.compile(
-            optimizer='adam',
-            loss='mean_absolute_error'
-        )
-        # fit the model
-        model.fit(
-            features,
-            prices,
-            validation_split = 0.2,
-            epochs = 5,
-            verbose = 0
-        )
-        # evaluate the trend
-        predicted = model.predict([
-            [features[0,0], 0.0],
-            [features[-1,0], 0.0]
-        ]).squeeze()
-        # compute the slope of the trend
-        trend = (predicted[1] - predicted[0]) / (features[-1,0] - features[0,0])
-        
-        return trend
-        
-    def _distribute_budget(self, orders, budget):
-        amount = budget['amount']
-        
-    
+
+    def _compute_trends(self, transactions):
+        """
+            Predicts the edge prices of all the symbols in one batch, with the
+            models from the trainer or, without one, with the cached models,
+            fitted (or fine-tuned) here first.
+
+            :param transactions: A dataframe with the price, symbol, stamp and volume columns.
+            :type transactions: pandas.DataFrame
+            :return: A dataframe with the symbol, price (volume weighted average),
+                absolute_trend and relative_trend columns.
+            :rtype: pandas.DataFrame
+        """
+        weights = store.refresh() if store is not None else None
+        if store is not None and weights is None:
+            logger.warning('There are no trained models yet. Cannot compute trends.')
+        symbols = []
+        prices = []
+        edges = []
+        for symbol, symbol_transactions in transactions.groupby('symbol', sort = False):
+            if symbol_transactions.shape[0] < 3:
+                logger.debug('For symbol {symbol} there are fewer than 3 transactions. Cannot compute trends. Skipping.'.format(symbol = symbol))
+                continue
+            if store is not None and (weights is None or symbol not in weights):
+                logger.debug('There is no trained model for symbol {symbol}. Skipping.'.format(symbol = symbol))
+                continue
+            symbol_transactions = symbol_transactions.sort_values('stamp')
+            # extract the features
+            features = trend_features(symbol_transactions['stamp'].values.astype(np.int64), symbol_transactions['volume'].values.astype(np.float64))
+            if store is None:
+                # fit the model, or reuse the cached one if it's recent enough
+                models.fit(symbol, features, symbol_transactions['price'].values.astype(np.float64))
+            symbols.append(symbol)
+            # getting the average transaction price (weighted average)
+            prices.append(np.dot(symbol_transactions['price'].values, symbol_transactions['volume'].values) / np.sum(symbol_transactions['volume'].values))
+            # the trend is evaluated at the edges of the window
+            edges.append([[features[0,0], 0.0], [features[-1,0], 0.0]])
+
+        edges = np.array(edges, dtype = np.float64).reshape(-1, 2, 2)
+        if store is not None:
+            predicted = weights.predict(symbols, edges) if len(symbols) > 0 else np.zeros((0, 2))
+        else:
+            predicted = models.predict(symbols, edges)
+            models.evict()
+        absolute_trend = predicted[:, 1] - predicted[:, 0]
+        return pd.DataFrame({
+            'symbol': symbols,
+            'price': prices,
+            'absolute_trend': absolute_trend,
+            'relative_trend': absolute_trend / predicted[:, 1]
+        }, columns = ['symbol', 'price', 'absolute_trend', 'relative_trend'])
+
     def on_message_callback(self, basic_delivery, properties, body):
         body_object = json.loads(body)
         if 'stamp' not in body_object:
@@ -98,40 +127,33 @@ class CheckTrendsSubscriber(Subscriber):
         if 'active_orders' not in body_object:
             return
         active_orders = body_object['active_orders']
-        if active_orders > 0:
+        active_symbols = body_object.get('active_symbols')
+        if active_symbols is None and active_orders > 0:
             return
         if 'budget' not in body_object:
             return
         budget = body_object['budget']
-        if budget['amount'] <= 0:
+        if budget['amount'] - budget.get('pending', 0.0) <= 0:
             return
         if 'transactions' not in body_object:
             return
         transactions = pd.DataFrame.from_dict(body_object['transactions'])
         if transactions.shape[0] == 0:
             return
-        
-        orders = pd.DataFrame(columns = ['symbol', 'volume', 'trend'])
-        for symbol in transactions['symbol'].unique():
-            symbol_transactions = transactions[transactions['symbol'] == symbol]
-            trend = self._compute_trend(symbol_transactions)
-            orders = orders.append({
-                'symbol': symbol,
-                'volume': 0,
-                'trend': trend
-            }, ignore_index = True)
-        
-        self._distribute_budget(orders, budget)
-        orders = orders[orders['volume'] > 0]
+
+        trends = self._compute_trends(transactions)
+
+        orders = strategies.run(MarketSnapshot(check_stamp, budget = budget, trends = trends, active_symbols = active_symbols))
+        orders = orders[orders['volume'] < 0]
         if orders.shape[0] > 0:
-            self._make_buy_orders(orders)
-            
+            self._make_buy_orders(orders.drop(columns = ['strategy']).reset_index(drop = True))
+
 params = pika.ConnectionParameters(host='localhost')
 subscriber = CheckTrendsSubscriber(params)
 subscriber['queue'] = 'requested'
 subscriber['routing_key'] = 'requested.trends'
 publisher = Publisher(params)
-publisher['queue'] = 'orders'
+publisher['queue'] = 'database_save'
 subscriber['publisher'] = publisher
 
 if __name__ == '__main__':
@@ -30,7 +30,8 @@ publisher.publish({
     'stamp': current_stamp,
     'params': {
         'lookahead': int(app_config.orders.lookahead),
-        'lookbehind': int(app_config.orders.lookbehind)
+        'lookbehind': int(app_config.orders.lookbehind),
+        'mode': getattr(app_config.orders, 'mode', 'transactions')
     }
 })
 logger.debug('Sent check trends message.')
@@ -4,16 +4,19 @@ import json
 import numpy as np
 import pandas as pd
 import pika # pylint: disable=import-error
+import threading
 import time
 import sys
 from config import app_config # pylint: disable=import-error
 from daemon import Daemon # pylint: disable=import-error
-from db import DatabaseSchema, OrderStatus # pylint: disable=import-error
+from db import create_db_engine, DatabaseSchema, OrderStatus # pylint: disable=import-error
 from logger import Logger # pylint: disable=import-error
+from market import statistics as market_statistics, IndicatorSet # pylint: disable=import-error
 from pathlib import Path
 from rabbitmq import Subscriber # pylint: disable=import-error
 from rabbitmq import Publisher # pylint: disable=import-error
-from sqlalchemy import create_engine, MetaData
+from strategy import from_config, MarketSnapshot, StrategyEngine # pylint: disable=import-error
+from sqlalchemy import MetaData
 
 # initialize the logger so we see what happens
 logger_path = Path(app_config.log.path)
@@ -22,9 +25,27 @@ logger = Logger(path = logger_path / Path(__file__).stem, level = int(app_config
 # connect to the database
 meta = MetaData()
 db_schema = DatabaseSchema(meta)
-engine = create_engine('{db.driver}://{db.username}:{db.password}@{db.host}/{db.database}'.format(db = app_config.db))
+engine = create_db_engine(app_config.db)
 meta.create_all(engine)
-logger.debug('Connected to the database with URL {db.driver}://{db.username}:{db.password}@{db.host}/{db.database}'.format(db = app_config.db))
+logger.debug('Connected to the database with URL {url}'.format(url = repr(engine.url)))
+
+# the streamed trends responses being collected, by stream id
+STREAM_TIMEOUT = 300
+streams = {}
+streams_lock = threading.Lock()
+
+# the incremental indicators, if enabled with an [indicators] section in the config file
+indicators = None
+if hasattr(app_config, 'indicators'):
+    indicators = IndicatorSet(
+        span = int(getattr(app_config.indicators, 'span', 20)),
+        window = int(getattr(app_config.indicators, 'window', 20)),
+        period = int(getattr(app_config.indicators, 'period', 14))
+    )
+
+# the buy strategies, run together over each trends snapshot
+strategies = StrategyEngine(from_config(app_config, side = 'buy'))
+logger.debug('Running the buy strategies: {names}.'.format(names = ', '.join(strategy.name for strategy in strategies.strategies)))
 
 class CheckTrendsPublisher(Publisher):
     def log(self, *args, **kwargs):
@@ -36,34 +57,10 @@ class CheckTrendsSubscriber(Subscriber):
         #super().log(Path(__file__).stem + ':', *args, **kwargs)
         pass
 
-    def _trend(self):
-        trend_type = 'fixed'
-        trend_value = 0.0        
-        if isinstance(app_config.buy.trend, str):
-            if app_config.buy.trend[-1] == '%':
-                try:
-                    trend_value = 0.01 * float(app_config.buy.trend[:-1])
-                    trend_type = 'percent'
-                except:
-                    pass
-            else:
-                try:
-                    trend_value = float(app_config.buy.trend)
-                except:
-                    pass
-        elif isinstance(app_config.buy.trend, (int, float)):
-            trend_value = float(app_config.buy.trend)
-        
-        return (
-            trend_value,
-            trend_type
-        )
-    
     def _make_buy_orders(self, orders):
         current_stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp()) * 1000
         orders['stamp'] = orders.shape[0] * [ current_stamp ]
         orders['status'] = orders.shape[0] * [ OrderStatus.PENDING ] 
-        orders.drop(columns = ['trend'], inplace = True)
         message = {
             'table_name': DatabaseSchema.ORDERS,
             'table_desc': orders.to_dict()
@@ -74,53 +71,102 @@ class CheckTrendsSubscriber(Subscriber):
         publisher.publish(message)
         publisher.disconnect()
     
-    def _compute_trend(self, transactions):
-        # extract the features
-        features = transactions[['stamp', 'volume']].values
-        # make the stamps more manageble
-        features[:,0] -= min(features[:,0])
-        features[:,0] /= 3600 * 1000
-        # extract the outputs
-        prices = transactions['price'].values
-        X = np.concatenate([np.ones((features.shape[0],1)), features], axis = 1)
-        y = prices
-        # compute the linear regression parameters from the normal form
-        theta = np.dot(
-            np.linalg.pinv(np.dot(X.transpose(), X)),
-            np.dot(X.transpose(), y)
-        )
-        # compute the edge prices based on model
-        predicted = np.dot(
-            np.array([[ 1, features[ 0,0], 1],
-                      [ 1, features[-1,0], 1]]),
-            theta)
-        # compute the trend as the margin on item = (sales - cogs) / sales
-        absolute_trend = predicted[1] - predicted[0]
-        relative_trend = (predicted[1] - predicted[0]) / predicted[1]
-
-        return (
-            absolute_trend,
-            relative_trend
-        )
+    def _compute_trends(self, transactions):
+        """
+            Computes the trend of every symbol found in the transactions. The
+            transactions are sorted once by symbol and the regressions of all
+            the symbols are solved in one batched call, with the hours of each
+            symbol measured from its first stamp.
+
+            :param transactions: A dataframe with the price, symbol, stamp and volume columns.
+            :type transactions: pandas.DataFrame
+            :return: A dataframe with the symbol, price (volume weighted average),
+                absolute_trend and relative_trend columns.
+            :rtype: pandas.DataFrame
+        """
+        statistics = market_statistics.from_transactions(transactions)
+        return self._compute_trends_from_statistics(statistics, statistics['first_stamp'].values)
+
+    def _compute_trends_from_statistics(self, statistics, origin):
+        """
+            Computes the trend of every symbol from the regression sums computed
+            by database-read in statistics mode.
+
+            :param statistics: A dataframe with the market.statistics.COLUMNS columns.
+            :type statistics: pandas.DataFrame
+            :param origin: The stamp the hours in the statistics are measured from,
+                or an array with one origin per row.
+            :type origin: int
+            :return: A dataframe with the symbol, price, absolute_trend and relative_trend columns.
+            :rtype: pandas.DataFrame
+        """
+        # with decayed weights, count is the sum of the weights, so the ticks are counted
+        # apart; the statistics of an older database-read only have the count
+        ticks = statistics['ticks'] if 'ticks' in statistics.columns else statistics['count']
+        few = (ticks < 3).values
+        for symbol in statistics[few]['symbol'].values:
+            logger.debug('For symbol {symbol} there are fewer than 3 transactions. Cannot compute trends. Skipping.'.format(symbol = symbol))
+        if np.ndim(origin) > 0:
+            origin = np.asarray(origin)[~few]
+        return market_statistics.solve_trends(statistics[~few], origin)
         
-    def _distribute_budget(self, orders, budget):
-        amount = budget['amount']
-        if orders is None or orders.shape[0] < 1:
-            logger.debug('There are no potential orders to distribute budget.')
-            return orders
-        max_trend = orders['trend'].max()
-        orders = orders[orders['trend'] == max_trend].iloc[0:1]
-        volume = int(amount / orders['price'].iloc[0])
-
-        logger.debug('Decided to buy symbol {volume} x {symbol} @ {price}.'.format(symbol = orders['symbol'].iloc[0], volume = volume, price = orders['price'].iloc[0]))
-
-        orders['volume'].iloc[0] = -volume
-        return orders
-    
+    def _collect_stream(self, body_object):
+        """
+            Adds a chunk of a streamed trends response to the regression sums of
+            its stream. The chunks may arrive in any order; once all of them
+            were received, the stream is turned into a statistics message.
+
+            :param body_object: The decoded chunk message.
+            :type body_object: dict
+            :return: The statistics message when the stream is complete, None otherwise.
+            :rtype: dict
+        """
+        stream = body_object['stream']
+        chunk = pd.DataFrame.from_dict(body_object['transactions'])
+        origin = int(body_object['origin'])
+        with streams_lock:
+            # forget the streams that lost chunks on the way
+            now = time.monotonic()
+            for stream_id in [stream_id for stream_id, item in streams.items() if now - item['started'] > STREAM_TIMEOUT]:
+                logger.warning('The trends stream {stream} is incomplete. Dropping it.'.format(stream = stream_id))
+                del streams[stream_id]
+            item = streams.setdefault(stream['id'], {
+                'started': now,
+                'received': 0,
+                'expected': None,
+                'statistics': None
+            })
+            if chunk.shape[0] > 0:
+                chunk_statistics = market_statistics.from_transactions(chunk, origin)
+                if item['statistics'] is None:
+                    item['statistics'] = chunk_statistics
+                else:
+                    item['statistics'] = market_statistics.merge(item['statistics'], chunk_statistics)
+            item['received'] += 1
+            if stream['last']:
+                item['expected'] = int(stream['sequence']) + 1
+            if item['expected'] is None or item['received'] < item['expected']:
+                return None
+            del streams[stream['id']]
+
+        logger.debug('Received all the {chunks} chunk(s) of the trends stream {stream}.'.format(chunks = item['received'], stream = stream['id']))
+        return {
+            'stamp': body_object['stamp'],
+            'active_orders': body_object['active_orders'],
+            'active_symbols': body_object.get('active_symbols'),
+            'budget': body_object['budget'],
+            'origin': origin,
+            'statistics': item['statistics'].to_dict() if item['statistics'] is not None else {}
+        }
+
     def on_message_callback(self, basic_delivery, properties, body):
         # received the check profit message. preprocessing it
         logger.debug('Received check trends message.')
         body_object = json.loads(body)
+        if 'stream' in body_object:
+            body_object = self._collect_stream(body_object)
+            if body_object is None:
+                return
         if 'stamp' not in body_object:
             logger.warning('The check trends message does not contain a stamp.')
             return
@@ -129,76 +175,65 @@ class CheckTrendsSubscriber(Subscriber):
             logger.warning('The check trends message does not contain the active orders.')
             return
         active_orders = body_object['active_orders']
-        if active_orders > 0:
+        active_symbols = body_object.get('active_symbols')
+        if active_symbols is None and active_orders > 0:
+            # without the orders by symbol, any active order holds back all of them
             logger.debug('There are active orders. Cannot compute accurate trends.')
             return
+        if active_orders > 0:
+            logger.debug('The symbols {symbols} have active orders. Skipping them.'.format(symbols = ', '.join(active_symbols)))
         if 'budget' not in body_object:
             logger.warning('The check trends message does not contain the budget.')
             return
         budget = body_object['budget']
-        if budget['amount'] <= 0:
-            logger.warning('The budget is negative: {budget}.'.format(budget = budget['amount']))
-            return
-        if 'transactions' not in body_object:
-            logger.warning('The check trends message does not contain transactions.')
-            return
-        transactions = pd.DataFrame.from_dict(body_object['transactions'])
-        if transactions.shape[0] == 0:
-            logger.warning('There are no active transactions that can be used for computing the trends.')
+        if budget['amount'] - budget.get('pending', 0.0) <= 0:
+            logger.warning('The budget is negative: {budget}.'.format(budget = budget['amount'] - budget.get('pending', 0.0)))
             return
+        if 'statistics' in body_object:
+            # the database already reduced the transactions to the regression sums
+            statistics = pd.DataFrame.from_dict(body_object['statistics'])
+            if statistics.shape[0] == 0:
+                logger.warning('There are no active transactions that can be used for computing the trends.')
+                return
+            trends = self._compute_trends_from_statistics(statistics, int(body_object['origin']))
+        else:
+            if 'transactions' not in body_object:
+                logger.warning('The check trends message does not contain transactions.')
+                return
+            transactions = pd.DataFrame.from_dict(body_object['transactions'])
+            if transactions.shape[0] == 0:
+                logger.warning('There are no active transactions that can be used for computing the trends.')
+                return
+            trends = self._compute_trends(transactions)
+            if indicators is not None:
+                # only the transactions not seen in the previous windows are added
+                indicators.update(transactions)
+                indicators.forget(int(transactions['stamp'].min()))
         
-        # retrieve the trends threshold
-        trend_value, trend_type = self._trend()
-        # create a template dataframe for orders
-        orders = pd.DataFrame(columns = ['symbol', 'volume', 'price', 'trend'])
-        # iterate through the transactions' symbols
-        for symbol in transactions['symbol'].unique():
-            # extract the transactions only for the current symbol
-            symbol_transactions = transactions[transactions['symbol'] == symbol]
-            if symbol_transactions.shape[0] < 3:
-                logger.debug('For symbol {symbol} there are fewer than 3 transactions. Cannot compute trends. Skipping.'.format(symbol = symbol))
-                continue
-            # getting the average transaction price (weighted average)
-            price = np.dot(
-                symbol_transactions['price'].values,
-                symbol_transactions['volume'].values
-            ) / np.sum(symbol_transactions['volume'].values)
-            
-            # compute the trends for the symbol
-            absolute_trend, relative_trend = self._compute_trend(symbol_transactions)
+        # log the symbols' trends
+        for _, row in trends.iterrows():
             logger.debug('The symbol {symbol} has {absolute_trend} / {relative_trend}%.'.format(
-                symbol = symbol,
-                absolute_trend = absolute_trend,
-                relative_trend = relative_trend
+                symbol = row['symbol'],
+                absolute_trend = row['absolute_trend'],
+                relative_trend = row['relative_trend']
                 ))
-            
-            # compare the compute trend with the threshold
-            if trend_type == 'fixed' and absolute_trend > trend_value:
-                logger.debug('The symbol {symbol} is on a positive absolute trend.'.format(symbol = symbol))
-                orders = orders.append({
-                    'symbol': symbol,
-                    'volume': 0,
-                    'price': price,
-                    'trend': absolute_trend
-                }, ignore_index = True)
-            if trend_type == 'percent' and relative_trend > trend_value:
-                logger.debug('The symbol {symbol} is on a positive relative trend.'.format(symbol = symbol))
-                orders = orders.append({
-                    'symbol': symbol,
-                    'volume': 0,
-                    'price': price,
-                    'trend': relative_trend
-                }, ignore_index = True)
-        
-        # distribute the budget among the orders
-        logger.debug('Distributing the budget among the orders.')
-        orders = self._distribute_budget(orders, budget)
+
+        # let the strategies decide on the same snapshot, each with its share of the budget
+        snapshot = MarketSnapshot(check_stamp, budget = budget, trends = trends, indicators = None if indicators is None else indicators.frame(), active_symbols = active_symbols)
+        orders = strategies.run(snapshot)
+        for strategy in strategies.strategies:
+            logger.debug('The strategy {name} decided in {latency:.6f} seconds.'.format(
+                name = strategy.name,
+                latency = strategies.metrics[strategy.name]['last']
+            ))
         
         # check if there are still orders
         orders = orders[orders['volume'] < 0]
         if orders.shape[0] > 0:
+            for _, row in orders.iterrows():
+                logger.debug('The strategy {strategy} decided to buy symbol {volume} x {symbol} @ {price}.'.format(strategy = row['strategy'], symbol = row['symbol'], volume = -row['volume'], price = row['price']))
             logger.debug('There are potential orders. Passing them for fulfilment.')
-            self._make_buy_orders(orders)
+            self._make_buy_orders(orders.drop(columns = ['strategy']).reset_index(drop = True))
 
 # initialize the Rabbit MQ connection
 params = pika.ConnectionParameters(host='localhost')
@@ -213,6 +248,7 @@ logger.debug('Initialized the Rabbit MQ connection: queue = {queue} / routing ke
 class CheckTrendsDaemon(Daemon):
     def atexit(self):
         subscriber.stop()
+        strategies.shutdown()
         super().atexit()
 
     def run(self):
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+import datetime
+import json
+import pandas as pd
+import pika # pylint: disable=import-error
+import threading
+import time
+import sys
+from config import app_config # pylint: disable=import-error
+from daemon import Daemon # pylint: disable=import-error
+from db import DatabaseSchema, OrderStatus # pylint: disable=import-error
+from logger import Logger # pylint: disable=import-error
+from pathlib import Path
+from rabbitmq import Subscriber # pylint: disable=import-error
+from rabbitmq import Publisher # pylint: disable=import-error
+from rabbitmq import RpcClient, RpcTimeout # pylint: disable=import-error
+from strategy import TriggerIndex # pylint: disable=import-error
+
+# initialize the logger so we see what happens
+logger_path = Path(app_config.log.path)
+logger = Logger(path = logger_path / Path(__file__).stem, level = int(app_config.log.level))
+
+# the take-profit and stop-loss prices of the held symbols, from the [sell]
+# options check-profit uses, and how often the positions are read again
+triggers_config = getattr(app_config, 'triggers', None)
+triggers = TriggerIndex(
+    margin = app_config.sell.margin,
+    stop_loss = getattr(app_config.sell, 'stop_loss', None),
+    cooldown = int(app_config.sell.cooldown),
+    rearm = int(getattr(triggers_config, 'rearm', 60))
+)
+refresh_interval = float(getattr(triggers_config, 'refresh', 5))
+
+class CheckTriggersPublisher(Publisher):
+    def log(self, *args, **kwargs):
+        #super().log(Path(__file__).stem + ':', *args, **kwargs)
+        pass
+
+class CheckTriggersRpcClient(RpcClient):
+    def log(self, *args, **kwargs):
+        #super().log(Path(__file__).stem + ':', *args, **kwargs)
+        pass
+
+class CheckTriggersSubscriber(Subscriber):
+    def log(self, *args, **kwargs):
+        #super().log(Path(__file__).stem + ':', *args, **kwargs)
+        pass
+
+    def _refresh_positions(self):
+        """
+            Reads the positions from database-read, with a profit request, and
+            sets the trigger prices for them. It runs on the refresher thread,
+            so a slow database-read never holds the ticks back; meanwhile the
+            ticks are checked against the previous positions.
+        """
+        try:
+            response = rpc.call({
+                'type': 'profit',
+                'params': {}
+            }, timeout = refresh_interval)
+        except RpcTimeout:
+            logger.warning('The positions could not be read in {timeout} seconds.'.format(timeout = refresh_interval))
+            return
+        if 'portfolio' not in response:
+            logger.warning('The profit response does not contain the portfolio.')
+            return
+        portfolio = pd.DataFrame.from_dict(response['portfolio'], orient = 'columns')
+        # the symbols with orders in flight are not triggered
+        active_symbols = response.get('active_symbols') or {}
+        if 'symbol' in portfolio.columns:
+            portfolio = portfolio[~portfolio['symbol'].isin(list(active_symbols))]
+        triggers.set_positions(portfolio)
+        logger.debug('Watching {positions} position(s).'.format(positions = len(triggers)))
+
+    def _make_sell_order(self, orders):
+        current_stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp() * 1000)
+
+        orders['stamp'] = orders.shape[0] * [ current_stamp ]
+        orders['status'] = orders.shape[0] * [ OrderStatus.PENDING ]
+        message = {
+            'table_name': DatabaseSchema.ORDERS,
+            'table_desc': orders.to_dict()
+        }
+
+        publisher = CheckTriggersPublisher(self.parameters)
+        publisher['queue'] = 'database_save'
+        publisher['routing_key'] = 'database.save'
+        publisher.publish(message)
+        publisher.disconnect()
+
+    def refresh(self, stopping):
+        """
+            Refreshes the positions every refresh_interval seconds, until stopping is set.
+
+            :param stopping: The event set when the daemon stops.
+            :type stopping: threading.Event
+        """
+        while not stopping.is_set():
+            begin = time.monotonic()
+            try:
+                self._refresh_positions()
+            except Exception as error:
+                logger.warning('The positions could not be refreshed: {error}.'.format(error = error))
+                rpc.disconnect()
+            # a timed out call already took the whole interval
+            stopping.wait(max(0.0, refresh_interval - (time.monotonic() - begin)))
+        rpc.disconnect()
+
+    def on_message_callback(self, basic_delivery, properties, body):
+        # the ticks are a copy of the transactions read-websocket saves
+        body_object = json.loads(body)
+        if body_object.get('table_name') != DatabaseSchema.TRANSACTIONS:
+            return
+        if 'table_desc' not in body_object:
+            return
+        ticks = pd.DataFrame.from_dict(body_object['table_desc'])
+        orders = triggers.check(ticks)
+        if orders.shape[0] > 0:
+            for _, row in orders.iterrows():
+                logger.debug('The {reason} trigger of symbol {symbol} fired: selling {volume} @ {price}.'.format(
+                    reason = row['reason'],
+                    symbol = row['symbol'],
+                    volume = row['volume'],
+                    price = row['price']
+                ))
+            self._make_sell_order(orders.drop(columns = ['reason']).reset_index(drop = True))
+
+# initialize the Rabbit MQ connection, with a queue of its own on the
+# database.save routing key, so it gets every batch of ticks right away
+params = pika.ConnectionParameters(host='localhost')
+subscriber = CheckTriggersSubscriber(params)
+subscriber['queue'] = 'triggers_ticks'
+subscriber['routing_key'] = 'database.save'
+logger.debug('Initialized the Rabbit MQ connection: queue = {queue} / routing key = {routing_key}.'.format(
+    queue = subscriber['queue'],
+    routing_key = subscriber['routing_key']
+))
+# the positions are read on a thread of their own, with their own Rabbit MQ connection
+rpc = CheckTriggersRpcClient(params)
+rpc['routing_key'] = 'database.read'
+stopping = threading.Event()
+refresher = threading.Thread(target = subscriber.refresh, args = (stopping, ), daemon = True)
+
+class CheckTriggersDaemon(Daemon):
+    def atexit(self):
+        subscriber.stop()
+        stopping.set()
+        refresher.join(timeout = refresh_interval)
+        super().atexit()
+
+    def run(self):
+        logger.debug('Refreshing the positions every {seconds} seconds.'.format(seconds = refresh_interval))
+        refresher.start()
+        logger.debug('Subscribing to Rabbit MQ with a daemon.')
+        while True:
+            subscriber.run()
+            if subscriber.should_reconnect:
+                logger.debug('Trying to reconnect. First, clean up.')
+                subscriber.stop()
+                reconnect_delay = subscriber.get_reconnect_delay()
+                logger.debug('Awaiting for {seconds} seconds before restarting.'.format(seconds = self._reconnect_delay))
+                time.sleep(reconnect_delay)
+
+# as this is a script that's intended to be run stand alone, not to be imported
+# check whether the script is called directly
+if __name__ == '__main__':
+    chroot = Path(__file__).absolute().parent
+    pidname = Path(__file__).stem + '.pid'
+    daemon = CheckTriggersDaemon(
+            pidfile = str((chroot / 'run') / pidname),
+            chroot = chroot
+    )
+    if len(sys.argv) >= 2:
+        if sys.argv[-1] == 'start':
+            daemon.start()
+        elif sys.argv[-1] == 'stop':
+            daemon.stop()
+        elif sys.argv[-1] == 'restart':
+            daemon.restart()
+        else:
+            print('Unknow command {command}.'.format(command = sys.argv[1]))
+            sys.exit(2)
+        sys.exit(0)
+    else:
+        print('Usage: {command} start|stop|restart'.format(command = sys.argv[0]))
+        sys.exit(0)
@@ -5,15 +5,17 @@ import json
 import pandas as pd
 import time
 import sys
+import uuid
 from config import app_config # pylint: disable=import-error
 from daemon import Daemon # pylint: disable=import-error
-from db import DatabaseSchema, OrderStatus # pylint: disable=import-error
+from db import create_db_engine, fill_ledger, snapshot, DatabaseSchema, OrderStatus # pylint: disable=import-error
 from logger import Logger # pylint: disable=import-error
+from market import TickBuffer, TrendEstimator # pylint: disable=import-error
 from pathlib import Path
 from rabbitmq import Subscriber # pylint: disable=import-error
 from rabbitmq import Publisher # pylint: disable=import-error
 
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import bindparam, text, MetaData
 
 # initialize the logger so we see what happens
 logger_path = Path(app_config.log.path)
@@ -22,9 +24,74 @@ logger = Logger(path = logger_path / Path(__file__).stem, level = int(app_config
 # connect to the database and create the database schema
 meta = MetaData()
 db_schema = DatabaseSchema(meta)
-engine = create_engine('{db.driver}://{db.username}:{db.password}@{db.host}/{db.database}'.format(db = app_config.db), pool_pre_ping = True)
+engine = create_db_engine(app_config.db)
 meta.create_all(engine)
-logger.debug('Connected to the database with URL {db.driver}://{db.username}:{db.password}@{db.host}/{db.database}'.format(db = app_config.db))
+logger.debug('Connected to the database with URL {url}'.format(url = repr(engine.url)))
+
+# on a database created before the `positions` and `current_budget` tables, fill them once from the logs,
+# and save the default budget if there's none yet, so the requests only read
+with engine.begin() as connection:
+    fill_ledger(connection, db_schema, budget = float(app_config.broker.budget))
+
+# the in-memory window of ticks, if enabled with a [buffer] section in the config file
+ticks = None
+if hasattr(app_config, 'buffer'):
+    retention = int(getattr(app_config.buffer, 'retention', int(app_config.orders.lookbehind) + int(app_config.orders.lookahead)))
+    ticks = TickBuffer(retention = retention * 1000)
+    warm_stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp() * 1000)
+    ticks.extend(pd.read_sql(text('select\
+        id,\
+        price,\
+        symbol,\
+        stamp,\
+        volume\
+    from\
+        {tables.TRANSACTIONS}\
+    where\
+        stamp >= :begin;'.format(tables = db_schema)),
+        con = engine,
+        params = {
+            'begin': warm_stamp - ticks.retention
+        }
+    ), warm_stamp)
+    logger.debug('Warmed the tick buffer with {retention} seconds of transactions.'.format(retention = retention))
+
+# the online trend estimator, if enabled with an [estimator] section in the config file
+estimator = None
+if hasattr(app_config, 'estimator'):
+    estimator_window = int(getattr(app_config.estimator, 'window', app_config.orders.lookbehind)) * 1000
+    estimator_half_life = getattr(app_config.estimator, 'half_life', None)
+    if estimator_half_life is not None:
+        estimator_half_life = float(estimator_half_life) * 1000
+    estimator_snapshot = getattr(app_config.estimator, 'snapshot', None)
+    estimator_saved = time.monotonic()
+    if estimator_snapshot is not None and Path(estimator_snapshot).is_file():
+        estimator = TrendEstimator.load(estimator_snapshot)
+        if estimator.window != estimator_window or estimator.half_life != estimator_half_life:
+            logger.debug('The estimator snapshot was taken with other settings. Ignoring it.')
+            estimator = None
+    if estimator is None:
+        estimator = TrendEstimator(window = estimator_window, half_life = estimator_half_life)
+    # without a snapshot, read the whole window (and the ticks waiting to enter it)
+    warm_stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp() * 1000)
+    estimator.update(pd.read_sql(text('select\
+        id,\
+        price,\
+        symbol,\
+        stamp,\
+        volume\
+    from\
+        {tables.TRANSACTIONS}\
+    where\
+        id > :id and\
+        stamp >= :begin;'.format(tables = db_schema)),
+        con = engine,
+        params = {
+            'id': estimator.high_water,
+            'begin': warm_stamp - estimator.window - int(app_config.orders.lookahead) * 1000
+        }
+    ))
+    logger.debug('Warmed the trend estimator up to the transaction {id}.'.format(id = estimator.high_water))
 
 class DbPublisher(Publisher):
     def log(self, *args, **kwargs):
@@ -40,158 +107,252 @@ class DbSubscriber(Subscriber):
         #super().log(Path(__file__).stem + ':', *args, **kwargs)
         pass
 
-    def _send_profits(self):
+    def _publisher(self, properties, queue, routing_key):
         """
-            Method that retrieves the profits and publishes them to Rabbit MQ.
-            To retrieve the profits:
-                - the active orders are retrieved. If there are active orders,
-                    the profits cannot be computed reliable;
-                - the budget is retrieved from the last like of the BUDGET table;
-                - the portfolio of symbols is retrieved, grouping by symbols and
-                    computing the sum over price times volume
-                - the prices are retrieved as the last transacted prices.
-            All the data is put to dataframes and sent to requested queue with
-            requested.profit routing key.
+            Creates the publisher for a response. Requests sent through the
+            request/reply client (with reply_to set) are answered on the
+            client's queue; the others go to the given queue and routing key.
+        """
+        publisher = DbPublisher(self.parameters)
+        if properties is not None and properties.reply_to:
+            publisher['queue'] = None
+        else:
+            publisher['queue'] = queue
+            publisher['routing_key'] = routing_key
+        return publisher
+
+    def _publish(self, publisher, properties, message):
+        """
+            Publishes a response created for the publisher from _publisher.
+        """
+        if properties is not None and properties.reply_to:
+            publisher.reply(message, properties.reply_to, properties.correlation_id)
+        else:
+            publisher.publish(message)
+
+    def _get_header(self, connection, stamp):
+        """
+            Retrieves the active (PENDING and PARTIAL) orders of each symbol,
+            with the value still to be paid for the buy orders, and the current
+            budget. If there's no budget yet (it's saved on startup), the default
+            budget from the config file is sent, without being saved.
+
+            :param connection: The connection of the request snapshot.
+            :type connection: sqlalchemy.engine.Connection
+            :param stamp: The request stamp, in milliseconds.
+            :type stamp: int
+            :return: A dict with the active_orders (the total), active_symbols
+                (the number of active orders by symbol) and budget (with the
+                pending value of the buy orders) keys, as they are sent in the
+                messages.
+            :rtype: dict
         """
-        # retrieve the PENDING and PARTIAL orders
-        orders = pd.read_sql('select\
-            count(*) as active_orders\
+        active = pd.read_sql(text('select\
+            symbol,\
+            count(1) as orders,\
+            sum(case when volume < 0 then -volume * price else 0 end) as pending\
         from\
             {tables.ORDERS}\
         where\
-            stamp <= %(stamp)s and\
-            status in %(status)s;'.format(tables = db_schema),
-            con = engine,
+            stamp <= :stamp and\
+            status in :status\
+        group by\
+            symbol;'.format(tables = db_schema)).bindparams(bindparam('status', expanding = True)),
+            con = connection,
             params = {
-                'stamp': self.current_stamp,
-                'status': [OrderStatus.PENDING, OrderStatus.PARTIAL]
+                'stamp': stamp,
+                'status': OrderStatus.ACTIVE
             }
         )
-        # retrieve the last budget record
-        budget = pd.read_sql('select\
-            amount,\
+        header = pd.read_sql(text('select\
+            (select\
+                amount\
+            from\
+                {tables.CURRENT_BUDGET}\
+            where\
+                id = 1\
+            ) as amount,\
+            (select\
+                stamp\
+            from\
+                {tables.CURRENT_BUDGET}\
+            where\
+                id = 1\
+            ) as budget_stamp;'.format(tables = db_schema)),
+            con = connection
+        )
+        amount = header['amount'].iloc[0]
+        budget_stamp = header['budget_stamp'].iloc[0]
+        # if missing, use the default budget from config; the request snapshot is only read
+        if pd.isnull(amount):
+            amount = float(app_config.broker.budget)
+            budget_stamp = stamp
+        return {
+            'active_orders': int(active['orders'].sum()),
+            'active_symbols': {str(symbol): int(orders) for symbol, orders in zip(active['symbol'], active['orders'])},
+            'budget': {
+                'amount': float(amount),
+                'stamp': int(budget_stamp),
+                'pending': float(active['pending'].sum())
+            }
+        }
+
+    def _get_portfolio(self, connection):
+        """
+            Retrieves the symbols still held, from the positions table.
+
+            :param connection: The connection of the request snapshot.
+            :type connection: sqlalchemy.engine.Connection
+            :return: A dataframe with the symbol, commission, value, volume and stamp columns.
+            :rtype: pandas.DataFrame
+        """
+        return pd.read_sql('select\
+            symbol,\
+            commission,\
+            -value as value,\
+            -volume as volume,\
             stamp\
         from\
-            {tables.BUDGET}\
-        order by\
-            stamp desc\
-        limit 1;'.format(tables = db_schema),
-            con = engine)
-        # if missing, add the default budget from config
-        if budget.shape[0] < 1:
-            budget = pd.DataFrame(columns = ['amount', 'stamp', 'time'])
-            budget['amount'] = [ float(app_config.broker.budget) ]
-            budget['stamp'] = [ self.current_stamp ]
-            budget['time'] = [ datetime.datetime.utcfromtimestamp(self.current_stamp // 1000) ]
-            budget.to_sql(
-                name = db_schema.BUDGET,
-                con = engine,
-                if_exists = 'append',
-                index = False,
-                method = 'multi'
-            )
-        # retrieve the current portfolio
-        portfolio = pd.read_sql('select\
+            {tables.POSITIONS}\
+        where\
+            volume <> 0;'.format(tables = db_schema),
+            con = connection)
+
+    def _get_prices(self, connection):
+        """
+            Retrieves the last transacted prices, from the last price table
+            maintained by database-save.
+
+            :param connection: The connection of the request snapshot.
+            :type connection: sqlalchemy.engine.Connection
+            :return: A dataframe with the symbol, price and stamp columns.
+            :rtype: pandas.DataFrame
+        """
+        return pd.read_sql('select\
             symbol,\
-            sum(commission) as commission,\
-            -sum(price * volume) as value,\
-            -sum(volume) as volume,\
-            max(stamp) as stamp\
-        from\
-            {tables.PORTFOLIO}\
-        group by\
-            symbol;'.format(tables = db_schema),
-            con = engine)
-        # retrieve the prices
-        prices = pd.read_sql('select\
-            A.symbol,\
-            A.price,\
-            A.stamp\
+            price,\
+            stamp\
         from\
-            {tables.TRANSACTIONS} A inner join\
-            (select\
-                symbol,\
-                max(stamp) as stamp\
-            from\
-                {tables.TRANSACTIONS}\
-            group by\
-                symbol\
-            ) B on (A.symbol = B.symbol and A.stamp = B.stamp);'.format(tables = db_schema),
-            con = engine)
+            {tables.LAST_PRICE};'.format(tables = db_schema),
+            con = connection)
+
+    def _send_profits(self, stamp, properties = None):
+        """
+            Method that retrieves the profits and publishes them to Rabbit MQ.
+            To retrieve the profits:
+                - the active orders are retrieved, by symbol. The symbols with
+                    active orders are left out of the decisions;
+                - the budget is retrieved from the CURRENT_BUDGET table;
+                - the portfolio of symbols is retrieved from the POSITIONS table,
+                    which holds the sum over price times volume for each symbol
+                    still held
+                - the prices are retrieved as the last transacted prices, from
+                    the last price table maintained by database-save.
+            All the reads are done on one connection, in one transaction, so
+            they see the same snapshot of the database.
+            All the data is put to dataframes and sent to requested queue with
+            requested.profit routing key, or to the reply_to queue of the request.
+            :param stamp: The request stamp, in milliseconds.
+            :type stamp: int
+            :param properties: The request message properties.
+            :type properties: pika.BasicProperties
+        """
+        with snapshot(engine) as connection:
+            header = self._get_header(connection, stamp)
+            portfolio = self._get_portfolio(connection)
+            prices = self._get_prices(connection)
         # create the message that will be passed back on the Rabbit MQ
         message = {
-            'stamp': self.current_stamp,
-            'active_orders': int(orders['active_orders'].iloc[0]),
-            'budget': {
-                'amount': float(budget['amount'].iloc[0]) if budget.shape[0] > 0 else 0.0,
-                'stamp': int(budget['stamp'].iloc[0]) if budget.shape[0] > 0 else self.current_stamp
-            },
+            'stamp': stamp,
+            'active_orders': header['active_orders'],
+            'active_symbols': header['active_symbols'],
+            'budget': header['budget'],
             'portfolio': portfolio.to_dict(),
             'prices': prices.to_dict()
         }
         # set the routing key for this message
-        publisher = DbPublisher(self.parameters)
-        publisher['queue'] = 'requested_profit'
-        publisher['routing_key'] = 'requested.profit'
-        publisher.publish(message)
+        publisher = self._publisher(properties, 'requested_profit', 'requested.profit')
+        self._publish(publisher, properties, message)
         publisher.disconnect()
         
-    def _send_trends(self, lookahead, lookbehind):
+    def _get_transactions(self, connection, begin_stamp, end_stamp):
         """
-            Method that retrieves the trends and publishes them to Rabbit MQ.
-            To retrieve the trends:
-                - the active orders are retrieved. If there are active orders,
-                    the trends cannot be computed reliable;
-                - the budget is retrieved from the last like of the BUDGET table;
-                - the transactions are retrieved looking back lookbehind seconds;
-            All the data is put to dataframes and sent to requested queue with
-            requested.trends routing key.
-            :param lookahead: The number of seconds it takes to process an order.
-            :type lookahead: int
-            :param lookbehind: The number of seconds to look in the transaction history.
-            :type lookbehind: int
+            Retrieves the raw transactions with the stamp in [begin_stamp, end_stamp).
+
+            :param connection: The connection of the request snapshot.
+            :type connection: sqlalchemy.engine.Connection
+            :param begin_stamp: The first stamp, in milliseconds.
+            :type begin_stamp: int
+            :param end_stamp: The last stamp, in milliseconds (excluded).
+            :type end_stamp: int
+            :return: A dataframe with the id, price, symbol, stamp and volume columns.
+            :rtype: pandas.DataFrame
         """
-        begin_stamp = self.current_stamp - (lookbehind + lookahead) * 1000
-        end_stamp = self.current_stamp - lookahead * 1000
-        # get the list of PENDING and PARTIAL orders
-        orders = pd.read_sql('select\
-            count(1) as active_orders\
+        return pd.read_sql(text('select\
+            id,\
+            price,\
+            symbol,\
+            stamp,\
+            volume\
         from\
-            {tables.ORDERS}\
+            {tables.TRANSACTIONS}\
         where\
-            stamp <= %(stamp)s and\
-            status in %(status)s;'.format(tables = db_schema),
-            con = engine,
+            stamp >= :begin and\
+            stamp < :end;'.format(tables = db_schema)),
+            con = connection,
             params = {
-                'stamp': self.current_stamp,
-                'status': [OrderStatus.PENDING, OrderStatus.PARTIAL]
+                'begin': begin_stamp,
+                'end': end_stamp
             }
         )
-        # retrieve the last budget record
-        budget = pd.read_sql('select\
-            amount,\
-            stamp\
+
+    def _refresh_ticks(self, connection, stamp):
+        """
+            Extends the tick buffer with the transactions inserted since the
+            last refresh (the ones with an id above the buffer high-water mark).
+            Only the ones within the retention are read, as the buffer would
+            drop the others anyway, e.g. after the warm read found no ticks.
+
+            :param connection: The connection of the request snapshot.
+            :type connection: sqlalchemy.engine.Connection
+            :param stamp: The request stamp, in milliseconds.
+            :type stamp: int
+        """
+        transactions = pd.read_sql(text('select\
+            id,\
+            price,\
+            symbol,\
+            stamp,\
+            volume\
         from\
-            {tables.BUDGET}\
-        order by\
-            stamp desc\
-        limit 1;'.format(tables = db_schema),
-            con = engine)
-        # if missing, add the default budget from config
-        if budget.shape[0] < 1:
-            budget = pd.DataFrame(columns = ['amount', 'stamp', 'time'])
-            budget['amount'] = [ float(app_config.broker.budget) ]
-            budget['stamp'] = [ self.current_stamp ]
-            budget['time'] = [ datetime.datetime.utcfromtimestamp(self.current_stamp // 1000) ]
-            budget.to_sql(
-                name = db_schema.BUDGET,
-                con = engine,
-                if_exists = 'append',
-                index = False,
-                method = 'multi'
-            )
-        # get the transaction history
-        transactions = pd.read_sql('select\
+            {tables.TRANSACTIONS}\
+        where\
+            id > :id and\
+            stamp >= :since;'.format(tables = db_schema)),
+            con = connection,
+            params = {
+                'id': ticks.high_water,
+                'since': stamp - ticks.retention
+            }
+        )
+        ticks.extend(transactions, stamp)
+
+    def _refresh_estimator(self, connection, begin_stamp):
+        """
+            Feeds the trend estimator with the transactions inserted since the
+            last refresh (the ones with an id above its high-water mark). Only
+            the ones that can still enter its window are read, so a cold start
+            or a stale snapshot doesn't pull the whole table.
+
+            :param connection: The connection of the request snapshot.
+            :type connection: sqlalchemy.engine.Connection
+            :param begin_stamp: The first stamp of the requested window, in milliseconds.
+            :type begin_stamp: int
+        """
+        global estimator_saved
+        if estimator.end is not None:
+            begin_stamp = min(begin_stamp, estimator.end - estimator.window)
+        transactions = pd.read_sql(text('select\
             id,\
             price,\
             symbol,\
@@ -200,47 +361,260 @@ class DbSubscriber(Subscriber):
         from\
             {tables.TRANSACTIONS}\
         where\
-            stamp >= %(begin)s and\
-            stamp < %(end)s;'.format(tables = db_schema),
-            con = engine,
+            id > :id and\
+            stamp >= :begin;'.format(tables = db_schema)),
+            con = connection,
+            params = {
+                'id': estimator.high_water,
+                'begin': begin_stamp
+            }
+        )
+        estimator.update(transactions)
+        # snapshot the estimator now and then, so a restart doesn't reload the window
+        if estimator_snapshot is not None and time.monotonic() - estimator_saved > float(getattr(app_config.estimator, 'snapshot_interval', 300)):
+            estimator_saved = time.monotonic()
+            estimator.save(estimator_snapshot)
+
+    def _get_statistics(self, connection, begin_stamp, end_stamp):
+        """
+            Computes in the database, for each symbol, the sufficient statistics
+            of the trend regression over the transactions with the stamp in
+            [begin_stamp, end_stamp): the sums making up the normal equations
+            for price against (1, hours, volume), with hours measured from
+            begin_stamp, the VWAP numerator and denominator, the first and last
+            stamp and the number of transactions.
+
+            :param connection: The connection of the request snapshot.
+            :type connection: sqlalchemy.engine.Connection
+            :param begin_stamp: The first stamp, in milliseconds.
+            :type begin_stamp: int
+            :param end_stamp: The last stamp, in milliseconds (excluded).
+            :type end_stamp: int
+            :return: A dataframe with the market.statistics.COLUMNS columns.
+            :rtype: pandas.DataFrame
+        """
+        return pd.read_sql(text('select\
+            symbol,\
+            count(1) as count,\
+            count(1) as ticks,\
+            min(stamp) as first_stamp,\
+            max(stamp) as last_stamp,\
+            sum(hours) as sum_hours,\
+            sum(volume) as sum_volume,\
+            sum(hours * hours) as sum_hours_hours,\
+            sum(hours * volume) as sum_hours_volume,\
+            sum(volume * volume) as sum_volume_volume,\
+            sum(price) as sum_price,\
+            sum(hours * price) as sum_hours_price,\
+            sum(volume * price) as sum_volume_price\
+        from\
+            (select\
+                symbol,\
+                price,\
+                volume,\
+                stamp,\
+                (stamp - :begin) / 3600000.0 as hours\
+            from\
+                {tables.TRANSACTIONS}\
+            where\
+                stamp >= :begin and\
+                stamp < :end\
+            ) T\
+        group by\
+            symbol;'.format(tables = db_schema)),
+            con = connection,
             params = {
                 'begin': begin_stamp,
                 'end': end_stamp
             }
         )
-        # create the message that will be pushed back to Rabbit MQ
-        message = {
-            'stamp': self.current_stamp,
-            'active_orders': int(orders['active_orders'].iloc[0]),
-            'budget': {
-                'amount': float(budget['amount'].iloc[0]) if budget.shape[0] > 0 else 0.0,
-                'stamp': int(budget['stamp'].iloc[0]) if budget.shape[0] > 0 else self.current_stamp
-            },
-            'transactions': transactions.to_dict()
-        }
+
+    def _send_trends(self, stamp, lookahead, lookbehind, mode = 'transactions', properties = None):
+        """
+            Method that retrieves the trends and publishes them to Rabbit MQ.
+            To retrieve the trends:
+                - the active orders are retrieved, by symbol. The symbols with
+                    active orders are left out of the decisions;
+                - the budget is retrieved from the CURRENT_BUDGET table;
+                - the transactions are retrieved looking back lookbehind seconds,
+                    either raw or, in statistics mode, reduced to the per-symbol
+                    sums of the trend regression; when the tick buffer is enabled
+                    and holds the window, they're read from memory; in online
+                    mode the sums come from the trend estimator;
+            All the reads are done on one connection, in one transaction, so
+            they see the same snapshot of the database.
+            All the data is put to dataframes and sent to requested queue with
+            requested.trends routing key, or to the reply_to queue of the request.
+            :param stamp: The request stamp, in milliseconds.
+            :type stamp: int
+            :param lookahead: The number of seconds it takes to process an order.
+            :type lookahead: int
+            :param lookbehind: The number of seconds to look in the transaction history.
+            :type lookbehind: int
+            :param mode: Either transactions, statistics or online (the sums
+                kept up to date by the trend estimator).
+            :type mode: str
+            :param properties: The request message properties.
+            :type properties: pika.BasicProperties
+        """
+        begin_stamp = stamp - (lookbehind + lookahead) * 1000
+        end_stamp = stamp - lookahead * 1000
+        with snapshot(engine) as connection:
+            header = self._get_header(connection, stamp)
+            # create the message that will be pushed back to Rabbit MQ
+            message = {
+                'stamp': stamp,
+                'active_orders': header['active_orders'],
+                'active_symbols': header['active_symbols'],
+                'budget': header['budget']
+            }
+            # serve the window from memory when the tick buffer holds it
+            buffered = False
+            if ticks is not None:
+                self._refresh_ticks(connection, stamp)
+                buffered = ticks.covers(begin_stamp)
+            online = None
+            if mode == 'online':
+                # the estimator keeps the sums of its window up to date, so use it when it matches the request
+                if estimator is not None and lookbehind * 1000 == estimator.window:
+                    self._refresh_estimator(connection, begin_stamp)
+                    online = estimator.statistics(end_stamp)
+                if online is None:
+                    logger.debug('The trend estimator cannot serve the window. Falling back to statistics.')
+                    mode = 'statistics'
+            if online is not None:
+                statistics, origin = online
+                message['origin'] = origin
+                message['statistics'] = statistics.to_dict()
+            elif mode == 'statistics':
+                # only the per-symbol sums travel, whatever the number of ticks
+                message['origin'] = begin_stamp
+                if buffered:
+                    statistics = ticks.statistics(begin_stamp, end_stamp)
+                else:
+                    statistics = self._get_statistics(connection, begin_stamp, end_stamp)
+                message['statistics'] = statistics.to_dict()
+            else:
+                if buffered:
+                    transactions = ticks.transactions(begin_stamp, end_stamp)
+                else:
+                    transactions = self._get_transactions(connection, begin_stamp, end_stamp)
+                message['transactions'] = transactions.to_dict()
 
         # set the routing key to requested.trends
-        publisher = DbPublisher(self.parameters)
-        publisher['queue'] = 'requested_trends'
-        publisher['routing_key'] = 'requested.trends'
-        publisher.publish(message)
+        publisher = self._publisher(properties, 'requested_trends', 'requested.trends')
+        self._publish(publisher, properties, message)
+        publisher.disconnect()
+    
+    def _get_transaction_chunks(self, connection, begin_stamp, end_stamp, chunksize):
+        """
+            Same as _get_transactions, but reads the rows with a server-side
+            cursor and yields them as dataframes of at most chunksize rows, so
+            the whole window is never held in memory.
+        """
+        return pd.read_sql(text('select\
+            id,\
+            price,\
+            symbol,\
+            stamp,\
+            volume\
+        from\
+            {tables.TRANSACTIONS}\
+        where\
+            stamp >= :begin and\
+            stamp < :end;'.format(tables = db_schema)),
+            con = connection.execution_options(stream_results = True),
+            params = {
+                'begin': begin_stamp,
+                'end': end_stamp
+            },
+            chunksize = chunksize
+        )
+
+    def _stream_trends(self, stamp, lookahead, lookbehind, chunksize, properties = None):
+        """
+            Streaming version of _send_trends: the transactions are published
+            as a sequence of chunk messages, each carrying the header (stamp,
+            active orders, budget, origin) and a stream descriptor with the id
+            shared by all the chunks of the request, the chunk sequence number
+            and a flag set on the last chunk. The consumer can then process
+            the chunks as they arrive, e.g. adding up the regression sums.
+            :param stamp: The request stamp, in milliseconds.
+            :type stamp: int
+            :param lookahead: The number of seconds it takes to process an order.
+            :type lookahead: int
+            :param lookbehind: The number of seconds to look in the transaction history.
+            :type lookbehind: int
+            :param chunksize: The maximum number of transactions in a chunk.
+            :type chunksize: int
+            :param properties: The request message properties.
+            :type properties: pika.BasicProperties
+        """
+        begin_stamp = stamp - (lookbehind + lookahead) * 1000
+        end_stamp = stamp - lookahead * 1000
+        if properties is not None and properties.correlation_id:
+            stream_id = properties.correlation_id
+        else:
+            stream_id = uuid.uuid4().hex
+
+        publisher = self._publisher(properties, 'requested_trends', 'requested.trends')
+
+        def publish_chunk(sequence, chunk, last):
+            self._publish(publisher, properties, {
+                'stamp': stamp,
+                'active_orders': header['active_orders'],
+                'active_symbols': header['active_symbols'],
+                'budget': header['budget'],
+                'origin': begin_stamp,
+                'stream': {
+                    'id': stream_id,
+                    'sequence': sequence,
+                    'last': last
+                },
+                'transactions': chunk.to_dict()
+            })
+
+        with snapshot(engine) as connection:
+            header = self._get_header(connection, stamp)
+            if ticks is not None:
+                self._refresh_ticks(connection, stamp)
+            if ticks is not None and ticks.covers(begin_stamp):
+                transactions = ticks.transactions(begin_stamp, end_stamp)
+                chunks = (transactions.iloc[begin:begin + chunksize] for begin in range(0, transactions.shape[0], chunksize))
+            else:
+                chunks = self._get_transaction_chunks(connection, begin_stamp, end_stamp, chunksize)
+            # hold back one chunk, so the last one can be flagged
+            sequence = 0
+            previous = None
+            for chunk in chunks:
+                if previous is not None:
+                    publish_chunk(sequence, previous, False)
+                    sequence += 1
+                previous = chunk
+        if previous is None:
+            previous = pd.DataFrame(columns = ['id', 'price', 'symbol', 'stamp', 'volume'])
+        publish_chunk(sequence, previous, True)
         publisher.disconnect()
+        logger.debug('Streamed the trends {stream} in {chunks} chunk(s).'.format(stream = stream_id, chunks = sequence + 1))
     
     def on_message_callback(self, basic_delivery, properties, body):
         """
             Overloading the on_message_callback from the Subscriber class.
             It listens for messages that contain the "type" as key in the messages
             arrived on database queue with database.read routing key.
+            Requests carrying reply_to and correlation_id properties (sent with
+            rabbitmq.RpcClient) are answered on their reply queue.
         """
         body_object = json.loads(body)
         if 'type' not in body_object:
             logger.debug('The type key is not present in the message body: {message}.'.format(message = body))
             return
         request_type = body_object['type']
+        # the stamp is kept local, as requests may be processed concurrently
         if 'stamp' not in body_object:
-            self.current_stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp() * 1000)
+            stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp() * 1000)
         else:
-            self.current_stamp = int(body_object['stamp'])
+            stamp = int(body_object['stamp'])
 
         if 'params' in body_object:
             params = body_object['params']
@@ -249,7 +623,7 @@ class DbSubscriber(Subscriber):
         
         # if the type is profit, send the profits
         if request_type == 'profit':
-            self._send_profits()
+            self._send_profits(stamp, properties)
         # if the type is trends, send the trends
         elif request_type == 'trends':
             if 'lookahead' in params:
@@ -260,17 +634,32 @@ class DbSubscriber(Subscriber):
                 lookbehind = params['lookbehind']
             else:
                 lookbehind = 60 * 60
-            self._send_trends(lookahead, lookbehind)
+            if 'mode' in params:
+                mode = params['mode']
+            else:
+                mode = 'transactions'
+            if mode == 'stream':
+                if 'chunksize' in params:
+                    chunksize = int(params['chunksize'])
+                else:
+                    chunksize = int(getattr(app_config.db, 'chunksize', 10000))
+                self._stream_trends(stamp, lookahead, lookbehind, chunksize, properties)
+            else:
+                self._send_trends(stamp, lookahead, lookbehind, mode, properties)
 
 # configure the subscriber
 params = pika.ConnectionParameters(host='localhost')
 subscriber = DbSubscriber(params)
 subscriber['queue'] = 'database_read'
 subscriber['routing_key'] = 'database.read'
+# handle several requests at once, as the request/reply clients may query in parallel
+subscriber['prefetch_count'] = int(getattr(app_config.db, 'workers', 4))
 
 class DbDaemon(Daemon):
     def atexit(self):
         subscriber.stop()
+        if estimator is not None and estimator_snapshot is not None:
+            estimator.save(estimator_snapshot)
         super().atexit()
 
     def run(self):
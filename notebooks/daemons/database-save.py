@@ -7,20 +7,25 @@ import time
 import sys
 from config import app_config # pylint: disable=import-error
 from daemon import Daemon # pylint: disable=import-error
-from db import DatabaseSchema # pylint: disable=import-error
+from db import create_db_engine, rebuild_last_prices, upsert_last_prices, DatabaseSchema # pylint: disable=import-error
 from logger import Logger # pylint: disable=import-error
 from pathlib import Path
 from rabbitmq import Subscriber # pylint: disable=import-error
 
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import func, select, MetaData
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.sql.expression import Insert
 
-# adds the word IGNORE after INSERT in sqlalchemy so dataframe insert can be used seamless
-@compiles(Insert)
+# adds the word IGNORE after INSERT in sqlalchemy for MySQL so dataframe insert can be used seamless
+@compiles(Insert, 'mysql')
 def _prefix_insert_with_ignore(insert, compiler, **kwords):
     return compiler.visit_insert(insert.prefix_with('IGNORE'), **kwords)
 
+# SQLite spells the same thing as INSERT OR IGNORE
+@compiles(Insert, 'sqlite')
+def _prefix_insert_with_or_ignore(insert, compiler, **kwords):
+    return compiler.visit_insert(insert.prefix_with('OR IGNORE'), **kwords)
+
 # initialize the logger so we see what happens
 logger_path = Path(app_config.log.path)
 logger = Logger(path = logger_path / Path(__file__).stem, level = int(app_config.log.level))
@@ -28,9 +33,15 @@ logger = Logger(path = logger_path / Path(__file__).stem, level = int(app_config
 # connect to the database and create the database schema
 meta = MetaData()
 db_schema = DatabaseSchema(meta)
-engine = create_engine('{db.driver}://{db.username}:{db.password}@{db.host}/{db.database}'.format(db = app_config.db), pool_pre_ping = True)
+engine = create_db_engine(app_config.db)
 meta.create_all(engine)
-logger.debug('Connected to the database with URL {db.driver}://{db.username}:{db.password}@{db.host}/{db.database}'.format(db = app_config.db))
+logger.debug('Connected to the database with URL {url}'.format(url = repr(engine.url)))
+
+# on a database created before the `last_price` table, fill it once from the transactions
+with engine.begin() as connection:
+    if connection.execute(select([func.count()]).select_from(db_schema.last_price)).scalar() == 0:
+        logger.debug('Filling the last price table from the transactions.')
+        rebuild_last_prices(connection, db_schema)
 
 class DbSubscriber(Subscriber):
     """
@@ -41,6 +52,24 @@ class DbSubscriber(Subscriber):
         #super().log(Path(__file__).stem + ':', *args, **kwargs)
         pass
     
+    def _last_prices(self, df):
+        """
+            Extracts the most recent transaction of each symbol from a
+            dataframe of transactions.
+
+            :param df: A dataframe with the price, symbol and stamp columns.
+            :type df: pandas.DataFrame
+            :return: A list of dicts with the symbol, price, time and stamp keys.
+            :rtype: list
+        """
+        last = df.sort_values(by = 'stamp').drop_duplicates(subset = 'symbol', keep = 'last')
+        return [{
+            'symbol': row.symbol,
+            'price': float(row.price),
+            'time': datetime.datetime.utcfromtimestamp(int(row.stamp) // 1000),
+            'stamp': int(row.stamp)
+        } for row in last.itertuples(index = False)]
+    
     def on_message_callback(self, basic_delivery, properties, body):
         """
             The callback called when a message is received from the Rabbit MQ.
@@ -80,13 +109,17 @@ class DbSubscriber(Subscriber):
         
         # try to insert the data into the database
         try:
-            df.to_sql(
-                name = table_name,
-                con = engine,
-                if_exists = 'append',
-                index = False,
-                method = 'multi'
-            )
+            with engine.begin() as connection:
+                df.to_sql(
+                    name = table_name,
+                    con = connection,
+                    if_exists = 'append',
+                    index = False,
+                    method = 'multi'
+                )
+                # keep the last price of each symbol up to date, in the same transaction
+                if table_name == DatabaseSchema.TRANSACTIONS:
+                    upsert_last_prices(connection, db_schema, self._last_prices(df))
         except:
             logger.debug('Could not insert the received data in the database.')
 
@@ -1,10 +1,12 @@
 from sqlalchemy import Table, Column, Index
 from sqlalchemy.types import BigInteger, Float, Integer, String, DateTime, Float
+from .engine import create_db_engine, is_sqlite, snapshot
+from .lock import Lease
+from .statements import cancel_orders, expire_orders, fill_ledger, rebuild_current_budget, rebuild_last_prices, rebuild_positions, set_current_budget, upgrade_portfolio_indexes, upsert_last_prices, upsert_positions
+from .status import OrderStatus
 
-class OrderStatus:
-    PENDING = 0
-    PARTIAL = 1
-    FULFILED = 2
+# SQLite only auto-increments INTEGER PRIMARY KEY columns, so the BIGINT ids become INTEGER there
+Identifier = BigInteger().with_variant(Integer, 'sqlite')
 
 class DatabaseSchema:
     TRANSACTIONS = 'transactions'
@@ -12,25 +14,40 @@ class DatabaseSchema:
     PORTFOLIO = 'portfolio'
     ORDERS = 'orders'
     USED = 'used'
+    LAST_PRICE = 'last_price'
+    POSITIONS = 'positions'
+    CURRENT_BUDGET = 'current_budget'
+    APPLIED = 'applied'
+    LOCKS = 'locks'
     
     def __init__(self, meta):
         # the `transactions` table, we've played with this before
         self.transactions = Table(
             self.TRANSACTIONS, meta, 
-            Column('id', BigInteger, primary_key = True),
+            Column('id', Identifier, primary_key = True),
             Column('price', Float), 
             Column('symbol', String(32)),
             Column('time', DateTime),
             Column('stamp', BigInteger),
             Column('volume', Float)
         )
-        _ = Index('symbol', self.transactions.c.symbol)
-        _ = Index('symbol_stamp', self.transactions.c.symbol, self.transactions.c.stamp, unique = True)
+        _ = Index('transactions_symbol', self.transactions.c.symbol)
+        _ = Index('transactions_symbol_stamp', self.transactions.c.symbol, self.transactions.c.stamp, unique = True)
 
         # the `budget` table; the current budget is the last line from the table (time wise)
         self.budget = Table(
             self.BUDGET, meta,
-            Column('id', BigInteger, primary_key = True),
+            Column('id', Identifier, primary_key = True),
+            Column('amount', Float),
+            Column('time', DateTime),
+            Column('stamp', BigInteger)
+        )
+        _ = Index('budget_stamp', self.budget.c.stamp)
+
+        # the `current_budget` table: a single row (id = 1) holding the last line from the `budget` table
+        self.current_budget = Table(
+            self.CURRENT_BUDGET, meta,
+            Column('id', Integer, primary_key = True, autoincrement = False),
             Column('amount', Float),
             Column('time', DateTime),
             Column('stamp', BigInteger)
@@ -39,7 +56,7 @@ class DatabaseSchema:
         # the `portfolio` table: this is kind of a `transactions` table, but with transactions done on my behalf
         self.portfolio = Table(
             self.PORTFOLIO, meta,
-            Column('id', BigInteger, primary_key = True),
+            Column('id', Identifier, primary_key = True),
             Column('transaction', BigInteger),
             Column('price', Float),
             Column('commission', Float),
@@ -48,13 +65,15 @@ class DatabaseSchema:
             Column('stamp', BigInteger),
             Column('volume', Float)
         )
-        _ = Index('symbol', self.portfolio.c.symbol)
-        _ = Index('symbol_stamp', self.portfolio.c.symbol, self.portfolio.c.stamp, unique = True)
+        _ = Index('portfolio_symbol', self.portfolio.c.symbol)
+        # the fills of one matching share their stamp, so a fill is told apart by its transaction
+        _ = Index('portfolio_symbol_stamp', self.portfolio.c.symbol, self.portfolio.c.stamp)
+        _ = Index('portfolio_transaction_stamp', self.portfolio.c.transaction, self.portfolio.c.stamp, unique = True)
 
         # the `orders` table: this is kind of a `transactions` table, but with pending orders
         self.orders = Table(
             self.ORDERS, meta,
-            Column('id', BigInteger, primary_key = True),
+            Column('id', Identifier, primary_key = True),
             Column('price', Float), 
             Column('symbol', String(32)),
             Column('time', DateTime),
@@ -62,15 +81,53 @@ class DatabaseSchema:
             Column('volume', Float),
             Column('status', Integer)
         )
-        _ = Index('symbol', self.orders.c.symbol)
-        _ = Index('status', self.orders.c.status)
-        _ = Index('symbol_stamp', self.orders.c.symbol, self.orders.c.stamp, unique = True)
+        _ = Index('orders_symbol', self.orders.c.symbol)
+        _ = Index('orders_status', self.orders.c.status)
+        _ = Index('orders_symbol_stamp', self.orders.c.symbol, self.orders.c.stamp, unique = True)
 
         # the `used_log` table: this will keep only the `id`s and used volume for transactions used to fulfil orders
         self.used = Table(
             self.USED, meta,
-            Column('id', BigInteger, primary_key = True),
+            Column('id', Identifier, primary_key = True),
             Column('transaction', BigInteger),
             Column('stamp', BigInteger),
             Column('volume', Float)
-        )
\ No newline at end of file
+        )
+
+        # the `last_price` table: one row per symbol with the most recent transaction, maintained by database-save
+        self.last_price = Table(
+            self.LAST_PRICE, meta,
+            Column('symbol', String(32), primary_key = True),
+            Column('price', Float),
+            Column('time', DateTime),
+            Column('stamp', BigInteger)
+        )
+
+        # the `positions` table: the `portfolio` table summed by symbol, maintained by fulfil-orders
+        self.positions = Table(
+            self.POSITIONS, meta,
+            Column('symbol', String(32), primary_key = True),
+            Column('value', Float),
+            Column('volume', Float),
+            Column('commission', Float),
+            Column('stamp', BigInteger)
+        )
+
+        # the `applied` table: the keys of the orders.make messages whose fills were saved,
+        # so a redelivered message is not applied twice
+        self.applied = Table(
+            self.APPLIED, meta,
+            Column('key', String(64), primary_key = True),
+            Column('time', DateTime),
+            Column('stamp', BigInteger)
+        )
+        _ = Index('applied_stamp', self.applied.c.stamp)
+
+        # the `locks` table: one row per lock shared by the workers, see db.Lease
+        self.locks = Table(
+            self.LOCKS, meta,
+            Column('name', String(64), primary_key = True),
+            Column('owner', String(128)),
+            Column('token', BigInteger),
+            Column('expires', BigInteger)
+        )
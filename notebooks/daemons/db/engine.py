@@ -0,0 +1,91 @@
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+
+# pragmas applied on every new SQLite connection, tuned for a single writer
+# on a Raspberry Pi: WAL lets the readers work while database-save writes,
+# NORMAL sync is safe in WAL mode and the caches trade a bit of RAM for I/O
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -16384,
+    'mmap_size': 67108864,
+    'busy_timeout': 5000
+}
+
+def is_sqlite(engine):
+    """
+        Check if the engine (or connection) is connected to a SQLite database.
+
+        :param engine: The SQLAlchemy engine or connection.
+        :type engine: sqlalchemy.engine.Engine
+        :return: True if the engine uses the SQLite dialect, False otherwise.
+        :rtype: bool
+    """
+    return engine.dialect.name == 'sqlite'
+
+def _sqlite_pragmas(db_config):
+    """
+        Merges the default SQLite pragmas with the ones found in the config
+        file, as `pragma_<name> = <value>` options of the [db] section.
+    """
+    pragmas = dict(SQLITE_PRAGMAS)
+    for key, value in vars(db_config).items():
+        if key.startswith('pragma_'):
+            pragmas[key[len('pragma_'):]] = value
+    return pragmas
+
+def create_db_engine(db_config):
+    """
+        Creates the SQLAlchemy engine for the [db] section of the config file.
+        The driver option selects the backend:
+            - mysql (or mysql+<dbapi>): uses the username, password, host and
+                database options to connect to the server;
+            - sqlite: uses the database option as the path to the database
+                file, which is opened in WAL mode with tuned pragmas.
+
+        :param db_config: The [db] section of the config file.
+        :type db_config: config.Config
+        :return: The engine connected to the database.
+        :rtype: sqlalchemy.engine.Engine
+    """
+    if db_config.driver.split('+')[0] != 'sqlite':
+        return create_engine('{db.driver}://{db.username}:{db.password}@{db.host}/{db.database}'.format(db = db_config), pool_pre_ping = True)
+
+    engine = create_engine('{db.driver}:///{db.database}'.format(db = db_config), connect_args = {'check_same_thread': False})
+    pragmas = _sqlite_pragmas(db_config)
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        # let SQLAlchemy emit BEGIN, pysqlite would otherwise defer it until the first write
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {name} = {value};'.format(name = name, value = value))
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def _on_begin(connection):
+        connection.exec_driver_sql('BEGIN;')
+
+    return engine
+
+@contextmanager
+def snapshot(engine):
+    """
+        Opens a connection with a transaction that sees a single, consistent
+        snapshot of the database: REPEATABLE READ on MySQL, while on SQLite
+        (in WAL mode) every transaction already reads from one snapshot.
+        The transaction is committed when the block ends.
+
+        :param engine: The SQLAlchemy engine.
+        :type engine: sqlalchemy.engine.Engine
+        :return: The connection to run all the statements on.
+        :rtype: sqlalchemy.engine.Connection
+    """
+    connection = engine.connect()
+    if not is_sqlite(engine):
+        connection = connection.execution_options(isolation_level = 'REPEATABLE READ')
+    with connection:
+        with connection.begin():
+            yield connection
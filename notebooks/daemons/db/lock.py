@@ -0,0 +1,141 @@
+import datetime
+import os
+import socket
+import uuid
+from sqlalchemy import text
+from .engine import is_sqlite
+
+def _now():
+    return int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp() * 1000)
+
+class Lease:
+    """
+        A lock shared through the `locks` table, so it holds across processes
+        and hosts, on MySQL and on SQLite alike. The holder gets it for ttl
+        seconds and has to renew it before then; if the holder dies, the
+        lease simply runs out and another worker takes it over.
+        Every acquisition increments the fencing token of the lock. A holder
+        that stalled past its lease can't tell on its own that it lost it, so
+        the writes made under the lock call check in their transaction, which
+        fails once anyone else has taken the lock since.
+    """
+    def __init__(self, engine, db_schema, name, ttl = 60, owner = None):
+        """
+            :param engine: The database engine.
+            :type engine: sqlalchemy.engine.Engine
+            :param db_schema: The database schema.
+            :type db_schema: db.DatabaseSchema
+            :param name: The lock name, e.g. the symbol partition it guards.
+            :type name: str
+            :param ttl: The number of seconds the lease lasts.
+            :type ttl: float
+            :param owner: The holder name, unique per process by default.
+            :type owner: str
+        """
+        self.engine = engine
+        self.db_schema = db_schema
+        self.name = name
+        self.ttl = float(ttl)
+        self.owner = owner if owner is not None else '{host}:{pid}:{id}'.format(host = socket.gethostname(), pid = os.getpid(), id = uuid.uuid4().hex[:8])
+        self.token = None
+
+    def acquire(self):
+        """
+            Takes the lock if it's free, expired or already held by this owner
+            (which renews it).
+
+            :return: The fencing token, or None if another owner holds the lock.
+            :rtype: int
+        """
+        stamp = _now()
+        params = {
+            'name': self.name,
+            'owner': self.owner,
+            'stamp': stamp,
+            'expires': stamp + int(self.ttl * 1000)
+        }
+        with self.engine.begin() as connection:
+            # the token only moves when the lock changes hands
+            taken = connection.execute(text('update\
+                {tables.LOCKS}\
+            set\
+                token = case when owner = :owner then token else token + 1 end,\
+                owner = :owner,\
+                expires = :expires\
+            where\
+                name = :name and\
+                (owner = :owner or expires < :stamp);'.format(tables = self.db_schema)), params).rowcount
+            if taken < 1:
+                insert = 'insert or ignore into' if is_sqlite(connection) else 'insert ignore into'
+                taken = connection.execute(text('{insert}\
+                    {tables.LOCKS} (name, owner, token, expires)\
+                values\
+                    (:name, :owner, 1, :expires);'.format(insert = insert, tables = self.db_schema)), params).rowcount
+            if taken < 1:
+                self.token = None
+                return None
+            self.token = int(connection.execute(text('select\
+                token\
+            from\
+                {tables.LOCKS}\
+            where\
+                name = :name;'.format(tables = self.db_schema)), params).scalar())
+        return self.token
+
+    def renew(self):
+        """
+            Extends the lease, if it's still held.
+
+            :return: False if the lock was lost.
+            :rtype: bool
+        """
+        token = self.token
+        return token is not None and self.acquire() == token
+
+    def release(self):
+        """
+            Frees the lock, keeping its token, so the next holder gets a larger one.
+        """
+        if self.token is None:
+            return
+        with self.engine.begin() as connection:
+            connection.execute(text('update\
+                {tables.LOCKS}\
+            set\
+                expires = 0\
+            where\
+                name = :name and\
+                owner = :owner and\
+                token = :token;'.format(tables = self.db_schema)), {
+                'name': self.name,
+                'owner': self.owner,
+                'token': self.token
+            })
+        self.token = None
+
+    def check(self, connection):
+        """
+            The fencing check, run first in the transaction of a write made
+            under the lock. On MySQL the lock row stays locked until the
+            transaction ends, so the lock can't change hands meanwhile; SQLite
+            allows a single writer anyway.
+
+            :param connection: The connection of the write transaction.
+            :type connection: sqlalchemy.engine.Connection
+            :return: True if the lock is still held with the same token and
+                hasn't expired.
+            :rtype: bool
+        """
+        if self.token is None:
+            return False
+        row = connection.execute(text('select\
+            owner,\
+            token,\
+            expires\
+        from\
+            {tables.LOCKS}\
+        where\
+            name = :name{lock};'.format(tables = self.db_schema, lock = '' if is_sqlite(connection) else ' for update')), {
+            'name': self.name
+        }).fetchone()
+        return row is not None and row[0] == self.owner and int(row[1]) == self.token and int(row[2]) >= _now()
@@ -0,0 +1,336 @@
+import datetime
+from sqlalchemy import bindparam, func, inspect, select, text
+from .engine import is_sqlite
+from .status import OrderStatus
+
+def upsert_last_prices(connection, db_schema, rows):
+    """
+        Inserts or updates the `last_price` rows for a list of transactions.
+        An existing row is overwritten only by a transaction with a newer (or
+        equal) stamp, so late or redelivered ticks cannot move a price back.
+
+        :param connection: An open SQLAlchemy connection (preferably in a transaction).
+        :type connection: sqlalchemy.engine.Connection
+        :param db_schema: The database schema.
+        :type db_schema: db.DatabaseSchema
+        :param rows: A list of dicts with the symbol, price, time and stamp keys,
+            at most one per symbol.
+        :type rows: list
+    """
+    if len(rows) < 1:
+        return
+    if is_sqlite(connection):
+        stmt = 'insert into\
+            {tables.LAST_PRICE} (symbol, price, time, stamp)\
+        values\
+            (:symbol, :price, :time, :stamp)\
+        on conflict (symbol) do update set\
+            price = excluded.price,\
+            time = excluded.time,\
+            stamp = excluded.stamp\
+        where\
+            excluded.stamp >= {tables.LAST_PRICE}.stamp;'
+    else:
+        # MySQL assigns left to right, so the stamp guard must be updated last
+        stmt = 'insert into\
+            {tables.LAST_PRICE} (symbol, price, time, stamp)\
+        values\
+            (:symbol, :price, :time, :stamp)\
+        on duplicate key update\
+            price = if(values(stamp) >= stamp, values(price), price),\
+            time = if(values(stamp) >= stamp, values(time), time),\
+            stamp = greatest(stamp, values(stamp));'
+    connection.execute(text(stmt.format(tables = db_schema)), rows)
+
+def rebuild_last_prices(connection, db_schema):
+    """
+        Fills the `last_price` table from the `transactions` table. This scans
+        the whole `transactions` table, so it's meant to be run once, when the
+        `last_price` table is created on an existing database.
+
+        :param connection: An open SQLAlchemy connection (preferably in a transaction).
+        :type connection: sqlalchemy.engine.Connection
+        :param db_schema: The database schema.
+        :type db_schema: db.DatabaseSchema
+    """
+    connection.execute(text('delete from {tables.LAST_PRICE};'.format(tables = db_schema)))
+    connection.execute(text('insert into\
+        {tables.LAST_PRICE} (symbol, price, time, stamp)\
+    select\
+        A.symbol,\
+        A.price,\
+        A.time,\
+        A.stamp\
+    from\
+        {tables.TRANSACTIONS} A inner join\
+        (select\
+            symbol,\
+            max(stamp) as stamp\
+        from\
+            {tables.TRANSACTIONS}\
+        group by\
+            symbol\
+        ) B on (A.symbol = B.symbol and A.stamp = B.stamp);'.format(tables = db_schema)))
+
+def upsert_positions(connection, db_schema, rows):
+    """
+        Adds the fills of a list of symbols to the `positions` table. The
+        value, volume and commission are added to the existing ones, keeping
+        the same sign convention as the `portfolio` table (negative volume for
+        bought symbols).
+
+        :param connection: An open SQLAlchemy connection (preferably in a transaction).
+        :type connection: sqlalchemy.engine.Connection
+        :param db_schema: The database schema.
+        :type db_schema: db.DatabaseSchema
+        :param rows: A list of dicts with the symbol, value (price times volume),
+            volume, commission and stamp keys, at most one per symbol.
+        :type rows: list
+    """
+    if len(rows) < 1:
+        return
+    if is_sqlite(connection):
+        stmt = 'insert into\
+            {tables.POSITIONS} (symbol, value, volume, commission, stamp)\
+        values\
+            (:symbol, :value, :volume, :commission, :stamp)\
+        on conflict (symbol) do update set\
+            value = value + excluded.value,\
+            volume = volume + excluded.volume,\
+            commission = commission + excluded.commission,\
+            stamp = max(stamp, excluded.stamp);'
+    else:
+        stmt = 'insert into\
+            {tables.POSITIONS} (symbol, value, volume, commission, stamp)\
+        values\
+            (:symbol, :value, :volume, :commission, :stamp)\
+        on duplicate key update\
+            value = value + values(value),\
+            volume = volume + values(volume),\
+            commission = commission + values(commission),\
+            stamp = greatest(stamp, values(stamp));'
+    connection.execute(text(stmt.format(tables = db_schema)), rows)
+
+def rebuild_positions(connection, db_schema):
+    """
+        Fills the `positions` table by summing the whole `portfolio` table.
+
+        :param connection: An open SQLAlchemy connection (preferably in a transaction).
+        :type connection: sqlalchemy.engine.Connection
+        :param db_schema: The database schema.
+        :type db_schema: db.DatabaseSchema
+    """
+    connection.execute(text('delete from {tables.POSITIONS};'.format(tables = db_schema)))
+    connection.execute(text('insert into\
+        {tables.POSITIONS} (symbol, value, volume, commission, stamp)\
+    select\
+        symbol,\
+        sum(price * volume),\
+        sum(volume),\
+        sum(commission),\
+        max(stamp)\
+    from\
+        {tables.PORTFOLIO}\
+    group by\
+        symbol;'.format(tables = db_schema)))
+
+def _drop_index(connection, db_schema, name):
+    connection.execute(text('drop index {name}{table};'.format(
+        name = name,
+        table = '' if is_sqlite(connection) else ' on {tables.PORTFOLIO}'.format(tables = db_schema)
+    )))
+
+def upgrade_portfolio_indexes(connection, db_schema):
+    """
+        On a database created when the `portfolio` rows were unique by symbol
+        and stamp, makes them unique by transaction and stamp instead, as the
+        fills of one matching now share their stamp. The tables are only
+        created by create_all, never altered, so the indexes are fixed here.
+        The indexes of the first schema (named `symbol` and `symbol_stamp` on
+        MySQL) are found by their columns, not their names, and dropped, as
+        the declared ones replace them.
+
+        :param connection: An open SQLAlchemy connection (preferably in a transaction).
+        :type connection: sqlalchemy.engine.Connection
+        :param db_schema: The database schema.
+        :type db_schema: db.DatabaseSchema
+    """
+    declared = {index.name: index for index in db_schema.portfolio.indexes}
+    legacy = (['symbol'], ['symbol', 'stamp'])
+    existing = {}
+    for index in inspect(connection).get_indexes(db_schema.PORTFOLIO):
+        if index['name'] not in declared and list(index['column_names']) in legacy:
+            _drop_index(connection, db_schema, index['name'])
+        else:
+            existing[index['name']] = index
+    for index in declared.values():
+        if index.name in existing and bool(existing[index.name]['unique']) != bool(index.unique):
+            _drop_index(connection, db_schema, index.name)
+            del existing[index.name]
+        if index.name not in existing:
+            index.create(connection)
+
+def set_current_budget(connection, db_schema, amount, stamp, time):
+    """
+        Replaces the single row of the `current_budget` table. REPLACE INTO
+        is understood by both MySQL and SQLite.
+
+        :param connection: An open SQLAlchemy connection (preferably in a transaction).
+        :type connection: sqlalchemy.engine.Connection
+        :param db_schema: The database schema.
+        :type db_schema: db.DatabaseSchema
+        :param amount: The budget amount.
+        :type amount: float
+        :param stamp: The budget stamp, in milliseconds.
+        :type stamp: int
+        :param time: The budget time.
+        :type time: datetime.datetime
+    """
+    connection.execute(text('replace into\
+        {tables.CURRENT_BUDGET} (id, amount, time, stamp)\
+    values\
+        (1, :amount, :time, :stamp);'.format(tables = db_schema)), {
+        'amount': amount,
+        'time': time,
+        'stamp': stamp
+    })
+
+def rebuild_current_budget(connection, db_schema):
+    """
+        Fills the `current_budget` table with the last line of the `budget` table.
+
+        :param connection: An open SQLAlchemy connection (preferably in a transaction).
+        :type connection: sqlalchemy.engine.Connection
+        :param db_schema: The database schema.
+        :type db_schema: db.DatabaseSchema
+    """
+    connection.execute(text('delete from {tables.CURRENT_BUDGET};'.format(tables = db_schema)))
+    connection.execute(text('insert into\
+        {tables.CURRENT_BUDGET} (id, amount, time, stamp)\
+    select\
+        1,\
+        amount,\
+        time,\
+        stamp\
+    from\
+        {tables.BUDGET}\
+    order by\
+        stamp desc\
+    limit 1;'.format(tables = db_schema)))
+
+def fill_ledger(connection, db_schema, budget = None):
+    """
+        On a database created before the `positions` and `current_budget`
+        tables, fills them once from the `portfolio` and `budget` logs. On a
+        database without any budget yet, the default budget is saved both in
+        the budget log and as the current budget, so the readers never have
+        to write it.
+
+        :param connection: An open SQLAlchemy connection (preferably in a transaction).
+        :type connection: sqlalchemy.engine.Connection
+        :param db_schema: The database schema.
+        :type db_schema: db.DatabaseSchema
+        :param budget: The default budget, from the config file, or None to
+            leave an empty budget as it is.
+        :type budget: float
+    """
+    if connection.execute(select([func.count()]).select_from(db_schema.positions)).scalar() == 0:
+        rebuild_positions(connection, db_schema)
+    if connection.execute(select([func.count()]).select_from(db_schema.current_budget)).scalar() == 0:
+        rebuild_current_budget(connection, db_schema)
+    if budget is not None and connection.execute(select([func.count()]).select_from(db_schema.current_budget)).scalar() == 0:
+        stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp()) * 1000
+        time = datetime.datetime.utcfromtimestamp(stamp // 1000)
+        connection.execute(db_schema.budget.insert(), {
+            'amount': float(budget),
+            'time': time,
+            'stamp': stamp
+        })
+        set_current_budget(connection, db_schema, amount = float(budget), stamp = stamp, time = time)
+
+def _within(within):
+    """
+        The condition restricting an orders statement to some symbols, e.g.
+        the ones of a broker partition, and its bind parameter.
+    """
+    if within is None:
+        return ('', [])
+    return (' and\
+        symbol in :within', [bindparam('within', expanding = True)])
+
+def expire_orders(connection, db_schema, stamp, within = None):
+    """
+        Marks as EXPIRED, with one statement, the active orders placed at or
+        before stamp. The filled part of a partial order stays in the
+        portfolio, only the rest of it is given up.
+
+        :param connection: An open SQLAlchemy connection (preferably in a transaction).
+        :type connection: sqlalchemy.engine.Connection
+        :param db_schema: The database schema.
+        :type db_schema: db.DatabaseSchema
+        :param stamp: The last order stamp to expire, in milliseconds.
+        :type stamp: int
+        :param within: The only symbols whose orders may expire, None for all of them.
+        :type within: list
+        :return: The number of expired orders.
+        :rtype: int
+    """
+    if within is not None and len(within) < 1:
+        return 0
+    condition, within_params = _within(within)
+    result = connection.execute(text('update\
+        {tables.ORDERS}\
+    set\
+        status = :expired\
+    where\
+        stamp <= :stamp and\
+        status in :status{within};'.format(tables = db_schema, within = condition)).bindparams(bindparam('status', expanding = True), *within_params), {
+        'expired': OrderStatus.EXPIRED,
+        'stamp': stamp,
+        'status': OrderStatus.ACTIVE,
+        'within': list(within or [])
+    })
+    return result.rowcount
+
+def cancel_orders(connection, db_schema, ids = None, symbols = None, within = None):
+    """
+        Marks as CANCELLED the active orders with the given ids or symbols.
+
+        :param connection: An open SQLAlchemy connection (preferably in a transaction).
+        :type connection: sqlalchemy.engine.Connection
+        :param db_schema: The database schema.
+        :type db_schema: db.DatabaseSchema
+        :param ids: The order ids.
+        :type ids: list
+        :param symbols: The symbols whose orders are all cancelled.
+        :type symbols: list
+        :param within: The only symbols whose orders may be cancelled, None for all of them.
+        :type within: list
+        :return: The number of cancelled orders.
+        :rtype: int
+    """
+    if within is not None and len(within) < 1:
+        return 0
+    condition, within_params = _within(within)
+    cancelled = 0
+    for column, values in (('id', ids), ('symbol', symbols)):
+        if not values:
+            continue
+        result = connection.execute(text('update\
+            {tables.ORDERS}\
+        set\
+            status = :cancelled\
+        where\
+            {column} in :values and\
+            status in :status{within};'.format(tables = db_schema, column = column, within = condition)).bindparams(
+                bindparam('values', expanding = True),
+                bindparam('status', expanding = True),
+                *within_params
+            ), {
+            'cancelled': OrderStatus.CANCELLED,
+            'values': list(values),
+            'status': OrderStatus.ACTIVE,
+            'within': list(within or [])
+        })
+        cancelled += result.rowcount
+    return cancelled
@@ -0,0 +1,10 @@
+class OrderStatus:
+    PENDING = 0
+    PARTIAL = 1
+    FULFILED = 2
+    # the orders closed before being fulfiled: on request, or when their time to live passed
+    CANCELLED = 3
+    EXPIRED = 4
+
+    # the orders the broker still tries to fulfil
+    ACTIVE = [PENDING, PARTIAL]
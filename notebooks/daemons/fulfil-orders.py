@@ -1,26 +1,38 @@
 #!/usr/bin/env python3
 import datetime
+import hashlib
 import pika # pylint: disable=import-error
 import json
 import pandas as pd
 import time
 import sys
 from config import app_config # pylint: disable=import-error
+from broker import match_orders, parse_commission, SymbolRing, ORDERS_ROUTING_KEY # pylint: disable=import-error
 from daemon import Daemon # pylint: disable=import-error
-from db import DatabaseSchema, OrderStatus # pylint: disable=import-error
+from db import cancel_orders, create_db_engine, expire_orders, fill_ledger, is_sqlite, set_current_budget, upgrade_portfolio_indexes, upsert_positions, DatabaseSchema, Lease, OrderStatus # pylint: disable=import-error
 from logger import Logger # pylint: disable=import-error
 from pathlib import Path
 from rabbitmq import Subscriber # pylint: disable=import-error
 from rabbitmq import Publisher # pylint: disable=import-error
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import func, select, text, MetaData
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.sql.expression import bindparam, Insert
 
-# adds the word IGNORE after INSERT in sqlalchemy
-@compiles(Insert)
+# adds the word IGNORE after INSERT in sqlalchemy for MySQL; the fills are
+# inserted without it, so a fill can't be silently dropped from the portfolio
+@compiles(Insert, 'mysql')
 def _prefix_insert_with_ignore(insert, compiler, **kwords):
+    if insert.table.name == DatabaseSchema.PORTFOLIO:
+        return compiler.visit_insert(insert, **kwords)
     return compiler.visit_insert(insert.prefix_with('IGNORE'), **kwords)
 
+# SQLite spells the same thing as INSERT OR IGNORE
+@compiles(Insert, 'sqlite')
+def _prefix_insert_with_or_ignore(insert, compiler, **kwords):
+    if insert.table.name == DatabaseSchema.PORTFOLIO:
+        return compiler.visit_insert(insert, **kwords)
+    return compiler.visit_insert(insert.prefix_with('OR IGNORE'), **kwords)
+
 # initialize the logger so we see what happens
 logger_path = Path(app_config.log.path)
 logger = Logger(path = logger_path / Path(__file__).stem, level = int(app_config.log.level))
@@ -28,9 +40,49 @@ logger = Logger(path = logger_path / Path(__file__).stem, level = int(app_config
 # connect to the database
 meta = MetaData()
 db_schema = DatabaseSchema(meta)
-engine = create_engine('{db.driver}://{db.username}:{db.password}@{db.host}/{db.database}'.format(db = app_config.db), pool_pre_ping = True)
+engine = create_db_engine(app_config.db)
 meta.create_all(engine)
-logger.debug('Connected to the database with URL {db.driver}://{db.username}:{db.password}@{db.host}/{db.database}'.format(db = app_config.db))
+logger.debug('Connected to the database with URL {url}'.format(url = repr(engine.url)))
+
+# on a database created before the `positions` and `current_budget` tables, fill them once from the logs
+with engine.begin() as connection:
+    fill_ledger(connection, db_schema, budget = float(app_config.broker.budget))
+    upgrade_portfolio_indexes(connection, db_schema)
+
+# the number of seconds the keys of the applied messages are kept
+APPLIED_TTL = 7 * 24 * 3600
+
+# the symbols are split between [broker] partitions brokers, by consistent
+# hashing, and this one owns the [broker] partition; without the options, one
+# broker handles the whole market
+partitions = int(getattr(app_config.broker, 'partitions', 1))
+partition = int(getattr(app_config.broker, 'partition', 0)) if partitions > 1 else None
+ring = SymbolRing(partitions) if partition is not None else None
+if partition is not None and not 0 <= partition < partitions:
+    raise ValueError('The partition {partition} is not one of the {partitions} partitions.'.format(partition = partition, partitions = partitions))
+
+# the orders are locked in the database, not in this process, so several
+# brokers can run: one lock per symbol partition, held for lock_ttl seconds at most
+lease = Lease(
+    engine,
+    db_schema,
+    name = 'orders' if partition is None else 'orders.{partition}'.format(partition = partition),
+    ttl = float(getattr(app_config.broker, 'lock_ttl', 60))
+)
+
+def _records(frame):
+    """
+        The rows of a dataframe as dicts of Python values, the parameters of
+        an executemany.
+    """
+    columns = []
+    for name in frame.columns:
+        column = frame[name]
+        if pd.api.types.is_datetime64_any_dtype(column):
+            columns.append(list(column.dt.to_pydatetime()))
+        else:
+            columns.append(list(column.astype(object).where(column.notnull(), None)))
+    return [dict(zip(frame.columns, row)) for row in zip(*columns)]
 
 class BrokerSubscriber(Subscriber):
     def log(self, *args, **kwargs):
@@ -39,24 +91,29 @@ class BrokerSubscriber(Subscriber):
 
     def _lock(self):
         """
-            Prevents other broker subscribers to work on the database.
+            Prevents other broker subscribers to work on the orders of the
+            same partition, in any process.
+
+            :return: True if the lock was taken, False if another broker holds it.
+            :rtype: bool
         """
-        self.locked = True
+        return lease.acquire() is not None
     
     def _unlock(self):
         """
-            Removes the restrictions on the database.
+            Removes the restrictions on the orders.
         """
-        self.locked = False
+        lease.release()
     
     def _is_locked(self):
         """
-            Check if the database is restricted for this broker.
+            Check if this broker still holds the lock, extending it if so.
             
-            :return: True if the database is restricted, False otherwise.
+            :return: True if the lock is held, False if it was lost, e.g.
+                because it expired and another broker took it.
             :rtype: bool
         """
-        return hasattr(self, 'locked') and self.locked
+        return lease.renew()
     
     def _commission(self):
         """
@@ -70,23 +127,7 @@ class BrokerSubscriber(Subscriber):
                 commission type as a string (either 'fixed' or 'percent').
             :rtype: tuple
         """
-        
-        commission_type = 'fixed'
-        commission_value = 0.0        
-        if isinstance(app_config.broker.commission, str):
-            if app_config.broker.commission[-1] == '%':
-                try:
-                    commission_value = float(app_config.broker.commission[:-1])
-                    commission_type = 'percent'
-                except:
-                    pass
-            else:
-                try:
-                    commission_value = float(app_config.broker.commission)
-                except:
-                    pass
-        elif isinstance(app_config.broker.commission, (int, float)):
-            commission_value = float(app_config.broker.commission)
+        commission_value, commission_type = parse_commission(app_config.broker.commission)
 
         logger.debug('Commission threshold is {value} of type {type}.'.format(
             value = commission_value,
@@ -98,7 +139,57 @@ class BrokerSubscriber(Subscriber):
             commission_type
         )
     
-    def _get_active_orders(self, lookahead):
+    def _owned_symbols(self):
+        """
+            The symbols of the active orders that belong to the partition of
+            this broker.
+
+            :return: The symbols, or None when this broker handles them all.
+            :rtype: list
+        """
+        if ring is None:
+            return None
+        symbols = pd.read_sql(text('select distinct\
+            symbol\
+        from\
+            {tables.ORDERS}\
+        where\
+            status in :status;'.format(tables = db_schema)).bindparams(bindparam('status', expanding = True)),
+            con = engine,
+            params = {
+                'status': OrderStatus.ACTIVE
+            }
+        )
+        return ring.owned(symbols['symbol'].values, partition)
+
+    def _sweep_orders(self, ttl, cancel, symbols = None):
+        """
+            Closes, in one transaction, the orders that were asked to be
+            cancelled and the ones older than their time to live, so they're
+            not matched anymore. As the budget held by the buy orders is
+            computed from the active orders, it's released with them.
+
+            :param ttl: The number of seconds an order stays active, 0 to keep
+                the orders until they're fulfiled.
+            :type ttl: int
+            :param cancel: A dict with the ids and symbols keys, the orders to cancel.
+            :type cancel: dict
+            :param symbols: The symbols of the partition, None for all of them.
+            :type symbols: list
+        """
+        with engine.begin() as connection:
+            if not lease.check(connection):
+                logger.warning('The orders lock was lost before sweeping the orders.')
+                return
+            if cancel:
+                cancelled = cancel_orders(connection, db_schema, ids = cancel.get('ids'), symbols = cancel.get('symbols'), within = symbols)
+                logger.debug('Cancelled {orders} order(s).'.format(orders = cancelled))
+            if ttl > 0:
+                expired = expire_orders(connection, db_schema, self.current_stamp - ttl * 1000, within = symbols)
+                if expired > 0:
+                    logger.debug('Expired {orders} order(s) older than {ttl} seconds.'.format(orders = expired, ttl = ttl))
+
+    def _get_active_orders(self, lookahead, symbols = None):
         """
             Gets the necesary elements from the database to allow
             processing of orders. These elements are:
@@ -113,13 +204,21 @@ class BrokerSubscriber(Subscriber):
                 This means that an order that arrived at moment T will be
                 processed only after the T + lookahead moment.
             :type lookahead: int
+            :param symbols: The symbols of the partition, None for all of them.
+            :type symbols: list
             :return: A tuple containing the orders, the transactions,
                 the previosly used transactions and the budget, all as
                 dataframes.
             :rtype: tuple
         """
         order_stamp = self.current_stamp - lookahead * 1000
-        orders = pd.read_sql('select\
+        # a partitioned broker reads only the orders and the transactions of its symbols
+        if symbols is None:
+            within, within_params = ('', [])
+        else:
+            within, within_params = (' and\
+            symbol in :symbols', [bindparam('symbols', expanding = True)])
+        orders = pd.read_sql(text('select\
             id,\
             price,\
             symbol,\
@@ -129,15 +228,16 @@ class BrokerSubscriber(Subscriber):
         from\
             {tables.ORDERS}\
         where\
-            stamp <= %(stamp)s and\
-            status in %(status)s;'.format(tables = db_schema),
+            stamp <= :stamp and\
+            status in :status{within};'.format(tables = db_schema, within = within)).bindparams(bindparam('status', expanding = True), *within_params),
             con = engine,
             params = {
                 'stamp': order_stamp,
-                'status': [OrderStatus.PENDING, OrderStatus.PARTIAL]
+                'status': OrderStatus.ACTIVE,
+                'symbols': symbols
             }
         )
-        transactions = pd.read_sql('select\
+        transactions = pd.read_sql(text('select\
             id,\
             price,\
             symbol,\
@@ -146,38 +246,37 @@ class BrokerSubscriber(Subscriber):
         from\
             {tables.TRANSACTIONS}\
         where\
-            stamp > %(begin)s and\
-            stamp <= %(end)s;'.format(tables = db_schema),
-            con = engine,
-            params = {
-                'begin': order_stamp,
-                'end': self.current_stamp
-            }
-        )
-        used = pd.read_sql('select\
-            transaction,\
-            sum(volume) as volume\
-        from\
-            {tables.USED}\
-        where\
-            stamp > %(begin)s and\
-            stamp <= %(end)s\
-        group by\
-            transaction;'.format(tables = db_schema),
+            stamp > :begin and\
+            stamp <= :end{within};'.format(tables = db_schema, within = within)).bindparams(*within_params),
             con = engine,
             params = {
                 'begin': order_stamp,
-                'end': self.current_stamp
+                'end': self.current_stamp,
+                'symbols': symbols
             }
         )
+        # `transaction` is a keyword in SQLite, so the statement is built from
+        # the columns, which the dialect quotes as needed
+        used_table = db_schema.used
+        used_query = select([
+            used_table.c.transaction,
+            func.sum(used_table.c.volume).label('volume')
+        ]).where(
+            used_table.c.stamp > order_stamp
+        ).where(
+            used_table.c.stamp <= self.current_stamp
+        ).group_by(used_table.c.transaction)
+        if symbols is not None:
+            # and, for a partition, only the transactions of its symbols
+            used_query = used_query.select_from(
+                used_table.join(db_schema.transactions, used_table.c.transaction == db_schema.transactions.c.id)
+            ).where(db_schema.transactions.c.symbol.in_(symbols))
+        used = pd.read_sql(used_query, con = engine)
         budget = pd.read_sql('select\
             amount,\
             stamp\
         from\
-            {tables.BUDGET}\
-        order by\
-            stamp desc\
-        limit 1;'.format(tables = db_schema),
+            {tables.CURRENT_BUDGET};'.format(tables = db_schema),
             con = engine
         )
         if budget.shape[0] == 0:
@@ -221,186 +320,51 @@ class BrokerSubscriber(Subscriber):
             :param budget: A dataframe with one row, containing the budget amount and stamp.
             :type budget: pandas.DataFrame
             
-            :return: 
+            :return: A tuple with the new portfolio records, the used
+                transactions, the order updates and the new budget row.
+            :rtype: tuple
         """
-        
-        # create two containers that will hold new data:
-        # one for transactions used to fulfil curent orders
-        currently_used = pd.DataFrame(columns = [
-            'transaction',
-            'stamp',
-            'volume'
-        ])
-        # one for the orders fulfiled, that will be added to portfolio
-        # in an order, like in portfolio, the sign of the volume gives
-        # the type of the transaction: (minus) = buy, (plus) = sell
-        portfolio = pd.DataFrame(columns = [
-            'transaction',
-            'price',
-            'commission',
-            'symbol',
-            'stamp',
-            'volume'
-        ])
-        
-        transactions.sort_values(by = 'stamp')
-        
         # retrieve the budget amount
         budget_amount = budget['amount'].iloc[0]
-        # the variation of the budget amount
-        delta_budget = 0
-        # the total commission paid to fulfil current orders
-        commissions = 0
-        # a list of orders to update, contains
-        # dictionaries with order_id, volume and status
-        update_orders = []
-        
-        # prepare the commission
-        commission_value, commission_type = self._commission()
-        
-        # go through each of the orders
-        for _, order in orders.iterrows():
-            # retrieve the order symbol
-            symbol = order['symbol']
-            # get the proposed order volume
-            initial_volume = order['volume']
-            # set the remaining volume as a positive number
-            # from it, we'll substract each transaction that
-            # we can make
-            remaining_volume = abs(initial_volume)
-            # get the sign of the transaction
-            if initial_volume < 0.0:
-                volume_sign = -1.0 # this means buy
-            elif initial_volume > 0.0:
-                volume_sign = 1.0 # this means sell
-            else:
-                # if the volume is 0, go to the next order
-                continue
-            
-            # retrieve only the transactions that match current symbol
-            filtered = transactions[transactions['symbol'] == symbol]
-            # if we have none, go to the next order
-            if filtered.shape[0] < 1:
-                logger.debug('For symbol {symbol} there are no potential transactions.'.format(
-                    symbol = symbol
-                ))
-                continue
+        self.budget_amount = float(budget_amount)
+        self.delta_budget = 0.0
+        portfolio, currently_used, update_orders, delta_budget = match_orders(
+            orders,
+            transactions,
+            used,
+            budget_amount,
+            commission = self._commission(),
+            reserve = float(app_config.broker.reserve),
+            stamp = self.current_stamp,
+            logger = logger
+        )
+        self.delta_budget = float(delta_budget)
+        # the fills share the message stamp, so the ones of the same transaction
+        # (partly used by several orders) make one portfolio row, with the same sums
+        if portfolio.shape[0] > 0:
+            portfolio = portfolio.groupby('transaction', as_index = False, sort = False).agg({
+                'price': 'first',
+                'commission': 'sum',
+                'symbol': 'first',
+                'stamp': 'first',
+                'volume': 'sum'
+            })[portfolio.columns]
 
-            logger.debug('For symbol {symbol} there are {transactions} potential transactions.'.format(
-                symbol = symbol,
-                transactions = filtered.shape[0]
+        # clear the budget dataframe, so we won't push bad data to the database
+        budget = budget.iloc[0:0]
+        # if there are transactions made, even when no order update goes with them
+        if portfolio.shape[0] > 0:
+            budget_stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp())
+            # add a new row to the budget log
+            budget = budget.append({
+                'amount': budget_amount + delta_budget,
+                'time': datetime.datetime.utcfromtimestamp(budget_stamp),
+                'stamp': int(budget_stamp * 1000)
+            }, ignore_index = True)
+            logger.debug('Updating budget to {budget}.'.format(
+                budget = budget_amount + delta_budget
             ))
-            
-            # for each transaction mathing current symbol
-            for _, transaction in filtered.iterrows():
-                # check the used dataframe to see if we still have volume that we didn't use to fulfil orders
-                unavailable_volume = 0
-                if transaction['id'] in used['transaction'].values:
-                    unavailable_volume += used[used['transaction'] == transaction['id']]['volume'].sum()
-                if transaction['id'] in currently_used['transaction'].values:
-                    unavailable_volume += currently_used[currently_used['transaction'] == transaction['id']]['volume'].sum()
-                # the available volume is the difference
-                available_volume = transaction['volume'] - unavailable_volume
-                # if we don't have any unused volume, go to the next transaction
-                if available_volume <= 0:
-                    logger.warning('All the transactions for {symbol} were used. Skipping.'.format(
-                        symbol = symbol
-                    ))
-                    continue
-                # the volume we can use is the minimum volume between
-                # the one that we want to trade and the one that's available
-                used_volume = min(available_volume, remaining_volume)
-                logger.debug('Using {volume} for symbol {symbol} orders.'.format(
-                    symbol = symbol,
-                    volume = used_volume
-                ))
-                # compute the remaining volume
-                remaining_volume -= used_volume
-                
-                # get this moment in time
-                fulfil_stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp() * 1000)
-                
-                # compute the value of the volume traded
-                value = transaction['price'] * used_volume
-                # and the commission
-                commission = 0.0
-                if commission_type == 'fixed':
-                    commission = commission_value
-                elif commission_type == 'percent':
-                    commission = 0.01 * commission_value * value
-                commissions += commission
-                
-                # don't let a transaction consume all the budget
-                if budget_amount + delta_budget + volume_sign * value - commission < float(app_config.broker.reserve):
-                    # if this happens, the order won't be fulfiled and go to the next order
-                    logger.warning('Processing the order for {symbol} will consume the reserve. Skipping.'.format(
-                        symbol = symbol
-                    ))
-                    remaining_volume = abs(initial_volume)
-                    break
-                
-                # compute the variation in the budget
-                delta_budget += volume_sign * value - commission
-                
-                # add the used transaction to the records
-                currently_used = currently_used.append({
-                    'transaction': transaction['id'],
-                    'stamp': transaction['stamp'],
-                    'volume': used_volume
-                }, ignore_index = True)
-                
-                # add this order to the records
-                portfolio = portfolio.append({
-                    'transaction': transaction['id'],
-                    'price': transaction['price'],
-                    'commission': commission,
-                    'symbol': symbol,
-                    'stamp': fulfil_stamp,
-                    'volume': volume_sign * used_volume
-                }, ignore_index = True)
-                
-                # check if there's still some leftovers
-                if remaining_volume <= 0:
-                    # if not, go to the next order
-                    break
-            
-            # mark the order as fulfiled if there's no remaining volume
-            # actually, remaining volume cannot be a negative number!
-            if remaining_volume <= 0:
-                logger.debug('The {requested} orders for {symbol} were completely fulfiled.'.format(
-                    symbol = symbol,
-                    requested = initial_volume
-                ))
-                update_orders.append({'order_id': order['id'], 'status': OrderStatus.FULFILED, 'volume': 0})
-            # mark the order as pending if part of it was processed
-            elif remaining_volume < abs(initial_volume):
-                logger.debug('The orders for {symbol} were partially fulfiled {fulfiled} from {requested}.'.format(
-                    symbol = symbol,
-                    fulfiled = abs(initial_volume) - remaining_volume,
-                    requested = abs(initial_volume)
-                ))
-                update_orders.append({'order_id': order['id'], 'status': OrderStatus.PARTIAL, 'volume': volume_sign * remaining_volume})
-            else:
-                logger.debug('The {requested} orders for {symbol} were not fulfiled.'.format(
-                    symbol = symbol,
-                    requested = initial_volume
-                ))
-            
-            # clear the budget dataframe, so we won't push bad data to the database
-            budget = budget.iloc[0:0]
-            # if there are transactions made
-            if update_orders:
-                budget_stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp())
-                # add a new row to the budget log
-                budget = budget.append({
-                    'amount': budget_amount + delta_budget,
-                    'time': datetime.datetime.utcfromtimestamp(budget_stamp),
-                    'stamp': int(budget_stamp * 1000)
-                }, ignore_index = True)
-                logger.debug('Updating budget to {budget}.'.format(
-                    budget = budget_amount + delta_budget
-                ))
-                
+
         return (
             portfolio,
             currently_used,
@@ -408,20 +372,61 @@ class BrokerSubscriber(Subscriber):
             budget
         )
 
-    def _save_changes(self, portfolio, currently_used, update_orders, budget):
+    def _position_changes(self, portfolio):
+        """
+            Sums the new portfolio records by symbol, the way they will be added
+            to the positions table.
+
+            :param portfolio: A dataframe containing the new portfolio records.
+            :type portfolio: pandas.DataFrame
+            :return: A list of dicts with the symbol, value, volume, commission and stamp keys.
+            :rtype: list
+        """
+        changes = portfolio.assign(value = portfolio['price'] * portfolio['volume'])\
+            .groupby('symbol')\
+            .agg({'value': 'sum', 'volume': 'sum', 'commission': 'sum', 'stamp': 'max'})
+        return [{
+            'symbol': symbol,
+            'value': float(row['value']),
+            'volume': float(row['volume']),
+            'commission': float(row['commission']),
+            'stamp': int(row['stamp'])
+        } for symbol, row in changes.iterrows()]
+
+    def _is_applied(self, key):
         """
-            Save all the changes to the database.
+            Check if the fills of a message were already saved.
+
+            :param key: The idempotency key of the message.
+            :type key: str
+            :rtype: bool
+        """
+        with engine.connect() as connection:
+            return connection.execute(
+                select([func.count()]).select_from(db_schema.applied).where(db_schema.applied.c.key == key)
+            ).scalar() > 0
+
+    def _save_changes(self, key, portfolio, currently_used, update_orders, budget):
+        """
+            Save all the changes to the database, in one transaction, with one
+            prepared statement executed for all the rows of each table. The
+            message key is claimed in the same transaction, so the fills of a
+            redelivered message are not saved twice.
             
+            :param key: The idempotency key of the message.
+            :type key: str
             :param portfolio: A dataframe containing the new orders that will be registered in the portfolio.
             :type portfolio: pandas.DataFrame
             :param currently_used: A dataframe containg the transactions used to fulfil the new orders.
             :type currently_used: pandas.DataFrame
-            :param partial_orders: A list of order IDs for the orders that were partially processed.
-            :type partial_orders: list
-            :param fulfiled_orders: A list of order IDs for the orders that are completed.
-            :type fulfiled_orders: list
+            :param update_orders: A list of dicts with the order_id, status and volume of the updated orders.
+            :type update_orders: list
             :param budget: A dataframe with one row with the current budget, after transactions.
             :type budget: pandas.DataFrame
+            :return: False if the message was already applied, the lock was
+                lost or the fills would consume the reserve of the current
+                budget, True otherwise.
+            :rtype: bool
         """
         logger.debug('Adding {records} into portfolio.'.format(
             records = portfolio.shape[0]
@@ -431,45 +436,94 @@ class BrokerSubscriber(Subscriber):
         time_pos = portfolio.columns.get_loc('stamp') + 1
         portfolio.insert(time_pos, column = 'time', value = time_col)
 
-        portfolio.to_sql(
-            name = db_schema.PORTFOLIO,
-            con = engine,
-            if_exists = 'append',
-            index = False,
-            method = 'multi'
-        )
-        logger.debug('Adding {records} into used transactions.'.format(
-            records = currently_used.shape[0]
-        ))
-        currently_used.to_sql(
-            name = db_schema.USED,
-            con = engine,
-            if_exists = 'append',
-            index = False,
-            method = 'multi'
-        )
-        logger.debug('Adding {records} into budget.'.format(
-            records = budget.shape[0]
-        ))
-        budget.to_sql(
-            name = db_schema.BUDGET,
-            con = engine,
-            if_exists = 'append',
-            index = False,
-            method = 'multi'
-        )
-        logger.debug('Updating orders {update_orders} as partial orders.'.format(
-            update_orders = ','.join(str(order['order_id']) for order in update_orders)
-        ))
-        stmt = db_schema.orders.update()\
-            .where(db_schema.orders.c.id == bindparam('order_id'))\
-            .values(status = bindparam('status'), volume = bindparam('volume'))
-        engine.execute(stmt, update_orders)
+        # all the changes go in one transaction, so the ledger can't be left half written
+        with engine.begin() as connection:
+            # the fencing check: nobody took the lock since the orders were read
+            if not lease.check(connection):
+                logger.warning('The orders lock was lost while matching. Skipping the fills of the message {key}.'.format(key = key))
+                return False
+            # the brokers of the other partitions may have spent from the budget since it was
+            # read, so the reserve is checked again on the current amount, locked until commit
+            current_amount = connection.execute(text('select\
+                amount\
+            from\
+                {tables.CURRENT_BUDGET}{lock};'.format(tables = db_schema, lock = '' if is_sqlite(connection) else ' for update'))).scalar()
+            current_amount = self.budget_amount if current_amount is None else float(current_amount)
+            if self.delta_budget < 0 and current_amount + self.delta_budget < float(app_config.broker.reserve):
+                logger.warning('The fills of the message {key} would consume the reserve of the current budget {budget}. Leaving the orders for the next check.'.format(
+                    key = key,
+                    budget = current_amount
+                ))
+                return False
+            # the insert is ignored when the key is already there
+            claimed = connection.execute(db_schema.applied.insert(), {
+                'key': key,
+                'time': datetime.datetime.utcfromtimestamp(self.current_stamp // 1000),
+                'stamp': self.current_stamp
+            })
+            if claimed.rowcount < 1:
+                logger.warning('The fills of the message {key} were already saved. Skipping.'.format(key = key))
+                return False
+            portfolio_rows = _records(portfolio)
+            inserted = connection.execute(db_schema.portfolio.insert(), portfolio_rows)
+            if inserted.rowcount != len(portfolio_rows):
+                raise RuntimeError('Only {inserted} of the {records} fills of the message {key} were added to the portfolio.'.format(
+                    inserted = inserted.rowcount,
+                    records = len(portfolio_rows),
+                    key = key
+                ))
+            logger.debug('Adding {records} into positions.'.format(
+                records = portfolio['symbol'].nunique()
+            ))
+            upsert_positions(connection, db_schema, self._position_changes(portfolio))
+            logger.debug('Adding {records} into used transactions.'.format(
+                records = currently_used.shape[0]
+            ))
+            connection.execute(db_schema.used.insert(), _records(currently_used))
+            logger.debug('Adding {records} into budget.'.format(
+                records = budget.shape[0]
+            ))
+            if budget.shape[0] > 0:
+                # and the new amount is rebased on the current one
+                budget = budget.assign(amount = budget['amount'] + (current_amount - self.budget_amount))
+                budget_rows = _records(budget)
+                connection.execute(db_schema.budget.insert(), budget_rows)
+                set_current_budget(
+                    connection,
+                    db_schema,
+                    amount = float(budget_rows[-1]['amount']),
+                    stamp = int(budget_rows[-1]['stamp']),
+                    time = budget_rows[-1]['time']
+                )
+            logger.debug('Updating orders {update_orders} as partial orders.'.format(
+                update_orders = ','.join(str(order['order_id']) for order in update_orders)
+            ))
+            # the matching may fill an order partly and stop on the reserve, with no update to save
+            if update_orders:
+                stmt = db_schema.orders.update()\
+                    .where(db_schema.orders.c.id == bindparam('order_id'))\
+                    .values(status = bindparam('status'), volume = bindparam('volume'))
+                connection.execute(stmt, [{
+                    'order_id': int(order['order_id']),
+                    'status': int(order['status']),
+                    'volume': float(order['volume'])
+                } for order in update_orders])
+            # forget the keys of the messages too old to be redelivered
+            connection.execute(db_schema.applied.delete().where(db_schema.applied.c.stamp < self.current_stamp - APPLIED_TTL * 1000))
+        return True
     
     def on_message_callback(self, basic_delivery, properties, body):
         # received the check orders message. preprocessing it
         logger.debug('Received check orders message.')
         body_object = json.loads(body)
+        # a redelivered message has the same id (or, without one, the same body)
+        if properties is not None and properties.message_id:
+            key = str(properties.message_id)
+        else:
+            key = hashlib.sha1(body).hexdigest()
+        # the applied keys are shared by the partitions, which may get the same message
+        if partition is not None:
+            key = '{partition}:{key}'.format(partition = partition, key = key)
 
         if 'stamp' not in body_object:
             self.current_stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp() * 1000)
@@ -482,15 +536,35 @@ class BrokerSubscriber(Subscriber):
         else:
             lookahead = int(body_object['lookahead'])
         
-        if self._is_locked():
-            logger.warning('The orders were previously locked. Skipping.')
+        if 'ttl' not in body_object:
+            ttl = int(getattr(app_config.orders, 'ttl', 0))
+        else:
+            ttl = int(body_object['ttl'])
+
+        if not self._lock():
+            # the next check will match the orders anyway, but a cancel request is only sent once
+            if body_object.get('cancel'):
+                logger.warning('The orders are locked by another broker. Putting the cancel request back in the queue.')
+                raise RuntimeError('The orders are locked by another broker.')
+            logger.warning('The orders are locked by another broker. Skipping.')
             return
+        logger.debug('The orders are currently locked with token {token}.'.format(token = lease.token))
+
+        # a partitioned broker only touches the orders of its own symbols
+        symbols = self._owned_symbols()
+        if symbols is not None:
+            logger.debug('The partition {partition} holds {symbols} symbol(s) with active orders.'.format(partition = partition, symbols = len(symbols)))
+
+        # close the cancelled and the stale orders before matching the rest
+        self._sweep_orders(ttl, body_object.get('cancel'), symbols)
         
-        self._lock()
-        logger.debug('The orders are currently locked.')
-        
+        if self._is_applied(key):
+            logger.warning('The message {key} was already applied. Unlocking orders and skipping.'.format(key = key))
+            self._unlock()
+            return
+
         logger.debug('Retrieving the active orderds.')
-        orders = self._get_active_orders(lookahead)
+        orders = self._get_active_orders(lookahead, symbols)
         
         if orders[0].shape[0] < 1:
             logger.debug('No active orders right now. Unlocking orders and skipping.')
@@ -505,16 +579,33 @@ class BrokerSubscriber(Subscriber):
             self._unlock()
             return
             
+        if not self._is_locked():
+            logger.warning('The orders lock was lost while matching. Skipping.')
+            self._unlock()
+            return
+
         logger.debug('Saving changes.')
-        self._save_changes(*matched)
-        logger.debug('Unlocking orders.')
-        self._unlock()
+        try:
+            self._save_changes(key, *matched)
+        except Exception as error:
+            # a failed save is rolled back, and the subscriber puts the message back in the queue
+            logger.error('Saving the fills of the message {key} failed, it will be retried: {error}.'.format(key = key, error = error))
+            raise
+        finally:
+            logger.debug('Unlocking orders.')
+            self._unlock()
         
 # initialize the Rabbit MQ connection
 params = pika.ConnectionParameters(host='localhost')
 subscriber = BrokerSubscriber(params)
-subscriber['queue'] = 'orders_make'
-subscriber['routing_key'] = 'orders.make'
+if partition is None:
+    subscriber['queue'] = 'orders_make'
+    subscriber['routing_key'] = ORDERS_ROUTING_KEY
+else:
+    subscriber['queue'] = 'orders_make_{partition}'.format(partition = partition)
+    subscriber['routing_key'] = ring.routing_key(partition)
+# a message that failed (e.g. a save rolled back) goes back to the queue, to be retried
+subscriber['requeue'] = True
 logger.debug('Initialized the Rabbit MQ connection: queue = {queue} / routing key = {routing_key}.'.format(
     queue = subscriber['queue'],
     routing_key = subscriber['routing_key']
@@ -0,0 +1,17 @@
+from .archive import TickArchive
+from .buffer import TickBuffer
+from .estimator import TrendEstimator
+from .indicators import IndicatorSet, SymbolIndicators
+from .tape import MarketTape
+from . import indicators, statistics
+
+__all__ = [
+    'TickArchive',
+    'TickBuffer',
+    'TrendEstimator',
+    'IndicatorSet',
+    'SymbolIndicators',
+    'MarketTape',
+    'indicators',
+    'statistics'
+]
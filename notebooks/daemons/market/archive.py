@@ -0,0 +1,200 @@
+import datetime
+import numpy as np
+import os
+import pandas as pd
+from pathlib import Path
+from sqlalchemy import text
+from urllib.parse import quote, unquote
+
+class TickArchive:
+    """
+        Columnar on-disk archive for the `transactions` table. Each symbol and
+        each (UTC) day gets its own directory, holding one raw NumPy file per
+        column, with rows sorted by stamp:
+            <path>/<symbol>/<YYYY-MM-DD>/{id,stamp,price,volume}.npy
+        The files are memory-mapped when read, so a symbol and time range is
+        served as arrays without going through SQL or row conversion.
+    """
+    COLUMNS = {
+        'id': np.int64,
+        'stamp': np.int64,
+        'price': np.float64,
+        'volume': np.float64
+    }
+    DAY_FORMAT = '%Y-%m-%d'
+    DONE_DIR = '.archived'
+
+    def __init__(self, path):
+        if isinstance(path, str):
+            path = Path(path).absolute()
+        if not isinstance(path, Path):
+            raise NotImplementedError('The parameter path should be a string or a Path like object, {} provided.'.format(type(path)))
+        self.path = path
+
+    @staticmethod
+    def _day_bounds(day):
+        """
+            Returns the [begin, end) stamps, in milliseconds, for an UTC day.
+        """
+        begin = datetime.datetime(day.year, day.month, day.day, tzinfo = datetime.timezone.utc)
+        end = begin + datetime.timedelta(days = 1)
+        return (
+            int(begin.timestamp() * 1000),
+            int(end.timestamp() * 1000)
+        )
+
+    def _symbol_path(self, symbol):
+        # symbols look like EXCHANGE:PAIR, so quote them to get a safe directory name
+        return self.path / quote(symbol, safe = '')
+
+    def _day_path(self, symbol, day):
+        return self._symbol_path(symbol) / day.strftime(self.DAY_FORMAT)
+
+    def is_archived(self, day):
+        """
+            Check if a day was completely exported to the archive.
+
+            :param day: The UTC day.
+            :type day: datetime.date
+            :rtype: bool
+        """
+        return (self.path / self.DONE_DIR / day.strftime(self.DAY_FORMAT)).is_file()
+
+    def symbols(self):
+        """
+            :return: The list of symbols found in the archive.
+            :rtype: list
+        """
+        if not self.path.is_dir():
+            return []
+        return sorted(unquote(item.name) for item in self.path.iterdir() if item.is_dir() and item.name != self.DONE_DIR)
+
+    def days(self, symbol):
+        """
+            :param symbol: The symbol name.
+            :type symbol: str
+            :return: The sorted list of days archived for a symbol.
+            :rtype: list
+        """
+        symbol_path = self._symbol_path(symbol)
+        if not symbol_path.is_dir():
+            return []
+        return sorted(datetime.datetime.strptime(item.name, self.DAY_FORMAT).date() for item in symbol_path.iterdir() if item.is_dir())
+
+    def write(self, symbol, day, columns):
+        """
+            Writes the columns for a symbol and a day. The rows are sorted by
+            stamp and each file is first written to a temporary name and then
+            moved in place, so readers never see a partially written column.
+
+            :param symbol: The symbol name.
+            :type symbol: str
+            :param day: The UTC day.
+            :type day: datetime.date
+            :param columns: A dict-like object (or dataframe) with the id, stamp,
+                price and volume columns.
+            :type columns: dict
+        """
+        order = np.argsort(np.asarray(columns['stamp'], dtype = np.int64), kind = 'stable')
+        day_path = self._day_path(symbol, day)
+        day_path.mkdir(parents = True, exist_ok = True)
+        for name, dtype in self.COLUMNS.items():
+            column_path = day_path / (name + '.npy')
+            temp_path = day_path / (name + '.tmp.npy')
+            np.save(temp_path, np.asarray(columns[name], dtype = dtype)[order])
+            os.replace(temp_path, column_path)
+
+    def export_day(self, engine, db_schema, day):
+        """
+            Exports all the transactions from an UTC day into the archive and
+            marks the day as archived.
+
+            :param engine: The SQLAlchemy engine.
+            :type engine: sqlalchemy.engine.Engine
+            :param db_schema: The database schema.
+            :type db_schema: db.DatabaseSchema
+            :param day: The UTC day.
+            :type day: datetime.date
+            :return: The number of exported transactions.
+            :rtype: int
+        """
+        begin_stamp, end_stamp = self._day_bounds(day)
+        transactions = pd.read_sql(text('select\
+            id,\
+            price,\
+            symbol,\
+            stamp,\
+            volume\
+        from\
+            {tables.TRANSACTIONS}\
+        where\
+            stamp >= :begin and\
+            stamp < :end\
+        order by\
+            symbol,\
+            stamp;'.format(tables = db_schema)),
+            con = engine,
+            params = {
+                'begin': begin_stamp,
+                'end': end_stamp
+            }
+        )
+        for symbol, symbol_transactions in transactions.groupby('symbol', sort = False):
+            self.write(symbol, day, symbol_transactions)
+
+        done_path = self.path / self.DONE_DIR
+        done_path.mkdir(parents = True, exist_ok = True)
+        (done_path / day.strftime(self.DAY_FORMAT)).touch()
+
+        return transactions.shape[0]
+
+    def _load_day(self, symbol, day, columns):
+        day_path = self._day_path(symbol, day)
+        return {name: np.load(day_path / (name + '.npy'), mmap_mode = 'r') for name in set(columns) | {'stamp'}}
+
+    def read(self, symbol, begin_stamp, end_stamp, columns = ('stamp', 'price', 'volume')):
+        """
+            Reads the archived transactions of a symbol with the stamp in the
+            [begin_stamp, end_stamp) interval. When the interval fits in one
+            day, the returned arrays are read-only views on the memory-mapped
+            files; otherwise the per-day slices are concatenated.
+
+            :param symbol: The symbol name.
+            :type symbol: str
+            :param begin_stamp: The first stamp, in milliseconds (inclusive).
+            :type begin_stamp: int
+            :param end_stamp: The last stamp, in milliseconds (exclusive).
+            :type end_stamp: int
+            :param columns: The columns to read.
+            :type columns: tuple
+            :return: A dict with a NumPy array for each requested column.
+            :rtype: dict
+        """
+        first_day = datetime.datetime.fromtimestamp(begin_stamp // 1000, tz = datetime.timezone.utc).date()
+        last_day = datetime.datetime.fromtimestamp((end_stamp - 1) // 1000, tz = datetime.timezone.utc).date()
+
+        slices = []
+        for day in self.days(symbol):
+            if day < first_day or day > last_day:
+                continue
+            day_columns = self._load_day(symbol, day, columns)
+            begin, end = np.searchsorted(day_columns['stamp'], [begin_stamp, end_stamp], side = 'left')
+            if end > begin:
+                slices.append({name: day_columns[name][begin:end] for name in columns})
+
+        if len(slices) == 1:
+            return slices[0]
+        if len(slices) == 0:
+            return {name: np.empty(0, dtype = self.COLUMNS[name]) for name in columns}
+        return {name: np.concatenate([item[name] for item in slices]) for name in columns}
+
+    def read_frame(self, symbol, begin_stamp, end_stamp, columns = ('id', 'stamp', 'price', 'volume')):
+        """
+            Same as read, but wraps the arrays in a dataframe with a symbol
+            column, shaped like the `transactions` table.
+
+            :rtype: pandas.DataFrame
+        """
+        frame = pd.DataFrame(self.read(symbol, begin_stamp, end_stamp, columns), copy = False)
+        frame.insert(0, 'symbol', symbol)
+        return frame
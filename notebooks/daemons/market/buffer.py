@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+import threading
+from . import statistics
+
+class SymbolTicks:
+    """
+        The ticks of one symbol, kept sorted by stamp in NumPy arrays that grow
+        by doubling. Old ticks are dropped by moving the start offset, and the
+        arrays are compacted only when the dropped part gets large.
+    """
+    COLUMNS = {
+        'id': np.int64,
+        'stamp': np.int64,
+        'price': np.float64,
+        'volume': np.float64
+    }
+
+    def __init__(self, capacity = 1024):
+        self.columns = {name: np.empty(capacity, dtype = dtype) for name, dtype in self.COLUMNS.items()}
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def _reserve(self, size):
+        capacity = self.columns['stamp'].shape[0]
+        if self.end + size <= capacity:
+            return
+        count = len(self)
+        # compact first, and grow only if it's still not enough room
+        if count + size > capacity // 2:
+            capacity = max(2 * capacity, count + size)
+        for name, column in self.columns.items():
+            grown = np.empty(capacity, dtype = column.dtype)
+            grown[:count] = column[self.start:self.end]
+            self.columns[name] = grown
+        self.start = 0
+        self.end = count
+
+    def append(self, ids, stamps, prices, volumes):
+        """
+            Appends a batch of ticks. When the batch is not newer than the
+            ticks already held, the whole symbol is sorted again by stamp.
+        """
+        size = stamps.shape[0]
+        if size < 1:
+            return
+        self._reserve(size)
+        out_of_order = len(self) > 0 and stamps.min() < self.columns['stamp'][self.end - 1]
+        for name, values in (('id', ids), ('stamp', stamps), ('price', prices), ('volume', volumes)):
+            self.columns[name][self.end:self.end + size] = values
+        self.end += size
+        if out_of_order or np.any(np.diff(stamps) < 0):
+            order = np.argsort(self.columns['stamp'][self.start:self.end], kind = 'stable')
+            for name, column in self.columns.items():
+                column[self.start:self.end] = column[self.start:self.end][order]
+
+    def trim(self, stamp):
+        """
+            Drops the ticks older than stamp.
+        """
+        self.start += int(np.searchsorted(self.columns['stamp'][self.start:self.end], stamp, side = 'left'))
+
+    def slice(self, begin_stamp, end_stamp):
+        """
+            :return: A dict with views on the columns for the ticks with the
+                stamp in [begin_stamp, end_stamp).
+            :rtype: dict
+        """
+        stamps = self.columns['stamp'][self.start:self.end]
+        begin, end = np.searchsorted(stamps, [begin_stamp, end_stamp], side = 'left')
+        return {name: column[self.start + begin:self.start + end] for name, column in self.columns.items()}
+
+class TickBuffer:
+    """
+        In-memory, time-indexed window of the `transactions` table, one
+        SymbolTicks per symbol. It's warmed once from the database and then
+        extended with only the rows added since, tracked by the highest id
+        seen (ids grow with the inserts, while stamps may arrive late).
+        Requests for windows starting after `since` can then be served from
+        memory, through NumPy slicing.
+    """
+    def __init__(self, retention):
+        """
+            :param retention: The number of milliseconds of ticks to keep.
+            :type retention: int
+        """
+        self.retention = int(retention)
+        self.high_water = -1
+        self.since = None
+        self.symbols = {}
+        self.lock = threading.Lock()
+
+    def covers(self, begin_stamp):
+        """
+            Check if the window starting at begin_stamp can be served from memory.
+        """
+        return self.since is not None and begin_stamp >= self.since
+
+    def extend(self, transactions, stamp):
+        """
+            Adds the new transactions to the buffer and drops the ones older
+            than the retention, relative to stamp.
+
+            :param transactions: A dataframe with the id, price, symbol, stamp and volume columns.
+            :type transactions: pandas.DataFrame
+            :param stamp: The current stamp, in milliseconds.
+            :type stamp: int
+        """
+        since = stamp - self.retention
+        with self.lock:
+            if self.since is None or since > self.since:
+                self.since = since
+            # concurrent refreshes may read the same rows, so keep only the unseen ones
+            transactions = transactions[transactions['id'] > self.high_water]
+            if transactions.shape[0] > 0:
+                self.high_water = int(transactions['id'].max())
+                transactions = transactions[transactions['stamp'] >= self.since]
+            for symbol, group in transactions.groupby('symbol', sort = False):
+                if symbol not in self.symbols:
+                    self.symbols[symbol] = SymbolTicks()
+                self.symbols[symbol].append(
+                    group['id'].values.astype(np.int64),
+                    group['stamp'].values.astype(np.int64),
+                    group['price'].values.astype(np.float64),
+                    group['volume'].values.astype(np.float64)
+                )
+            for symbol in list(self.symbols):
+                self.symbols[symbol].trim(self.since)
+                if len(self.symbols[symbol]) == 0:
+                    del self.symbols[symbol]
+
+    def transactions(self, begin_stamp, end_stamp):
+        """
+            :return: A dataframe with the id, price, symbol, stamp and volume
+                columns for the ticks with the stamp in [begin_stamp, end_stamp),
+                like the one read from the database.
+            :rtype: pandas.DataFrame
+        """
+        with self.lock:
+            frames = []
+            for symbol, ticks in self.symbols.items():
+                window = ticks.slice(begin_stamp, end_stamp)
+                if window['stamp'].shape[0] > 0:
+                    frames.append(pd.DataFrame({
+                        'id': window['id'],
+                        'price': window['price'],
+                        'symbol': symbol,
+                        'stamp': window['stamp'],
+                        'volume': window['volume']
+                    }))
+        if len(frames) == 0:
+            return pd.DataFrame(columns = ['id', 'price', 'symbol', 'stamp', 'volume'])
+        return pd.concat(frames, ignore_index = True)
+
+    def statistics(self, begin_stamp, end_stamp):
+        """
+            :return: A dataframe with the market.statistics.COLUMNS columns for
+                the ticks with the stamp in [begin_stamp, end_stamp), with the
+                hours measured from begin_stamp.
+            :rtype: pandas.DataFrame
+        """
+        with self.lock:
+            rows = []
+            for symbol, ticks in self.symbols.items():
+                window = ticks.slice(begin_stamp, end_stamp)
+                if window['stamp'].shape[0] > 0:
+                    rows.append(statistics.from_arrays(symbol, window['stamp'], window['price'], window['volume'], begin_stamp))
+        return pd.DataFrame(rows, columns = statistics.COLUMNS)
@@ -0,0 +1,281 @@
+import numpy as np
+import os
+import pandas as pd
+import threading
+from pathlib import Path
+from . import statistics
+from .buffer import SymbolTicks
+
+# the order of the running sums kept for each symbol
+SUMS = [
+    'count',
+    'sum_hours',
+    'sum_volume',
+    'sum_hours_hours',
+    'sum_hours_volume',
+    'sum_volume_volume',
+    'sum_price',
+    'sum_hours_price',
+    'sum_volume_price'
+]
+
+class SymbolEstimate:
+    """
+        The running regression sums of one symbol, with the ticks they were
+        built from. The first `count` ticks (by stamp) are the ones in the
+        window and in the sums, the rest are newer than the window end and
+        wait to be added.
+    """
+    def __init__(self):
+        self.ticks = SymbolTicks()
+        self.sums = np.zeros(len(SUMS))
+        self.count = 0
+
+    def stamps(self):
+        return self.ticks.columns['stamp'][self.ticks.start:self.ticks.end]
+
+class TrendEstimator:
+    """
+        Online estimator of the trend regression of price on (1, hours, volume)
+        over a sliding window [end - window, end). Instead of refitting on the
+        whole window, it keeps the normal equation sums of each symbol: a new
+        tick is added to them once the window end passes it, and subtracted
+        when it leaves the window, so a trend query costs O(1) per symbol.
+        With a half life, the ticks are also weighted by
+        2 ^ -((end - stamp) / half_life), so the recent ones count more.
+        The state can be saved to and loaded from a snapshot file, so a restart
+        only reads the transactions inserted since the snapshot.
+    """
+    def __init__(self, window, half_life = None):
+        """
+            :param window: The window length, in milliseconds.
+            :type window: int
+            :param half_life: The half life of the tick weights, in
+                milliseconds, or None to weight all the ticks the same.
+            :type half_life: int
+        """
+        self.window = int(window)
+        self.half_life = float(half_life) if half_life else None
+        self.origin = None
+        self.end = None
+        self.high_water = -1
+        self.symbols = {}
+        self.lock = threading.Lock()
+
+    def _terms(self, stamps, prices, volumes):
+        """
+            Computes the contribution of some ticks to the running sums.
+        """
+        hours = (stamps - self.origin) / statistics.HOUR
+        if self.half_life is None:
+            weights = np.ones(stamps.shape[0])
+        else:
+            weights = np.exp2(-(self.end - stamps) / self.half_life)
+        return np.array([
+            weights.sum(),
+            np.dot(weights, hours),
+            np.dot(weights, volumes),
+            np.dot(weights, hours * hours),
+            np.dot(weights, hours * volumes),
+            np.dot(weights, volumes * volumes),
+            np.dot(weights, prices),
+            np.dot(weights, hours * prices),
+            np.dot(weights, volumes * prices)
+        ])
+
+    def _range_terms(self, estimate, begin, end):
+        columns = estimate.ticks.columns
+        start = estimate.ticks.start
+        return self._terms(
+            columns['stamp'][start + begin:start + end],
+            columns['price'][start + begin:start + end],
+            columns['volume'][start + begin:start + end]
+        )
+
+    def _rebase(self, origin):
+        """
+            Moves the origin of the hours, shifting the sums accordingly, so
+            the hours stay small as the window slides.
+        """
+        shift = (origin - self.origin) / statistics.HOUR
+        for estimate in self.symbols.values():
+            weight, h, v, hh, hv, vv, p, hp, vp = estimate.sums
+            estimate.sums = np.array([
+                weight,
+                h - shift * weight,
+                v,
+                hh - 2 * shift * h + shift * shift * weight,
+                hv - shift * v,
+                vv,
+                p,
+                hp - shift * p,
+                vp
+            ])
+        self.origin = origin
+
+    def update(self, transactions):
+        """
+            Adds the new transactions, the ones with an id above the highest
+            id seen. The ticks inside the current window are added to the sums
+            right away, the newer ones once the window end passes them.
+
+            :param transactions: A dataframe with the id, price, symbol, stamp and volume columns.
+            :type transactions: pandas.DataFrame
+        """
+        with self.lock:
+            transactions = transactions[transactions['id'] > self.high_water]
+            if transactions.shape[0] < 1:
+                return
+            self.high_water = int(transactions['id'].max())
+            if self.end is not None:
+                transactions = transactions[transactions['stamp'] >= self.end - self.window]
+            for symbol, group in transactions.groupby('symbol', sort = False):
+                if symbol not in self.symbols:
+                    self.symbols[symbol] = SymbolEstimate()
+                estimate = self.symbols[symbol]
+                stamps = group['stamp'].values.astype(np.int64)
+                prices = group['price'].values.astype(np.float64)
+                volumes = group['volume'].values.astype(np.float64)
+                if self.end is not None:
+                    # the late ticks fall inside the window, so they count now
+                    late = stamps < self.end
+                    if np.any(late):
+                        estimate.sums += self._terms(stamps[late], prices[late], volumes[late])
+                estimate.ticks.append(group['id'].values.astype(np.int64), stamps, prices, volumes)
+                if self.end is not None:
+                    estimate.count = int(np.searchsorted(estimate.stamps(), self.end, side = 'left'))
+
+    def advance(self, end):
+        """
+            Slides the window to [end - window, end): the ticks passed by the
+            end are added to the sums and the ones before the begin are
+            subtracted. The window only moves forward.
+
+            :param end: The new window end, in milliseconds.
+            :type end: int
+            :return: False if the end is before the current one, True otherwise.
+            :rtype: bool
+        """
+        with self.lock:
+            return self._advance(end)
+
+    def _advance(self, end):
+        if self.end is not None and end < self.end:
+            return False
+        if self.half_life is not None and self.end is not None:
+            decay = np.exp2(-(end - self.end) / self.half_life)
+            for estimate in self.symbols.values():
+                estimate.sums *= decay
+        self.end = end
+        begin = end - self.window
+        if self.origin is None:
+            self.origin = begin
+        elif begin - self.origin > self.window:
+            self._rebase(begin)
+        for symbol in list(self.symbols):
+            estimate = self.symbols[symbol]
+            stamps = estimate.stamps()
+            added = int(np.searchsorted(stamps, end, side = 'left'))
+            removed = int(np.searchsorted(stamps, begin, side = 'left'))
+            if added > estimate.count:
+                estimate.sums += self._range_terms(estimate, estimate.count, added)
+            if removed > 0:
+                estimate.sums -= self._range_terms(estimate, 0, removed)
+                estimate.ticks.trim(begin)
+            estimate.count = added - removed
+            if estimate.count == 0:
+                # don't carry the rounding errors of the subtractions
+                estimate.sums[:] = 0
+                if len(estimate.ticks) == 0:
+                    del self.symbols[symbol]
+        return True
+
+    def statistics(self, end):
+        """
+            Slides the window to end and returns its regression sums.
+
+            :param end: The window end, in milliseconds.
+            :type end: int
+            :return: A tuple with a dataframe with the market.statistics.COLUMNS
+                columns (with decay, count is the sum of the weights, while
+                ticks is still the number of ticks) and the
+                origin of the hours, or None if the window can't move to end.
+            :rtype: tuple
+        """
+        with self.lock:
+            if not self._advance(end):
+                return None
+            rows = []
+            for symbol, estimate in self.symbols.items():
+                if estimate.count < 1:
+                    continue
+                stamps = estimate.stamps()
+                row = dict(zip(SUMS, estimate.sums))
+                row['symbol'] = symbol
+                row['ticks'] = estimate.count
+                row['first_stamp'] = int(stamps[0])
+                row['last_stamp'] = int(stamps[estimate.count - 1])
+                rows.append(row)
+            return (
+                pd.DataFrame(rows, columns = statistics.COLUMNS),
+                self.origin
+            )
+
+    def save(self, path):
+        """
+            Writes the estimator state to a snapshot file, atomically.
+
+            :param path: The snapshot file path.
+            :type path: str
+        """
+        path = Path(path)
+        with self.lock:
+            symbols = list(self.symbols)
+            estimates = [self.symbols[symbol] for symbol in symbols]
+            state = {
+                'settings': np.array([
+                    self.window,
+                    np.nan if self.half_life is None else self.half_life,
+                    np.nan if self.origin is None else self.origin,
+                    np.nan if self.end is None else self.end,
+                    self.high_water
+                ], dtype = np.float64),
+                'symbols': np.array(symbols, dtype = str),
+                'sums': np.array([estimate.sums for estimate in estimates]).reshape(-1, len(SUMS)),
+                'counts': np.array([estimate.count for estimate in estimates], dtype = np.int64),
+                'lengths': np.array([len(estimate.ticks) for estimate in estimates], dtype = np.int64)
+            }
+            for name, dtype in SymbolTicks.COLUMNS.items():
+                state[name] = np.concatenate([
+                    estimate.ticks.columns[name][estimate.ticks.start:estimate.ticks.end] for estimate in estimates
+                ] + [np.empty(0, dtype = dtype)])
+        path.parent.mkdir(parents = True, exist_ok = True)
+        temp_path = path.with_name(path.name + '.tmp')
+        with open(temp_path, 'wb') as snapshot_file:
+            np.savez(snapshot_file, **state)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+            Reads an estimator from a snapshot file written by save.
+
+            :param path: The snapshot file path.
+            :type path: str
+            :rtype: TrendEstimator
+        """
+        with np.load(path) as state:
+            window, half_life, origin, end, high_water = state['settings']
+            estimator = cls(window, None if np.isnan(half_life) else half_life)
+            estimator.origin = None if np.isnan(origin) else int(origin)
+            estimator.end = None if np.isnan(end) else int(end)
+            estimator.high_water = int(high_water)
+            offsets = np.concatenate([[0], np.cumsum(state['lengths'])])
+            for index, symbol in enumerate(state['symbols']):
+                estimate = SymbolEstimate()
+                begin, end = offsets[index], offsets[index + 1]
+                estimate.ticks.append(*[state[name][begin:end] for name in SymbolTicks.COLUMNS])
+                estimate.sums = state['sums'][index].copy()
+                estimate.count = int(state['counts'][index])
+                estimator.symbols[str(symbol)] = estimate
+        return estimator
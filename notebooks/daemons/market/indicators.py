@@ -0,0 +1,370 @@
+import collections
+import math
+import numpy as np
+import pandas as pd
+from .statistics import group_symbols
+
+# the columns of the indicators frames, one row per symbol
+COLUMNS = [
+    'symbol',
+    'stamp',
+    'ema',
+    'vwap',
+    'volatility',
+    'rsi',
+    'zscore'
+]
+
+def _smooth(values, alpha, seed):
+    """
+        Computes y[i] = (1 - alpha) * y[i - 1] + alpha * values[i], with
+        y[-1] = seed, without a Python loop. Unrolled, y[i] is a sum of the
+        values weighted by powers of (1 - alpha), which is a cumulative sum
+        once the weights are divided out; the values are taken in blocks short
+        enough for the divided weights to stay well within float precision.
+    """
+    result = np.empty(values.shape[0], dtype = np.float64)
+    decay = 1.0 - alpha
+    if decay <= 0.0:
+        result[:] = values
+        return result
+    block = values.shape[0] if decay >= 1.0 else max(1, int(27.0 / -math.log(decay)))
+    for begin in range(0, values.shape[0], block):
+        chunk = values[begin:begin + block]
+        powers = decay ** np.arange(1, chunk.shape[0] + 1)
+        result[begin:begin + chunk.shape[0]] = powers * (seed + np.cumsum(alpha * chunk / powers))
+        seed = result[begin + chunk.shape[0] - 1]
+    return result
+
+def _rolling_sum(values, window):
+    """
+        The sums of the last window values, NaN until there are window values.
+    """
+    result = np.full(values.shape[0], np.nan)
+    if values.shape[0] >= window:
+        sums = np.cumsum(np.concatenate([[0.0], values]))
+        result[window - 1:] = sums[window:] - sums[:-window]
+    return result
+
+def _rolling_moments(values, window):
+    """
+        The means and the standard deviations of the last window values. The
+        values are shifted by the first one, so the sums of squares stay small.
+    """
+    shifted = values - values[0] if values.shape[0] > 0 else values
+    means = _rolling_sum(shifted, window) / window
+    variances = _rolling_sum(shifted * shifted, window) / window - means * means
+    return (
+        means + (values[0] if values.shape[0] > 0 else 0.0),
+        np.sqrt(np.maximum(variances, 0.0))
+    )
+
+def ema(values, span):
+    """
+        The exponential moving average, seeded with the first value.
+
+        :param values: The values, e.g. the prices of one symbol, by stamp.
+        :type values: numpy.ndarray
+        :param span: The span, the smoothing factor is 2 / (span + 1).
+        :type span: int
+        :rtype: numpy.ndarray
+    """
+    values = np.asarray(values, dtype = np.float64)
+    if values.shape[0] < 1:
+        return values.copy()
+    return _smooth(values, 2.0 / (span + 1.0), values[0])
+
+def vwap(prices, volumes, window = None):
+    """
+        The volume weighted average price, over all the ticks so far or over
+        the last window ticks. It's NaN where there's no volume.
+
+        :param prices: The prices of one symbol, by stamp.
+        :type prices: numpy.ndarray
+        :param volumes: The volumes of the same ticks.
+        :type volumes: numpy.ndarray
+        :param window: The number of ticks, or None for all of them.
+        :type window: int
+        :rtype: numpy.ndarray
+    """
+    prices = np.asarray(prices, dtype = np.float64)
+    volumes = np.abs(np.asarray(volumes, dtype = np.float64))
+    if window is None:
+        values = np.cumsum(prices * volumes)
+        weights = np.cumsum(volumes)
+    else:
+        values = _rolling_sum(prices * volumes, window)
+        weights = _rolling_sum(volumes, window)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        return np.where(weights > 0, values / weights, np.nan)
+
+def volatility(prices, window):
+    """
+        The standard deviation of the log returns over the last window returns,
+        NaN until there are window returns.
+
+        :param prices: The prices of one symbol, by stamp.
+        :type prices: numpy.ndarray
+        :param window: The number of returns.
+        :type window: int
+        :rtype: numpy.ndarray
+    """
+    prices = np.asarray(prices, dtype = np.float64)
+    result = np.full(prices.shape[0], np.nan)
+    if prices.shape[0] > 1:
+        _, deviations = _rolling_moments(np.diff(np.log(prices)), window)
+        result[1:] = deviations
+    return result
+
+def rsi(prices, period):
+    """
+        The relative strength index, with Wilder's smoothing: the average gain
+        and loss start as the means of the first period changes, then each
+        change is weighted by 1 / period. It's NaN until there are period
+        changes.
+
+        :param prices: The prices of one symbol, by stamp.
+        :type prices: numpy.ndarray
+        :param period: The number of changes.
+        :type period: int
+        :rtype: numpy.ndarray
+    """
+    prices = np.asarray(prices, dtype = np.float64)
+    result = np.full(prices.shape[0], np.nan)
+    if prices.shape[0] <= period:
+        return result
+    changes = np.diff(prices)
+    gains = np.maximum(changes, 0.0)
+    losses = np.maximum(-changes, 0.0)
+    average_gain = np.empty(changes.shape[0] - period + 1)
+    average_loss = np.empty(changes.shape[0] - period + 1)
+    average_gain[0] = gains[:period].mean()
+    average_loss[0] = losses[:period].mean()
+    average_gain[1:] = _smooth(gains[period:], 1.0 / period, average_gain[0])
+    average_loss[1:] = _smooth(losses[period:], 1.0 / period, average_loss[0])
+    result[period:] = _strength(average_gain, average_loss)
+    return result
+
+def _strength(average_gain, average_loss):
+    total = average_gain + average_loss
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        return np.where(total > 0, 100.0 * average_gain / total, 50.0)
+
+def zscore(values, window):
+    """
+        How many standard deviations each value is from the mean of the last
+        window values (itself included), NaN until there are window values or
+        when the values didn't move.
+
+        :param values: The values, e.g. the prices of one symbol, by stamp.
+        :type values: numpy.ndarray
+        :param window: The number of values.
+        :type window: int
+        :rtype: numpy.ndarray
+    """
+    values = np.asarray(values, dtype = np.float64)
+    means, deviations = _rolling_moments(values, window)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        return np.where(deviations > 0, (values - means) / deviations, np.nan)
+
+def from_transactions(transactions, span = 20, window = 20, period = 14):
+    """
+        Computes the latest indicators of every symbol over a window of
+        transactions, with the batch functions; the rows are sorted once by
+        symbol, then by stamp.
+
+        :param transactions: A dataframe with the price, symbol, stamp and volume columns.
+        :type transactions: pandas.DataFrame
+        :return: A dataframe with the COLUMNS columns.
+        :rtype: pandas.DataFrame
+    """
+    if transactions.shape[0] < 1:
+        return pd.DataFrame(columns = COLUMNS)
+    transactions = transactions.sort_values('stamp', kind = 'stable')
+    order, symbols, starts = group_symbols(transactions['symbol'].values)
+    stamps = transactions['stamp'].values[order]
+    prices = transactions['price'].values.astype(np.float64)[order]
+    volumes = transactions['volume'].values.astype(np.float64)[order]
+    ends = np.append(starts[1:], order.shape[0])
+    rows = []
+    for symbol, begin, end in zip(symbols, starts, ends):
+        symbol_prices = prices[begin:end]
+        rows.append({
+            'symbol': symbol,
+            'stamp': int(stamps[end - 1]),
+            'ema': ema(symbol_prices, span)[-1],
+            'vwap': vwap(symbol_prices[-window:], volumes[begin:end][-window:])[-1],
+            'volatility': volatility(symbol_prices[-window - 1:], window)[-1],
+            'rsi': rsi(symbol_prices, period)[-1],
+            'zscore': zscore(symbol_prices[-window:], window)[-1]
+        })
+    return pd.DataFrame(rows, columns = COLUMNS)
+
+class _RollingMoments:
+    """
+        The running sum and sum of squares of the last window values. They're
+        recomputed from the values once every window updates, so the
+        subtractions don't accumulate rounding errors, which keeps the update
+        O(1) amortized.
+    """
+    def __init__(self, window):
+        self.window = window
+        self.values = collections.deque(maxlen = window)
+        self.shift = None
+        self.total = 0.0
+        self.squares = 0.0
+        self.updates = 0
+
+    def update(self, value):
+        if self.shift is None:
+            self.shift = value
+        value -= self.shift
+        if len(self.values) == self.window:
+            oldest = self.values[0]
+            self.total -= oldest
+            self.squares -= oldest * oldest
+        self.values.append(value)
+        self.total += value
+        self.squares += value * value
+        self.updates += 1
+        if self.updates % self.window == 0:
+            self.total = math.fsum(self.values)
+            self.squares = math.fsum(value * value for value in self.values)
+
+    def moments(self):
+        if len(self.values) < self.window:
+            return (np.nan, np.nan)
+        mean = self.total / self.window
+        return (
+            mean + self.shift,
+            math.sqrt(max(self.squares / self.window - mean * mean, 0.0))
+        )
+
+class SymbolIndicators:
+    """
+        The indicators of one symbol, updated tick by tick in O(1): each tick
+        moves the running averages and sums instead of scanning the window
+        again. The values match the last values of the batch functions over
+        the same ticks.
+    """
+    def __init__(self, span = 20, window = 20, period = 14):
+        """
+            :param span: The span of the exponential moving average.
+            :type span: int
+            :param window: The number of ticks of the VWAP, the volatility and the z-score.
+            :type window: int
+            :param period: The number of changes of the RSI.
+            :type period: int
+        """
+        self.alpha = 2.0 / (span + 1.0)
+        self.window = window
+        self.period = period
+        self.stamp = None
+        self.price = None
+        self.ema = np.nan
+        self.weighted = collections.deque(maxlen = window)
+        self.returns = _RollingMoments(window)
+        self.prices = _RollingMoments(window)
+        self.changes = 0
+        self.average_gain = 0.0
+        self.average_loss = 0.0
+
+    def update(self, stamp, price, volume = 0.0):
+        """
+            Adds a tick, newer than the ones already added.
+        """
+        price = float(price)
+        volume = abs(float(volume))
+        if self.price is None:
+            self.ema = price
+        else:
+            self.ema += self.alpha * (price - self.ema)
+            self.returns.update(math.log(price / self.price))
+            change = price - self.price
+            gain = max(change, 0.0)
+            loss = max(-change, 0.0)
+            self.changes += 1
+            if self.changes <= self.period:
+                # the first averages are plain means
+                self.average_gain += (gain - self.average_gain) / self.changes
+                self.average_loss += (loss - self.average_loss) / self.changes
+            else:
+                self.average_gain += (gain - self.average_gain) / self.period
+                self.average_loss += (loss - self.average_loss) / self.period
+        self.weighted.append((price * volume, volume))
+        self.prices.update(price)
+        self.stamp = int(stamp)
+        self.price = price
+
+    def values(self):
+        """
+            :return: A dict with the COLUMNS keys, except the symbol.
+            :rtype: dict
+        """
+        value = sum(weighted for weighted, _ in self.weighted)
+        weight = sum(volume for _, volume in self.weighted)
+        mean, deviation = self.prices.moments()
+        if self.changes < self.period:
+            strength = np.nan
+        else:
+            strength = float(_strength(np.array([self.average_gain]), np.array([self.average_loss]))[0])
+        return {
+            'stamp': self.stamp,
+            'ema': self.ema,
+            'vwap': value / weight if weight > 0 else np.nan,
+            'volatility': self.returns.moments()[1],
+            'rsi': strength,
+            'zscore': (self.price - mean) / deviation if deviation > 0 else np.nan
+        }
+
+class IndicatorSet:
+    """
+        The incremental indicators of all the symbols, fed with the ticks of
+        each message. With an id column only the transactions above the
+        highest id seen are added, as in market.TrendEstimator, otherwise (e.g.
+        the latest prices) only the ticks newer than the last one of their
+        symbol, so overlapping windows are never counted twice.
+    """
+    def __init__(self, span = 20, window = 20, period = 14):
+        self.span = int(span)
+        self.window = int(window)
+        self.period = int(period)
+        self.high_water = -1
+        self.symbols = {}
+
+    def update(self, ticks):
+        """
+            :param ticks: A dataframe with the symbol, stamp and price columns,
+                and optionally the id and volume columns.
+            :type ticks: pandas.DataFrame
+        """
+        if 'id' in ticks.columns:
+            ticks = ticks[ticks['id'] > self.high_water]
+            if ticks.shape[0] < 1:
+                return
+            self.high_water = int(ticks['id'].max())
+        ticks = ticks.sort_values('stamp', kind = 'stable')
+        volumes = ticks['volume'].values if 'volume' in ticks.columns else np.zeros(ticks.shape[0])
+        for symbol, stamp, price, volume in zip(ticks['symbol'].values, ticks['stamp'].values, ticks['price'].values, volumes):
+            indicators = self.symbols.get(symbol)
+            if indicators is None:
+                indicators = self.symbols[symbol] = SymbolIndicators(self.span, self.window, self.period)
+            elif stamp < indicators.stamp or (stamp == indicators.stamp and 'id' not in ticks.columns):
+                continue
+            indicators.update(stamp, price, volume)
+
+    def forget(self, stamp):
+        """
+            Drops the symbols without a tick since stamp.
+        """
+        for symbol in [symbol for symbol, indicators in self.symbols.items() if indicators.stamp < stamp]:
+            del self.symbols[symbol]
+
+    def frame(self):
+        """
+            :return: A dataframe with the COLUMNS columns.
+            :rtype: pandas.DataFrame
+        """
+        return pd.DataFrame([
+            dict(symbol = symbol, **indicators.values()) for symbol, indicators in self.symbols.items()
+        ], columns = COLUMNS)
@@ -0,0 +1,228 @@
+import numpy as np
+import pandas as pd
+
+# the sufficient statistics for the trend regression of price on (1, hours, volume),
+# where hours are measured from an origin stamp shared by all the symbols; count is
+# the sum of the tick weights (the number of ticks, unless they're decayed) and
+# ticks the number of ticks
+COLUMNS = [
+    'symbol',
+    'count',
+    'ticks',
+    'first_stamp',
+    'last_stamp',
+    'sum_hours',
+    'sum_volume',
+    'sum_hours_hours',
+    'sum_hours_volume',
+    'sum_volume_volume',
+    'sum_price',
+    'sum_hours_price',
+    'sum_volume_price'
+]
+
+# how each column is combined when merging the statistics of the same symbol
+AGGREGATIONS = {column: 'sum' for column in COLUMNS[1:]}
+AGGREGATIONS['first_stamp'] = 'min'
+AGGREGATIONS['last_stamp'] = 'max'
+
+HOUR = 3600 * 1000
+
+def from_arrays(symbol, stamps, prices, volumes, origin):
+    """
+        Computes the sufficient statistics of one symbol from its columns.
+
+        :param symbol: The symbol name.
+        :type symbol: str
+        :param stamps: The transaction stamps, in milliseconds.
+        :type stamps: numpy.ndarray
+        :param prices: The transaction prices.
+        :type prices: numpy.ndarray
+        :param volumes: The transaction volumes.
+        :type volumes: numpy.ndarray
+        :param origin: The stamp, in milliseconds, the hours are measured from.
+        :type origin: int
+        :return: A dict with the COLUMNS keys.
+        :rtype: dict
+    """
+    hours = (stamps - origin) / HOUR
+    return {
+        'symbol': symbol,
+        'count': stamps.shape[0],
+        'ticks': stamps.shape[0],
+        'first_stamp': int(stamps.min()),
+        'last_stamp': int(stamps.max()),
+        'sum_hours': hours.sum(),
+        'sum_volume': volumes.sum(),
+        'sum_hours_hours': np.dot(hours, hours),
+        'sum_hours_volume': np.dot(hours, volumes),
+        'sum_volume_volume': np.dot(volumes, volumes),
+        'sum_price': prices.sum(),
+        'sum_hours_price': np.dot(hours, prices),
+        'sum_volume_price': np.dot(volumes, prices)
+    }
+
+def group_symbols(symbols):
+    """
+        Sorts the rows once by symbol, so the rows of each symbol are
+        contiguous and can be reduced with numpy.add.reduceat.
+
+        :param symbols: The symbol of each row.
+        :type symbols: numpy.ndarray
+        :return: A tuple with the sorting order, the unique symbols and the
+            offset of the first row of each symbol in the sorted rows.
+        :rtype: tuple
+    """
+    order = np.argsort(symbols, kind = 'stable')
+    ordered = symbols[order]
+    starts = np.flatnonzero(np.concatenate([[True], ordered[1:] != ordered[:-1]]))
+    return (
+        order,
+        ordered[starts],
+        starts
+    )
+
+def from_transactions(transactions, origin = None):
+    """
+        Computes the sufficient statistics of every symbol from a dataframe
+        of transactions, which can be just a chunk of the whole window: the
+        statistics of several chunks are combined with merge. The rows are
+        sorted once by symbol and every sum is a single numpy.add.reduceat.
+
+        :param transactions: A dataframe with the price, symbol, stamp and volume columns.
+        :type transactions: pandas.DataFrame
+        :param origin: The stamp, in milliseconds, the hours are measured from.
+            When None, the hours of each symbol are measured from its first
+            stamp (which is then its first_stamp column).
+        :type origin: int
+        :return: A dataframe with the COLUMNS columns.
+        :rtype: pandas.DataFrame
+    """
+    if transactions.shape[0] == 0:
+        return pd.DataFrame(columns = COLUMNS)
+    order, symbols, starts = group_symbols(transactions['symbol'].values)
+    stamps = transactions['stamp'].values.astype(np.int64)[order]
+    prices = transactions['price'].values.astype(float)[order]
+    volumes = transactions['volume'].values.astype(float)[order]
+    counts = np.diff(np.append(starts, stamps.shape[0]))
+    first_stamps = np.minimum.reduceat(stamps, starts)
+    if origin is None:
+        origins = np.repeat(first_stamps, counts)
+    else:
+        origins = origin
+    hours = (stamps - origins) / HOUR
+
+    def sums(values):
+        return np.add.reduceat(values, starts)
+
+    return pd.DataFrame({
+        'symbol': symbols,
+        'count': counts,
+        'ticks': counts,
+        'first_stamp': first_stamps,
+        'last_stamp': np.maximum.reduceat(stamps, starts),
+        'sum_hours': sums(hours),
+        'sum_volume': sums(volumes),
+        'sum_hours_hours': sums(hours * hours),
+        'sum_hours_volume': sums(hours * volumes),
+        'sum_volume_volume': sums(volumes * volumes),
+        'sum_price': sums(prices),
+        'sum_hours_price': sums(hours * prices),
+        'sum_volume_price': sums(volumes * prices)
+    }, columns = COLUMNS)
+
+def merge(*statistics):
+    """
+        Combines statistics dataframes computed with the same origin, adding
+        up the sums of the rows with the same symbol.
+
+        :return: A dataframe with the COLUMNS columns, one row per symbol.
+        :rtype: pandas.DataFrame
+    """
+    merged = pd.concat(statistics, ignore_index = True)
+    return merged.groupby('symbol', as_index = False, sort = False).agg(AGGREGATIONS)[COLUMNS]
+
+def normal_equations(statistics):
+    """
+        Builds the normal equations X^T X theta = X^T y for each row of the
+        statistics dataframe, with X = (1, hours, volume) and y = price.
+
+        :param statistics: A dataframe with the COLUMNS columns.
+        :type statistics: pandas.DataFrame
+        :return: A tuple with the (n, 3, 3) X^T X and the (n, 3) X^T y arrays.
+        :rtype: tuple
+    """
+    n = statistics['count'].values.astype(float)
+    h = statistics['sum_hours'].values.astype(float)
+    v = statistics['sum_volume'].values.astype(float)
+    hh = statistics['sum_hours_hours'].values.astype(float)
+    hv = statistics['sum_hours_volume'].values.astype(float)
+    vv = statistics['sum_volume_volume'].values.astype(float)
+    xtx = np.stack([
+        np.stack([n, h, v], axis = -1),
+        np.stack([h, hh, hv], axis = -1),
+        np.stack([v, hv, vv], axis = -1)
+    ], axis = 1)
+    xty = statistics[['sum_price', 'sum_hours_price', 'sum_volume_price']].values.astype(float)
+    return (
+        xtx,
+        xty
+    )
+
+def solve(xtx, xty):
+    """
+        Solves a stack of normal equations in one batched call. The singular
+        systems (e.g. a symbol traded with a constant volume) fall back to the
+        pseudo-inverse, as the per-symbol regression used to do.
+
+        :param xtx: The (n, k, k) X^T X array.
+        :type xtx: numpy.ndarray
+        :param xty: The (n, k) X^T y array.
+        :type xty: numpy.ndarray
+        :return: The (n, k) regression parameters.
+        :rtype: numpy.ndarray
+    """
+    theta = np.zeros(xty.shape)
+    if xty.shape[0] == 0:
+        return theta
+    regular = np.linalg.matrix_rank(xtx) == xtx.shape[-1]
+    if np.any(regular):
+        theta[regular] = np.linalg.solve(xtx[regular], xty[regular][..., np.newaxis])[..., 0]
+    if not np.all(regular):
+        theta[~regular] = np.matmul(np.linalg.pinv(xtx[~regular]), xty[~regular][..., np.newaxis])[..., 0]
+    return theta
+
+def solve_trends(statistics, origin):
+    """
+        Computes the trend of every symbol from its sufficient statistics, the
+        same way the check-trends daemon does from the raw transactions: the
+        regression is evaluated at the first and the last stamp (with unit
+        volume) and the trend is the difference between the two predictions.
+        The price is the volume weighted average price.
+
+        :param statistics: A dataframe with the COLUMNS columns.
+        :type statistics: pandas.DataFrame
+        :param origin: The stamp, in milliseconds, the hours are measured from,
+            or an array with one origin per row.
+        :type origin: int
+        :return: A dataframe with the symbol, price, absolute_trend and
+            relative_trend columns.
+        :rtype: pandas.DataFrame
+    """
+    xtx, xty = normal_equations(statistics)
+    theta = solve(xtx, xty)
+    origin = np.asarray(origin, dtype = float)
+    first_hours = (statistics['first_stamp'].values.astype(float) - origin) / HOUR
+    last_hours = (statistics['last_stamp'].values.astype(float) - origin) / HOUR
+
+    # the predictions at the edges of the window, with unit volume
+    first_predicted = theta[:, 0] + theta[:, 1] * first_hours + theta[:, 2]
+    last_predicted = theta[:, 0] + theta[:, 1] * last_hours + theta[:, 2]
+    absolute_trend = last_predicted - first_predicted
+
+    return pd.DataFrame({
+        'symbol': statistics['symbol'].values,
+        'price': statistics['sum_volume_price'].values.astype(float) / statistics['sum_volume'].values.astype(float),
+        'absolute_trend': absolute_trend,
+        'relative_trend': absolute_trend / last_predicted
+    }, columns = ['symbol', 'price', 'absolute_trend', 'relative_trend'])
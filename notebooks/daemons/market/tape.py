@@ -0,0 +1,172 @@
+import numpy as np
+import os
+import pandas as pd
+from pathlib import Path
+from urllib.parse import quote, unquote
+from . import statistics
+
+class MarketTape:
+    """
+        Read-only, time-indexed ticks of a period, one set of NumPy columns
+        per symbol, sorted by stamp. Unlike TickBuffer it never changes, so
+        the columns can be views on memory-mapped archive files, and windows
+        are served by binary search and slicing, without copies.
+    """
+    COLUMNS = ('id', 'stamp', 'price', 'volume')
+
+    def __init__(self, symbols):
+        """
+            :param symbols: A dict with a dict of columns for each symbol, each
+                sorted by stamp.
+            :type symbols: dict
+        """
+        self.symbols = {symbol: columns for symbol, columns in symbols.items() if columns['stamp'].shape[0] > 0}
+
+    @classmethod
+    def from_archive(cls, archive, begin_stamp, end_stamp):
+        """
+            Reads the ticks of all the symbols in [begin_stamp, end_stamp) from
+            a TickArchive.
+
+            :param archive: The tick archive.
+            :type archive: market.TickArchive
+            :rtype: market.MarketTape
+        """
+        return cls({symbol: archive.read(symbol, begin_stamp, end_stamp, cls.COLUMNS) for symbol in archive.symbols()})
+
+    @classmethod
+    def from_frame(cls, transactions):
+        """
+            Builds the tape from a dataframe shaped like the `transactions` table.
+
+            :param transactions: A dataframe with the id, price, symbol, stamp and volume columns.
+            :type transactions: pandas.DataFrame
+            :rtype: market.MarketTape
+        """
+        symbols = {}
+        for symbol, group in transactions.groupby('symbol', sort = False):
+            group = group.sort_values('stamp', kind = 'mergesort')
+            symbols[symbol] = {
+                'id': group['id'].values.astype(np.int64),
+                'stamp': group['stamp'].values.astype(np.int64),
+                'price': group['price'].values.astype(np.float64),
+                'volume': group['volume'].values.astype(np.float64)
+            }
+        return cls(symbols)
+
+    def save(self, path):
+        """
+            Writes the tape as one raw NumPy file per symbol and column,
+                <path>/<symbol>/{id,stamp,price,volume}.npy
+            so other processes can memory-map it with load instead of
+            getting their own copy.
+
+            :param path: The directory to write to.
+            :type path: str
+        """
+        path = Path(path)
+        for symbol, columns in self.symbols.items():
+            # symbols look like EXCHANGE:PAIR, so quote them to get a safe directory name
+            symbol_path = path / quote(symbol, safe = '')
+            symbol_path.mkdir(parents = True, exist_ok = True)
+            for name in self.COLUMNS:
+                temp_path = symbol_path / (name + '.tmp.npy')
+                np.save(temp_path, np.ascontiguousarray(columns[name]))
+                os.replace(temp_path, symbol_path / (name + '.npy'))
+
+    @classmethod
+    def load(cls, path, mmap_mode = 'r'):
+        """
+            Opens a tape written by save, memory-mapped by default.
+
+            :param path: The directory the tape was written to.
+            :type path: str
+            :param mmap_mode: The numpy.load memory-map mode, None to read in memory.
+            :type mmap_mode: str
+            :rtype: market.MarketTape
+        """
+        path = Path(path)
+        return cls({
+            unquote(symbol_path.name): {name: np.load(symbol_path / (name + '.npy'), mmap_mode = mmap_mode) for name in cls.COLUMNS}
+            for symbol_path in sorted(path.iterdir()) if symbol_path.is_dir()
+        })
+
+    def bounds(self):
+        """
+            :return: A tuple with the first and the last stamp on the tape.
+            :rtype: tuple
+        """
+        return (
+            min(int(columns['stamp'][0]) for columns in self.symbols.values()),
+            max(int(columns['stamp'][-1]) for columns in self.symbols.values())
+        )
+
+    def window(self, begin_stamp, end_stamp, symbols = None):
+        """
+            :param symbols: Keep only these symbols, all of them by default.
+            :type symbols: list
+            :return: A dict with, for each symbol with ticks in
+                [begin_stamp, end_stamp), a dict of views on its columns.
+            :rtype: dict
+        """
+        if symbols is None:
+            symbols = self.symbols.keys()
+        windows = {}
+        for symbol in symbols:
+            if symbol not in self.symbols:
+                continue
+            columns = self.symbols[symbol]
+            begin, end = np.searchsorted(columns['stamp'], [begin_stamp, end_stamp], side = 'left')
+            if end > begin:
+                windows[symbol] = {name: column[begin:end] for name, column in columns.items()}
+        return windows
+
+    def transactions(self, begin_stamp, end_stamp, symbols = None):
+        """
+            :param symbols: Keep only these symbols, all of them by default.
+            :type symbols: list
+            :return: A dataframe with the id, price, symbol, stamp and volume
+                columns for the ticks in [begin_stamp, end_stamp).
+            :rtype: pandas.DataFrame
+        """
+        windows = self.window(begin_stamp, end_stamp, symbols)
+        if len(windows) == 0:
+            return pd.DataFrame(columns = ['id', 'price', 'symbol', 'stamp', 'volume'])
+        # glue the arrays first, so only one dataframe is built
+        return pd.DataFrame({
+            'id': np.concatenate([columns['id'] for columns in windows.values()]),
+            'price': np.concatenate([columns['price'] for columns in windows.values()]),
+            'symbol': np.repeat(list(windows.keys()), [columns['stamp'].shape[0] for columns in windows.values()]),
+            'stamp': np.concatenate([columns['stamp'] for columns in windows.values()]),
+            'volume': np.concatenate([columns['volume'] for columns in windows.values()])
+        })
+
+    def statistics(self, begin_stamp, end_stamp):
+        """
+            :return: A dataframe with the market.statistics.COLUMNS columns for
+                the ticks in [begin_stamp, end_stamp), with the hours measured
+                from begin_stamp.
+            :rtype: pandas.DataFrame
+        """
+        return pd.DataFrame([
+            statistics.from_arrays(symbol, columns['stamp'], columns['price'], columns['volume'], begin_stamp)
+            for symbol, columns in self.window(begin_stamp, end_stamp).items()
+        ], columns = statistics.COLUMNS)
+
+    def last_prices(self, stamp):
+        """
+            :return: A dataframe with the symbol, price and stamp columns with
+                the last tick of each symbol at or before stamp, like the
+                `last_price` table.
+            :rtype: pandas.DataFrame
+        """
+        rows = []
+        for symbol, columns in self.symbols.items():
+            index = int(np.searchsorted(columns['stamp'], stamp, side = 'right')) - 1
+            if index >= 0:
+                rows.append({
+                    'symbol': symbol,
+                    'price': float(columns['price'][index]),
+                    'stamp': int(columns['stamp'][index])
+                })
+        return pd.DataFrame(rows, columns = ['symbol', 'price', 'stamp'])
@@ -0,0 +1,10 @@
+from .store import ModelStore, TrendWeights
+from .trend import tensorflow, trend_features, TrendModels
+
+__all__ = [
+    'ModelStore',
+    'TrendModels',
+    'TrendWeights',
+    'tensorflow',
+    'trend_features'
+]
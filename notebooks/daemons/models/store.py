@@ -0,0 +1,140 @@
+import numpy as np
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+class TrendWeights:
+    """
+        The weights of the linear trend models of many symbols, one row per
+        symbol, as NumPy arrays (memory-mapped when read from a ModelStore):
+        the input normalization mean and deviation, the dense kernel and bias
+        and the output scale (mu and sigma).
+    """
+    FIELDS = ('mean', 'deviation', 'kernel', 'bias', 'mu', 'sigma')
+
+    def __init__(self, symbols, mean, deviation, kernel, bias, mu, sigma):
+        self.symbols = [str(symbol) for symbol in symbols]
+        self.index = {symbol: row for row, symbol in enumerate(self.symbols)}
+        self.mean = mean
+        self.deviation = deviation
+        self.kernel = kernel
+        self.bias = bias
+        self.mu = mu
+        self.sigma = sigma
+
+    def __contains__(self, symbol):
+        return symbol in self.index
+
+    def predict(self, symbols, features):
+        """
+            Predicts the prices for several symbols at once.
+
+            :param symbols: The m symbol names, all of them with weights.
+            :type symbols: list
+            :param features: A (m, k, 2) array with k (hours, volume) points per symbol.
+            :type features: numpy.ndarray
+            :return: A (m, k) array with the predicted prices.
+            :rtype: numpy.ndarray
+        """
+        rows = np.array([self.index[symbol] for symbol in symbols], dtype = np.int64)
+        if rows.shape[0] == 0:
+            return np.zeros((0, features.shape[1]))
+        normalized = (features - self.mean[rows][:, np.newaxis, :]) / self.deviation[rows][:, np.newaxis, :]
+        outputs = np.matmul(normalized, self.kernel[rows][:, :, np.newaxis])[:, :, 0] + self.bias[rows][:, np.newaxis]
+        return outputs * self.sigma[rows][:, np.newaxis] + self.mu[rows][:, np.newaxis]
+
+class ModelStore:
+    """
+        Versioned model artifacts on disk, written by the trainer and read by
+        the subscribers:
+            <path>/<version>/{symbols,mean,deviation,kernel,bias,mu,sigma}.npy
+            <path>/CURRENT
+        A version is written to a temporary directory and renamed in place,
+        then CURRENT is replaced with its name, so readers always see a
+        complete version and switch to a new one with a single assignment.
+    """
+    CURRENT = 'CURRENT'
+
+    def __init__(self, path, keep = 3):
+        """
+            :param path: The directory of the artifacts.
+            :type path: str
+            :param keep: The number of versions to keep.
+            :type keep: int
+        """
+        self.path = Path(path)
+        self.keep = int(keep)
+        self.version = None
+        self.weights = None
+        self.lock = threading.Lock()
+
+    def versions(self):
+        if not self.path.is_dir():
+            return []
+        return sorted(item.name for item in self.path.iterdir() if item.is_dir() and item.name.startswith('v'))
+
+    def current(self):
+        """
+            :return: The name of the current version, None if there's none.
+            :rtype: str
+        """
+        try:
+            with open(self.path / self.CURRENT, 'r') as fp:
+                return fp.read().strip() or None
+        except IOError:
+            return None
+
+    def write(self, weights):
+        """
+            Writes a new version and makes it the current one.
+
+            :param weights: The weights to write.
+            :type weights: models.TrendWeights
+            :return: The name of the new version.
+            :rtype: str
+        """
+        version = 'v{stamp:016d}'.format(stamp = int(time.time() * 1000))
+        temp_path = self.path / ('.' + version)
+        temp_path.mkdir(parents = True, exist_ok = True)
+        np.save(temp_path / 'symbols.npy', np.array(weights.symbols, dtype = str))
+        for name in TrendWeights.FIELDS:
+            np.save(temp_path / (name + '.npy'), np.ascontiguousarray(getattr(weights, name), dtype = np.float64))
+        os.replace(temp_path, self.path / version)
+
+        current_path = self.path / (self.CURRENT + '.tmp')
+        with open(current_path, 'w') as fp:
+            fp.write(version)
+        os.replace(current_path, self.path / self.CURRENT)
+
+        # the readers map the files, so dropping an old version doesn't break one still using it
+        for old_version in self.versions()[:-self.keep]:
+            shutil.rmtree(self.path / old_version, ignore_errors = True)
+        return version
+
+    def load(self, version):
+        """
+            Memory-maps a version.
+
+            :rtype: models.TrendWeights
+        """
+        version_path = self.path / version
+        return TrendWeights(
+            np.load(version_path / 'symbols.npy'),
+            *[np.load(version_path / (name + '.npy'), mmap_mode = 'r') for name in TrendWeights.FIELDS]
+        )
+
+    def refresh(self):
+        """
+            Switches to the current version if it changed since the last call.
+
+            :return: The weights of the current version, None if there's none.
+            :rtype: models.TrendWeights
+        """
+        version = self.current()
+        with self.lock:
+            if version is not None and version != self.version:
+                self.weights = self.load(version)
+                self.version = version
+            return self.weights
@@ -0,0 +1,200 @@
+import numpy as np
+import threading
+import time
+from collections import OrderedDict
+from .store import TrendWeights
+
+# TensorFlow takes seconds to import, so it's imported on first use, which
+# is also the last chance to size its thread pools
+_tensorflow = None
+_tensorflow_lock = threading.Lock()
+
+def tensorflow(intra_op_threads = 0, inter_op_threads = 0):
+    """
+        Imports TensorFlow on first call and configures its thread pools.
+
+        :param intra_op_threads: The threads used inside an operation, 0 lets TensorFlow choose.
+        :type intra_op_threads: int
+        :param inter_op_threads: The threads running independent operations, 0 lets TensorFlow choose.
+        :type inter_op_threads: int
+        :return: The tensorflow module.
+    """
+    global _tensorflow
+    with _tensorflow_lock:
+        if _tensorflow is None:
+            import tensorflow as tf # pylint: disable=import-error
+            tf.config.threading.set_intra_op_parallelism_threads(int(intra_op_threads))
+            tf.config.threading.set_inter_op_parallelism_threads(int(inter_op_threads))
+            _tensorflow = tf
+    return _tensorflow
+
+def trend_features(stamps, volumes):
+    """
+        Builds the model inputs of one symbol: the hours since its first tick
+        and the volumes.
+
+        :param stamps: The transaction stamps, in milliseconds, sorted.
+        :type stamps: numpy.ndarray
+        :param volumes: The transaction volumes.
+        :type volumes: numpy.ndarray
+        :return: A (n, 2) array.
+        :rtype: numpy.ndarray
+    """
+    features = np.empty((stamps.shape[0], 2), dtype = np.float64)
+    # make the stamps more manageble
+    features[:,0] = (stamps - stamps.min()) / (3600 * 1000)
+    features[:,1] = volumes
+    return features
+
+class TrendModels:
+    """
+        Cache of the per-symbol linear trend models, price against (hours,
+        volume). A model is built, compiled and fitted the first time a symbol
+        is seen; afterwards the cached model is only fine-tuned, starting from
+        its current weights, with fewer epochs and at most once per
+        refit_interval. The weights are also kept as NumPy arrays, so the
+        predictions for all the symbols are computed in one vectorized step,
+        without going through Keras.
+    """
+    def __init__(self, epochs = 5, fine_tune_epochs = 1, refit_interval = 0, max_models = 1024, intra_op_threads = 0, inter_op_threads = 0):
+        """
+            :param epochs: The epochs of the first fit of a model.
+            :type epochs: int
+            :param fine_tune_epochs: The epochs of the next fits.
+            :type fine_tune_epochs: int
+            :param refit_interval: The minimum number of seconds between two fits of the same model.
+            :type refit_interval: float
+            :param max_models: The number of models to keep, the least recently used are dropped.
+            :type max_models: int
+        """
+        self.epochs = int(epochs)
+        self.fine_tune_epochs = int(fine_tune_epochs)
+        self.refit_interval = float(refit_interval)
+        self.max_models = int(max_models)
+        self.intra_op_threads = int(intra_op_threads)
+        self.inter_op_threads = int(inter_op_threads)
+        self.models = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, symbol):
+        return symbol in self.models
+
+    def _build(self, features, prices):
+        tf = tensorflow(self.intra_op_threads, self.inter_op_threads)
+        # use a tensorflow normalizer for the inputs
+        normalizer = tf.keras.layers.experimental.preprocessing.Normalization(input_shape = [2,])
+        normalizer.adapt(features)
+        # as models work best with small number, outputs will also be normalized
+        mu_price = float(np.mean(prices))
+        sigma_price = float(np.std(prices)) or 1.0
+        # build a linear regression model
+        model = tf.keras.Sequential([
+            normalizer,
+            tf.keras.layers.Dense(1, activation = 'linear'),
+            tf.keras.layers.Lambda(lambda output : output * sigma_price + mu_price)
+        ])
+        # choose an optimizer and a loss
+        model.compile(
+            optimizer = 'adam',
+            loss = 'mean_absolute_error'
+        )
+        return {
+            'model': model,
+            'normalizer': normalizer,
+            'dense': model.layers[1],
+            'mu': mu_price,
+            'sigma': sigma_price,
+            'fitted': None,
+            'weights': None
+        }
+
+    def _snapshot_weights(self, entry):
+        # the normalization mean and variance, then the dense kernel and bias
+        mean, variance = [np.asarray(value, dtype = np.float64).reshape(-1) for value in entry['normalizer'].get_weights()[:2]]
+        kernel, bias = entry['dense'].get_weights()
+        entry['weights'] = (
+            mean,
+            np.sqrt(np.maximum(variance, 1e-12)),
+            np.asarray(kernel, dtype = np.float64).reshape(-1),
+            float(bias[0])
+        )
+
+    def fit(self, symbol, features, prices):
+        """
+            Fits (or fine-tunes) the model of a symbol. The cache may grow past
+            max_models until evict is called, so all the models of a batch
+            stay available until its predictions are made.
+
+            :param symbol: The symbol name.
+            :type symbol: str
+            :param features: A (n, 2) array with the hours and volumes.
+            :type features: numpy.ndarray
+            :param prices: The n prices.
+            :type prices: numpy.ndarray
+            :return: True if the model was fitted, False if it's recent enough.
+            :rtype: bool
+        """
+        with self.lock:
+            entry = self.models.get(symbol)
+            if entry is None:
+                entry = self._build(features, prices)
+                epochs = self.epochs
+            elif entry['fitted'] is not None and time.monotonic() - entry['fitted'] < self.refit_interval:
+                self.models.move_to_end(symbol)
+                return False
+            else:
+                epochs = self.fine_tune_epochs
+            entry['model'].fit(
+                features,
+                prices,
+                epochs = epochs,
+                batch_size = max(32, features.shape[0] // 8),
+                verbose = 0
+            )
+            entry['fitted'] = time.monotonic()
+            self._snapshot_weights(entry)
+            self.models[symbol] = entry
+            self.models.move_to_end(symbol)
+            return True
+
+    def evict(self):
+        """
+            Drops the least recently used models past max_models.
+        """
+        with self.lock:
+            while len(self.models) > self.max_models:
+                self.models.popitem(last = False)
+
+    def weights(self, symbols = None):
+        """
+            :param symbols: The symbols to export, all the cached ones by default.
+            :type symbols: list
+            :return: The weights of the fitted models.
+            :rtype: models.TrendWeights
+        """
+        with self.lock:
+            if symbols is None:
+                symbols = [symbol for symbol, entry in self.models.items() if entry['weights'] is not None]
+            entries = [self.models[symbol] for symbol in symbols]
+        return TrendWeights(
+            symbols,
+            np.array([entry['weights'][0] for entry in entries]).reshape(-1, 2),
+            np.array([entry['weights'][1] for entry in entries]).reshape(-1, 2),
+            np.array([entry['weights'][2] for entry in entries]).reshape(-1, 2),
+            np.array([entry['weights'][3] for entry in entries]),
+            np.array([entry['mu'] for entry in entries]),
+            np.array([entry['sigma'] for entry in entries])
+        )
+
+    def predict(self, symbols, features):
+        """
+            Predicts the prices for several symbols at once.
+
+            :param symbols: The m symbol names, all of them with a fitted model.
+            :type symbols: list
+            :param features: A (m, k, 2) array with k (hours, volume) points per symbol.
+            :type features: numpy.ndarray
+            :return: A (m, k) array with the predicted prices.
+            :rtype: numpy.ndarray
+        """
+        return self.weights(symbols).predict(symbols, features)
@@ -1,7 +1,11 @@
 from .subscriber import Subscriber
 from .publisher import Publisher
+from .rpc import AsyncRpcClient, RpcClient, RpcTimeout
 
 __all__ = [
     'Subscriber',
-    'Publisher'
-]
+    'Publisher',
+    'RpcClient',
+    'AsyncRpcClient',
+    'RpcTimeout'
+]
\ No newline at end of file
@@ -1,5 +1,6 @@
 import pika
 import json
+import uuid
 
 class Publisher:
     def __init__(self, parameters):
@@ -71,9 +72,11 @@ class Publisher:
                 exchange = self.exchange,
                 exchange_type = self.exchange_type
             )
-            self._channel.queue_declare(
-                queue = self.queue
-            )
+            # replies go to the client's own queue, so there's nothing to declare
+            if self.queue is not None:
+                self._channel.queue_declare(
+                    queue = self.queue
+                )
             #self._channel.queue_bind(
             #    self.queue,
             #    self.exchange,
@@ -116,9 +119,12 @@ class Publisher:
         self.log('Trying to publish the message {}.'.format(self._message))
         
         headers = {}
+        # the message id stays the same if the message is published again, so
+        # the consumers can tell a redelivery from a new message
         properties = pika.BasicProperties(
             app_id = self.app_id,
             content_type = 'application/json',
+            message_id = uuid.uuid4().hex,
             headers = headers
         )
         try:
@@ -143,3 +149,29 @@ class Publisher:
             
         self._message_number += 1
         self._deliveries.append(self._message_number)
+
+    def reply(self, message, reply_to, correlation_id):
+        """
+            Publishes the response to a request/reply call directly to the
+            client's queue (through the default exchange), tagged with the
+            request correlation id.
+        """
+        if self._connection is None:
+            self.log('No connection found. Trying to connect.')
+            self.connect()
+
+        self.log('Replying to {} for {}.'.format(reply_to, correlation_id))
+
+        properties = pika.BasicProperties(
+            app_id = self.app_id,
+            content_type = 'application/json',
+            correlation_id = correlation_id
+        )
+        self._channel.basic_publish(
+            '',
+            reply_to,
+            json.dumps(message, ensure_ascii=False),
+            properties
+        )
+        self._message_number += 1
+        self._deliveries.append(self._message_number)
\ No newline at end of file
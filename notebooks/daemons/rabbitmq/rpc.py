@@ -0,0 +1,279 @@
+import asyncio
+import concurrent.futures
+import json
+import pika
+import threading
+import time
+import uuid
+
+class RpcTimeout(Exception):
+    pass
+
+class RpcClient:
+    """
+        Request/reply client over Rabbit MQ. Each request is published with a
+        unique correlation_id and the name of an exclusive reply queue in
+        reply_to, so the server answers this client only, and the answer is
+        matched to its request. Several requests can be outstanding at once.
+        A request also carries its timeout as the message expiration, so the
+        broker drops it if the server doesn't pick it up in time.
+        Streamed responses (chunks with a `stream` key) are collected and
+        returned as a list of messages ordered by sequence.
+    """
+    def __init__(self, parameters):
+        self.parameters = parameters
+
+        self.exchange = 'message'
+        self.exchange_type = 'topic'
+        self.routing_key = 'database.read'
+        self.timeout = 30
+
+        self.app_id = 'rpc'
+
+        self._connection = None
+        self._channel = None
+        self._callback_queue = None
+
+        self._pending = {}
+
+    def log(self, *args, **kwargs):
+        print('RPC:', *args, **kwargs)
+        pass
+
+    def __setitem__(self, key, value):
+        key = key.lower()
+        if key == 'exchange':
+            self.exchange = value
+        elif key == 'exchange_type':
+            self.exchange_type = value
+        elif key == 'routing_key':
+            self.routing_key = value
+        elif key == 'timeout':
+            self.timeout = float(value)
+        else:
+            raise NotImplementedError('Could not set {} property on object {}.'.format(key, type(self)))
+
+    def __getitem__(self, key):
+        key = key.lower()
+        if key == 'exchange':
+            return self.exchange
+        elif key == 'exchange_type':
+            return self.exchange_type
+        elif key == 'routing_key':
+            return self.routing_key
+        elif key == 'timeout':
+            return self.timeout
+        else:
+            raise NotImplementedError('Could not find {} property on object {}.'.format(key, type(self)))
+
+    def connect(self):
+        if self._connection is None:
+            self.log('Connecting to {}.'.format(self.parameters))
+            self._connection = pika.BlockingConnection(
+                self.parameters
+            )
+            self._channel = self._connection.channel()
+            self._channel.exchange_declare(
+                exchange = self.exchange,
+                exchange_type = self.exchange_type
+            )
+            result = self._channel.queue_declare(
+                queue = '',
+                exclusive = True
+            )
+            self._callback_queue = result.method.queue
+            self._channel.basic_consume(
+                queue = self._callback_queue,
+                on_message_callback = self.on_response,
+                auto_ack = True
+            )
+
+    def disconnect(self):
+        if self._connection is None:
+            return
+        if not self._connection.is_closed:
+            self._connection.close()
+        self._connection = None
+        self._channel = None
+        self._callback_queue = None
+
+    def on_response(self, _unused_channel, basic_deliver, properties, body):
+        request = self._pending.get(properties.correlation_id)
+        if request is None:
+            self.log('Dropping the response for an unknown request {}.'.format(properties.correlation_id))
+            return
+        response = json.loads(body)
+        if 'stream' not in response:
+            request['result'] = response
+            request['done'] = True
+            return
+        # a streamed response is complete once all the chunks up to the last one arrived
+        request['chunks'].append(response)
+        if response['stream']['last']:
+            request['expected'] = int(response['stream']['sequence']) + 1
+        if request['expected'] is not None and len(request['chunks']) >= request['expected']:
+            request['result'] = sorted(request['chunks'], key = lambda chunk : chunk['stream']['sequence'])
+            request['done'] = True
+
+    def send(self, message, timeout = None):
+        """
+            Publishes a request without waiting for the response.
+
+            :param message: The request, e.g. {'type': 'trends', 'stamp': ..., 'params': {...}}.
+            :type message: dict
+            :param timeout: The number of seconds to wait for the response.
+            :type timeout: float
+            :return: The correlation id of the request, to be passed to wait.
+            :rtype: str
+        """
+        if timeout is None:
+            timeout = self.timeout
+        self.connect()
+        correlation_id = uuid.uuid4().hex
+        self._pending[correlation_id] = {
+            'deadline': time.monotonic() + timeout,
+            'chunks': [],
+            'expected': None,
+            'result': None,
+            'done': False
+        }
+        self._channel.basic_publish(
+            self.exchange,
+            self.routing_key,
+            json.dumps(message, ensure_ascii = False),
+            pika.BasicProperties(
+                app_id = self.app_id,
+                content_type = 'application/json',
+                reply_to = self._callback_queue,
+                correlation_id = correlation_id,
+                expiration = str(int(timeout * 1000))
+            )
+        )
+        return correlation_id
+
+    def poll(self, time_limit = 0):
+        """
+            Processes the responses that arrived, waiting at most time_limit seconds.
+        """
+        self._connection.process_data_events(time_limit = time_limit)
+
+    def wait(self, correlation_id):
+        """
+            Waits for the response of a request sent with send.
+
+            :param correlation_id: The correlation id returned by send.
+            :type correlation_id: str
+            :return: The response message, or the list of chunk messages for a streamed response.
+            :raises RpcTimeout: If the response didn't arrive before the request timeout.
+        """
+        request = self._pending[correlation_id]
+        try:
+            while not request['done']:
+                remaining = request['deadline'] - time.monotonic()
+                if remaining <= 0:
+                    raise RpcTimeout('The request {} timed out.'.format(correlation_id))
+                self.poll(time_limit = min(remaining, 1.0))
+            return request['result']
+        finally:
+            del self._pending[correlation_id]
+
+    def call(self, message, timeout = None):
+        """
+            Sends a request and waits for its response.
+
+            :param message: The request message.
+            :type message: dict
+            :param timeout: The number of seconds to wait for the response.
+            :type timeout: float
+            :return: The response message, or the list of chunk messages for a streamed response.
+            :raises RpcTimeout: If the response didn't arrive in time.
+        """
+        return self.wait(self.send(message, timeout))
+
+class AsyncRpcClient:
+    """
+        Thread-safe wrapper over RpcClient: a background thread owns the Rabbit
+        MQ connection, while any thread can submit requests and get futures
+        back, and asyncio code can await call. All the outstanding requests
+        share the same connection and reply queue.
+    """
+    def __init__(self, parameters):
+        self.client = RpcClient(parameters)
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self._connected = threading.Event()
+
+    def __setitem__(self, key, value):
+        self.client[key] = value
+
+    def __getitem__(self, key):
+        return self.client[key]
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target = self._run, daemon = True)
+        self._thread.start()
+        self._connected.wait()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        self.client.connect()
+        self._connected.set()
+        while self._running:
+            self.client.poll(time_limit = 0.1)
+            self._resolve()
+        self.client.disconnect()
+
+    def _resolve(self):
+        now = time.monotonic()
+        with self._lock:
+            for correlation_id, future in list(self._futures.items()):
+                request = self.client._pending[correlation_id]
+                if request['done']:
+                    future.set_result(request['result'])
+                elif request['deadline'] <= now:
+                    future.set_exception(RpcTimeout('The request {} timed out.'.format(correlation_id)))
+                else:
+                    continue
+                del self.client._pending[correlation_id]
+                del self._futures[correlation_id]
+
+    def _send(self, message, timeout, future):
+        try:
+            correlation_id = self.client.send(message, timeout)
+        except Exception as error:
+            future.set_exception(error)
+            return
+        with self._lock:
+            self._futures[correlation_id] = future
+
+    def submit(self, message, timeout = None):
+        """
+            Sends a request from any thread.
+
+            :return: A future resolved with the response, or failed with RpcTimeout.
+            :rtype: concurrent.futures.Future
+        """
+        self.start()
+        future = concurrent.futures.Future()
+        self.client._connection.add_callback_threadsafe(lambda : self._send(message, timeout, future))
+        return future
+
+    async def call(self, message, timeout = None):
+        """
+            Sends a request and awaits its response, e.g.:
+                trends, profit = await asyncio.gather(
+                    client.call({'type': 'trends', ...}),
+                    client.call({'type': 'profit', ...})
+                )
+        """
+        return await asyncio.wrap_future(self.submit(message, timeout))
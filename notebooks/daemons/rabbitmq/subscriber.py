@@ -18,6 +18,12 @@ class Subscriber:
         
         self.prefetch_count = 1
         self.max_reconnect_delay = 30
+
+        # a message whose processing raised is rejected, and put back in the
+        # queue only if requeue is set, after requeue_delay seconds, so a
+        # message that keeps failing doesn't spin
+        self.requeue = False
+        self.requeue_delay = 1.0
         
         self._connection = None
         self._channel = None
@@ -41,6 +47,12 @@ class Subscriber:
             self.queue = value
         elif key == 'routing_key':
             self.routing_key = value
+        elif key == 'prefetch_count':
+            self.prefetch_count = int(value)
+        elif key == 'requeue':
+            self.requeue = bool(value)
+        elif key == 'requeue_delay':
+            self.requeue_delay = float(value)
         else:
             raise NotImplementedError('Could not set {} property on object {}.'.format(key, type(self)))
     
@@ -54,6 +66,12 @@ class Subscriber:
             return self.queue
         elif key == 'routing_key':
             return self.routing_key
+        elif key == 'prefetch_count':
+            return self.prefetch_count
+        elif key == 'requeue':
+            return self.requeue
+        elif key == 'requeue_delay':
+            return self.requeue_delay
         else:
             raise NotImplementedError('Could not find {} property on object {}.'.format(key, type(self)))
     
@@ -146,12 +164,25 @@ class Subscriber:
     def on_message_callback(self, basic_delivery, properties, body):
         self.log('You should overload the on_message_callback callback.')
 
-    def safe_ack_message(self, delivery_tag):
-        if self._channel.is_open:
+    def _ack_message(self, delivery_tag):
+        if self._channel is not None and self._channel.is_open:
             self._channel.basic_ack(delivery_tag)
         else:
             self.log('The channel is closed. Cannot acknowledge message.')
 
+    def safe_ack_message(self, delivery_tag):
+        # the messages are processed in their own threads, while the channel belongs to the ioloop thread
+        self._connection.ioloop.add_callback_threadsafe(functools.partial(self._ack_message, delivery_tag))
+
+    def _nack_message(self, delivery_tag, requeue):
+        if self._channel is not None and self._channel.is_open:
+            self._channel.basic_nack(delivery_tag, requeue = requeue)
+        else:
+            self.log('The channel is closed. Cannot reject message.')
+
+    def safe_nack_message(self, delivery_tag, requeue = False):
+        self._connection.ioloop.add_callback_threadsafe(functools.partial(self._nack_message, delivery_tag, requeue))
+
     def on_message_threaded(self, basic_delivery, properties, body):
         thread_id = threading.get_ident()
         self.log('Thread id: {}'.format(thread_id))
@@ -160,6 +191,10 @@ class Subscriber:
             self.safe_ack_message(basic_delivery.delivery_tag)
         except Exception as error:
             self.log('Processing the message raised: {}.'.format(error))
+            # an unsettled message would hold the prefetch window, and no other message would come
+            if self.requeue:
+                time.sleep(self.requeue_delay)
+            self.safe_nack_message(basic_delivery.delivery_tag, requeue = self.requeue)
     
     def on_message(self, _unused_channel, basic_delivery, properties, body):
         self.log('Received message # {} from {}: {}'.format(
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+import datetime
+import sys
+from backtest import load_tape, settings_from_config, Backtester # pylint: disable=import-error
+from config import app_config # pylint: disable=import-error
+from logger import Logger # pylint: disable=import-error
+from pathlib import Path
+
+# initialize the logger so we see what happens
+logger_path = Path(app_config.log.path)
+logger = Logger(path = logger_path / Path(__file__).stem, level = int(app_config.log.level))
+
+def _stamp(day):
+    day = datetime.datetime.strptime(day, '%Y-%m-%d')
+    return int(day.replace(tzinfo = datetime.timezone.utc).timestamp() * 1000)
+
+# as this is a script that's intended to be run stand alone, not to be imported
+# check whether the script is called directly
+if __name__ == '__main__':
+    # the --config option is handled by the config package
+    arguments = sys.argv[1:]
+    if '--config' in arguments:
+        config_arg_no = arguments.index('--config')
+        arguments = arguments[:config_arg_no] + arguments[config_arg_no + 2:]
+    if len(arguments) < 2:
+        print('Usage: {command} <first day> <last day> [--config <config file>]'.format(command = sys.argv[0]))
+        print('The days are UTC days, as YYYY-MM-DD, and the last day is included.')
+        sys.exit(0)
+
+    begin_stamp = _stamp(arguments[0])
+    end_stamp = _stamp(arguments[1]) + 24 * 3600 * 1000
+    logger.debug('Reading the ticks between {first} and {last}.'.format(first = arguments[0], last = arguments[1]))
+    tape = load_tape(app_config, begin_stamp, end_stamp)
+    if len(tape.symbols) < 1:
+        print('There are no ticks between {first} and {last}.'.format(first = arguments[0], last = arguments[1]))
+        sys.exit(1)
+
+    settings = settings_from_config(app_config)
+    logger.debug('Backtesting with {settings}.'.format(settings = settings))
+    report = Backtester(tape, settings).run()
+    for key, value in report.summary().items():
+        print('{key}: {value}'.format(key = key, value = value))
+    logger.debug('Backtest finished with {summary}.'.format(summary = report.summary()))
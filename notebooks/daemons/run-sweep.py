@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import datetime
+import json
+import sys
+import tempfile
+from backtest import grid, load_tape, random_search, settings_from_config, sweep # pylint: disable=import-error
+from config import app_config # pylint: disable=import-error
+from logger import Logger # pylint: disable=import-error
+from pathlib import Path
+
+# initialize the logger so we see what happens
+logger_path = Path(app_config.log.path)
+logger = Logger(path = logger_path / Path(__file__).stem, level = int(app_config.log.level))
+
+def _stamp(day):
+    day = datetime.datetime.strptime(day, '%Y-%m-%d')
+    return int(day.replace(tzinfo = datetime.timezone.utc).timestamp() * 1000)
+
+# as this is a script that's intended to be run stand alone, not to be imported
+# check whether the script is called directly
+if __name__ == '__main__':
+    # the --config option is handled by the config package
+    arguments = sys.argv[1:]
+    if '--config' in arguments:
+        config_arg_no = arguments.index('--config')
+        arguments = arguments[:config_arg_no] + arguments[config_arg_no + 2:]
+    if len(arguments) < 3:
+        print('Usage: {command} <first day> <last day> <search space> [<random runs>] [--config <config file>]'.format(command = sys.argv[0]))
+        print('The days are UTC days, as YYYY-MM-DD, and the last day is included.')
+        print('The search space is a JSON file with the values of each setting, e.g.')
+        print('    {"trend": ["0.5%", "1%"], "margin": ["1%", "2%"], "lookbehind": {"low": 600, "high": 7200}}')
+        print('where a list is searched on a grid and a low / high range needs a number of random runs.')
+        print('With a [strategies] section, the options of a strategy are searched as "<name>.<option>".')
+        sys.exit(0)
+
+    with open(arguments[2], 'r') as fp:
+        space = json.load(fp)
+    if len(arguments) >= 4:
+        candidates = random_search(space, int(arguments[3]))
+    else:
+        candidates = grid(space)
+
+    sweep_config = getattr(app_config, 'sweep', None)
+    workers = getattr(sweep_config, 'workers', None)
+    results_path = Path(getattr(sweep_config, 'results', 'sweep-results.csv'))
+
+    begin_stamp = _stamp(arguments[0])
+    end_stamp = _stamp(arguments[1]) + 24 * 3600 * 1000
+    logger.debug('Reading the ticks between {first} and {last}.'.format(first = arguments[0], last = arguments[1]))
+    tape = load_tape(app_config, begin_stamp, end_stamp)
+    if len(tape.symbols) < 1:
+        print('There are no ticks between {first} and {last}.'.format(first = arguments[0], last = arguments[1]))
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory(prefix = 'tape-') as tape_path:
+        # the workers memory-map this copy instead of each reading the ticks
+        tape.save(tape_path)
+        del tape
+        logger.debug('Sweeping {runs} settings.'.format(runs = len(candidates)))
+        results = sweep(tape_path, settings_from_config(app_config), candidates, workers = int(workers) if workers is not None else None)
+
+    results.to_csv(results_path, index = False, float_format = '%.6g')
+    logger.debug('Wrote the sweep results to {path}.'.format(path = results_path.as_posix()))
+    print(results.head(10).to_string(index = False))
@@ -0,0 +1,23 @@
+from .base import empty_orders, parse_threshold, MarketSnapshot, Strategy, ORDER_COLUMNS
+from .engine import StrategyEngine
+from .registry import create, from_config, register, specs_from_config
+from .triggers import TriggerIndex
+# the built-in strategies register themselves on import
+from .margin import MarginStrategy
+from .trend import TrendStrategy
+
+__all__ = [
+    'MarketSnapshot',
+    'Strategy',
+    'StrategyEngine',
+    'MarginStrategy',
+    'TrendStrategy',
+    'TriggerIndex',
+    'ORDER_COLUMNS',
+    'create',
+    'empty_orders',
+    'from_config',
+    'parse_threshold',
+    'register',
+    'specs_from_config'
+]
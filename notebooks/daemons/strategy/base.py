@@ -0,0 +1,149 @@
+import pandas as pd
+
+# the columns of the order intents returned by the strategies; the volume is
+# negative for buy orders and positive for sell orders, as in the orders table
+ORDER_COLUMNS = ['symbol', 'volume', 'price']
+
+def parse_threshold(value):
+    """
+        Parses a threshold option, either a fixed amount (e.g. 0.5) or a
+        percent (e.g. 1.5%).
+
+        :param value: The option value.
+        :type value: str
+        :return: A tuple with the threshold value and its type, fixed or percent.
+        :rtype: tuple
+    """
+    threshold_type = 'fixed'
+    threshold_value = 0.0
+    if isinstance(value, str):
+        if value[-1] == '%':
+            try:
+                threshold_value = 0.01 * float(value[:-1])
+                threshold_type = 'percent'
+            except:
+                pass
+        else:
+            try:
+                threshold_value = float(value)
+            except:
+                pass
+    elif isinstance(value, (int, float)):
+        threshold_value = float(value)
+
+    return (
+        threshold_value,
+        threshold_type
+    )
+
+def empty_orders():
+    return pd.DataFrame(columns = ORDER_COLUMNS)
+
+class MarketSnapshot:
+    """
+        The market data a round of strategies decides on, decoded once from
+        the database-read message and shared (read only) by all of them.
+        Every field is optional, as the trends and the profit messages carry
+        different data.
+    """
+    def __init__(self, stamp, budget = None, trends = None, portfolio = None, prices = None, indicators = None, active_symbols = None):
+        """
+            :param stamp: The request stamp, in milliseconds.
+            :type stamp: int
+            :param budget: The budget, as a dict with the amount and stamp keys,
+                and the pending key, the value of the buy orders in flight.
+            :type budget: dict
+            :param trends: A dataframe with the symbol, price, absolute_trend and relative_trend columns.
+            :type trends: pandas.DataFrame
+            :param portfolio: A dataframe with the symbol, commission, value, volume and stamp columns.
+            :type portfolio: pandas.DataFrame
+            :param prices: A dataframe with the symbol, price and stamp columns.
+            :type prices: pandas.DataFrame
+            :param indicators: A dataframe with the market.indicators.COLUMNS columns.
+            :type indicators: pandas.DataFrame
+            :param active_symbols: The symbols with orders in flight, left out
+                of the decisions.
+            :type active_symbols: collections.abc.Collection
+        """
+        self.stamp = stamp
+        self.budget = budget
+        self.trends = trends
+        self.portfolio = portfolio
+        self.prices = prices
+        self.indicators = indicators
+        self.active_symbols = active_symbols
+
+    def has(self, fields):
+        return all(getattr(self, field, None) is not None for field in fields)
+
+    def available(self):
+        """
+            :return: The budget amount not promised to the buy orders in flight.
+            :rtype: float
+        """
+        if self.budget is None:
+            return 0.0
+        return float(self.budget['amount']) - float(self.budget.get('pending', 0.0))
+
+    def tradable(self):
+        """
+            :return: The snapshot without the rows of the symbols with orders
+                in flight, so a stuck order only holds back its own symbol.
+            :rtype: strategy.MarketSnapshot
+        """
+        if not self.active_symbols:
+            return self
+        active = list(self.active_symbols)
+        def without(frame):
+            if frame is None or 'symbol' not in frame.columns:
+                return frame
+            return frame[~frame['symbol'].isin(active)]
+        return MarketSnapshot(
+            self.stamp,
+            budget = self.budget,
+            trends = without(self.trends),
+            portfolio = without(self.portfolio),
+            prices = without(self.prices),
+            indicators = without(self.indicators)
+        )
+
+class Strategy:
+    """
+        The base of the trading strategies. A strategy gets the market data as
+        dataframes and returns its order intents as a dataframe with the
+        ORDER_COLUMNS columns, without side effects, so several strategies can
+        run at the same time over the same snapshot.
+        Subclasses set the side (buy or sell), the snapshot fields they need
+        and implement decide.
+    """
+    side = None
+    requires = ()
+
+    def __init__(self, name, share = 1.0, **options):
+        """
+            :param name: The name of the strategy instance.
+            :type name: str
+            :param share: The share of the budget the strategy can spend.
+            :type share: float
+            :param options: The strategy specific options.
+        """
+        self.name = name
+        self.share = float(share)
+        self.options = options
+
+    def applies(self, snapshot):
+        """
+            Check if the snapshot holds all the data the strategy needs.
+        """
+        return snapshot.has(self.requires)
+
+    def decide(self, snapshot, budget):
+        """
+            :param snapshot: The market data.
+            :type snapshot: strategy.MarketSnapshot
+            :param budget: The amount the strategy can spend.
+            :type budget: float
+            :return: A dataframe with the ORDER_COLUMNS columns.
+            :rtype: pandas.DataFrame
+        """
+        raise NotImplementedError('The strategy {} does not implement decide.'.format(type(self)))
@@ -0,0 +1,100 @@
+import concurrent.futures
+import pandas as pd
+import threading
+import time
+from .base import ORDER_COLUMNS
+
+class StrategyEngine:
+    """
+        Runs several strategies over the same market snapshot, in parallel,
+        each with its slice of the budget, and keeps their latency metrics.
+    """
+    def __init__(self, strategies, workers = None):
+        """
+            :param strategies: The strategies to run.
+            :type strategies: list
+            :param workers: The number of threads, one per strategy by default.
+            :type workers: int
+        """
+        self.strategies = list(strategies)
+        self.workers = workers if workers is not None else max(1, len(self.strategies))
+        self.executor = None
+        self.metrics = {strategy.name: {'calls': 0, 'orders': 0, 'total': 0.0, 'last': 0.0, 'max': 0.0} for strategy in self.strategies}
+        self.lock = threading.Lock()
+
+    def _budgets(self, strategies, amount):
+        """
+            Splits the amount between the strategies of each side by their
+            shares; shares adding up to more than 1 are scaled down.
+        """
+        totals = {}
+        for strategy in strategies:
+            totals[strategy.side] = totals.get(strategy.side, 0.0) + strategy.share
+        return [amount * strategy.share / max(1.0, totals[strategy.side]) for strategy in strategies]
+
+    def _decide(self, strategy, snapshot, budget):
+        started = time.perf_counter()
+        orders = strategy.decide(snapshot, budget)
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            metrics = self.metrics[strategy.name]
+            metrics['calls'] += 1
+            metrics['orders'] += orders.shape[0]
+            metrics['total'] += elapsed
+            metrics['last'] = elapsed
+            metrics['max'] = max(metrics['max'], elapsed)
+        return orders.assign(strategy = strategy.name)[ORDER_COLUMNS + ['strategy']]
+
+    def run(self, snapshot):
+        """
+            Runs the strategies that apply to the snapshot, over the symbols
+            without orders in flight and with the budget they don't hold.
+
+            :param snapshot: The market data.
+            :type snapshot: strategy.MarketSnapshot
+            :return: A dataframe with the ORDER_COLUMNS columns and the name of
+                the strategy behind each order in the strategy column. When
+                several strategies sell the same symbol, only the first order is
+                kept; when several buy the same symbol, their volumes are summed
+                into one order, at the first price, with the strategy names
+                joined by commas, as the orders of one check share their stamp
+                and only one of them would be saved.
+            :rtype: pandas.DataFrame
+        """
+        snapshot = snapshot.tradable()
+        strategies = [strategy for strategy in self.strategies if strategy.applies(snapshot)]
+        amount = max(0.0, snapshot.available())
+        budgets = self._budgets(strategies, amount)
+        if len(strategies) > 1:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = self.workers)
+            futures = [self.executor.submit(self._decide, strategy, snapshot, budget) for strategy, budget in zip(strategies, budgets)]
+            results = [future.result() for future in futures]
+        else:
+            results = [self._decide(strategy, snapshot, budget) for strategy, budget in zip(strategies, budgets)]
+
+        if len(results) == 0:
+            return pd.DataFrame(columns = ORDER_COLUMNS + ['strategy'])
+        orders = pd.concat(results, ignore_index = True)
+        # a position can be sold only once
+        sells = orders['volume'] > 0
+        buys = orders[~sells].groupby('symbol', as_index = False, sort = False).agg({
+            'volume': 'sum',
+            'price': 'first',
+            'strategy': ','.join
+        })[ORDER_COLUMNS + ['strategy']]
+        return pd.concat([buys, orders[sells].drop_duplicates('symbol')], ignore_index = True)
+
+    def latency(self, name):
+        """
+            :return: The average decision time of a strategy, in seconds.
+            :rtype: float
+        """
+        with self.lock:
+            metrics = self.metrics[name]
+            return metrics['total'] / metrics['calls'] if metrics['calls'] > 0 else 0.0
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
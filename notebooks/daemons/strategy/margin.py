@@ -0,0 +1,47 @@
+import pandas as pd
+from .base import parse_threshold, Strategy, ORDER_COLUMNS
+from .registry import register
+
+@register('margin')
+class MarginStrategy(Strategy):
+    """
+        Sells the whole position of the symbols whose margin, at the last
+        price, is above the threshold, once the cooldown after buying passed.
+        Options:
+            - margin: the threshold, fixed (on sales - cogs) or percent (on
+                the margin), e.g. 2%;
+            - cooldown: the number of seconds to hold a symbol before selling.
+    """
+    side = 'sell'
+    requires = ('portfolio', 'prices')
+
+    def __init__(self, name, share = 1.0, **options):
+        super().__init__(name, share, **options)
+        self.margin_value, self.margin_type = parse_threshold(options.get('margin', 0.0))
+        self.cooldown = int(options.get('cooldown', 0))
+
+    def decide(self, snapshot, budget):
+        # pair each position with the first price of its symbol, the symbols
+        # without prices are dropped
+        prices = snapshot.prices.drop_duplicates('symbol', keep = 'first')
+        held = snapshot.portfolio.merge(
+            prices[['symbol', 'price', 'stamp']],
+            on = 'symbol',
+            how = 'inner',
+            suffixes = ('', '_sell')
+        )
+        # check if the cooldown passed
+        held = held[held['stamp'].astype('int64') + self.cooldown * 1000 < held['stamp_sell'].astype('int64')]
+
+        cogs = held['value'].astype(float) + held['commission'].astype(float)
+        sales = held['price'].astype(float) * held['volume'].astype(float)
+        if self.margin_type == 'fixed':
+            selected = (sales - cogs) >= self.margin_value
+        else:
+            selected = ((sales - cogs) / sales) >= self.margin_value
+
+        return pd.DataFrame({
+            'symbol': held['symbol'][selected].values,
+            'volume': held['volume'][selected].values,
+            'price': held['price'][selected].values
+        }, columns = ORDER_COLUMNS)
@@ -0,0 +1,79 @@
+# the strategy classes, by the type name used in the config file
+strategies = {}
+
+def register(name):
+    """
+        Class decorator adding a strategy class to the registry, e.g.:
+            @register('trend')
+            class TrendStrategy(Strategy):
+                ...
+    """
+    def decorator(cls):
+        strategies[name] = cls
+        return cls
+    return decorator
+
+def create(kind, name = None, **options):
+    """
+        Creates a strategy of a registered type.
+
+        :param kind: The registered type name.
+        :type kind: str
+        :param name: The name of the strategy instance, the type name by default.
+        :type name: str
+        :param options: The strategy options.
+        :rtype: strategy.Strategy
+    """
+    if kind not in strategies:
+        raise NotImplementedError('There is no strategy registered as {}.'.format(kind))
+    return strategies[kind](name if name is not None else kind, **options)
+
+def specs_from_config(config):
+    """
+        The strategies listed in the [strategies] section of the config file,
+        as `<name> = <type>` options, with the options of each strategy read
+        from the section with its name, if any. The specs are plain data, so
+        they can be sent to other processes, e.g. the backtest workers.
+
+        :param config: The application config.
+        :type config: config.Config
+        :return: A list of (type, name, options) tuples, or None without a
+            [strategies] section.
+        :rtype: list
+    """
+    if not hasattr(config, 'strategies'):
+        return None
+    return [
+        (kind.strip(), name, dict(vars(getattr(config, name))) if hasattr(config, name) else {})
+        for name, kind in vars(config.strategies).items()
+    ]
+
+def from_config(config, side = None):
+    """
+        Creates the strategies listed in the [strategies] section of the config
+        file, as `<name> = <type>` options. The options of each strategy are
+        read from the section with its name, if any, e.g.:
+            [strategies]
+            fast = trend
+            slow = trend
+            [fast]
+            trend = 0.5%
+            share = 0.3
+        Without a [strategies] section, the trend buy strategy is configured
+        from [buy] and the margin sell strategy from [sell].
+
+        :param config: The application config.
+        :type config: config.Config
+        :param side: Keep only the buy or the sell strategies.
+        :type side: str
+        :rtype: list
+    """
+    specs = specs_from_config(config)
+    if specs is not None:
+        created = [create(kind, name, **options) for kind, name, options in specs]
+    else:
+        created = [
+            create('trend', trend = config.buy.trend),
+            create('margin', margin = config.sell.margin, cooldown = config.sell.cooldown)
+        ]
+    return [strategy for strategy in created if side is None or strategy.side == side]
@@ -0,0 +1,38 @@
+import pandas as pd
+from .base import empty_orders, parse_threshold, Strategy, ORDER_COLUMNS
+from .registry import register
+
+@register('trend')
+class TrendStrategy(Strategy):
+    """
+        Buys the symbol with the highest trend above the threshold, spending
+        the whole budget of the strategy on it.
+        Options:
+            - trend: the threshold, fixed (on the absolute trend) or percent
+                (on the relative trend), e.g. 1.5%.
+    """
+    side = 'buy'
+    requires = ('trends',)
+
+    def __init__(self, name, share = 1.0, **options):
+        super().__init__(name, share, **options)
+        self.trend_value, self.trend_type = parse_threshold(options.get('trend', 0.0))
+
+    def decide(self, snapshot, budget):
+        trends = snapshot.trends
+        if self.trend_type == 'percent':
+            scores = trends['relative_trend']
+        else:
+            scores = trends['absolute_trend']
+        candidates = trends[scores > self.trend_value]
+        if candidates.shape[0] < 1:
+            return empty_orders()
+        best = candidates.loc[scores[candidates.index].idxmax()]
+        volume = int(budget / best['price'])
+        if volume < 1:
+            return empty_orders()
+        return pd.DataFrame([{
+            'symbol': best['symbol'],
+            'volume': -volume,
+            'price': best['price']
+        }], columns = ORDER_COLUMNS)
@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import threading
+from .base import parse_threshold, ORDER_COLUMNS
+
+class TriggerIndex:
+    """
+        The take-profit and stop-loss prices of the held symbols, checked on
+        every tick instead of on the profit timer.
+        The margin rule of the margin strategy, (sales - cogs) / sales above
+        the threshold, is solved once per position for the price, so a tick
+        only compares its price with two numbers. The positions are kept sorted
+        by symbol, with the thresholds in aligned arrays, and a batch of ticks
+        is matched to them with one binary search per tick (numpy.searchsorted),
+        so checking a tick is O(log n) in the number of positions.
+    """
+    def __init__(self, margin, stop_loss = None, cooldown = 0, rearm = 60):
+        """
+            :param margin: The take-profit threshold, as the margin option of
+                the margin strategy: fixed (on sales - cogs) or percent (on the
+                margin), e.g. 2%.
+            :type margin: str
+            :param stop_loss: The loss that triggers a sale, fixed (on cogs -
+                sales) or percent (on the margin), e.g. 5%, or None to only
+                take profits.
+            :type stop_loss: str
+            :param cooldown: The number of seconds to hold a symbol before selling.
+            :type cooldown: int
+            :param rearm: The number of seconds a symbol is not triggered
+                again, while its sell order is being fulfiled.
+            :type rearm: int
+        """
+        self.margin_value, self.margin_type = parse_threshold(margin)
+        if stop_loss is None:
+            self.stop_value, self.stop_type = (None, None)
+        else:
+            self.stop_value, self.stop_type = parse_threshold(stop_loss)
+        self.cooldown = int(cooldown)
+        self.rearm = int(rearm)
+        self.symbols = np.empty(0, dtype = object)
+        self.take = np.empty(0)
+        self.stop = np.empty(0)
+        self.armed = np.empty(0, dtype = np.int64)
+        self.volumes = np.empty(0)
+        self.fired = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.symbols.shape[0]
+
+    def thresholds(self, portfolio):
+        """
+            Solves the margin rule of each position for the price.
+
+            :param portfolio: A dataframe with the symbol, commission, value,
+                volume and stamp columns, as sent by database-read.
+            :type portfolio: pandas.DataFrame
+            :return: A dataframe with the symbol, take, stop, armed and volume
+                columns, sorted by symbol; take and stop are the prices at or
+                above which, and at or below which, the position is sold.
+            :rtype: pandas.DataFrame
+        """
+        portfolio = portfolio[portfolio['volume'].astype(float) > 0].sort_values('symbol')
+        cogs = portfolio['value'].values.astype(float) + portfolio['commission'].values.astype(float)
+        volumes = portfolio['volume'].values.astype(float)
+        with np.errstate(divide = 'ignore'):
+            if self.margin_type == 'percent':
+                # sales - cogs >= margin * sales
+                take = cogs / (volumes * (1.0 - self.margin_value)) if self.margin_value < 1.0 else np.full(volumes.shape[0], np.inf)
+            else:
+                # sales - cogs >= margin
+                take = (cogs + self.margin_value) / volumes
+        if self.stop_type is None:
+            stop = np.full(volumes.shape[0], -np.inf)
+        elif self.stop_type == 'percent':
+            # sales - cogs <= -stop_loss * sales
+            stop = cogs / (volumes * (1.0 + self.stop_value))
+        else:
+            # sales - cogs <= -stop_loss
+            stop = (cogs - self.stop_value) / volumes
+        return pd.DataFrame({
+            'symbol': portfolio['symbol'].values,
+            'take': take,
+            'stop': stop,
+            'armed': portfolio['stamp'].values.astype(np.int64) + self.cooldown * 1000,
+            'volume': volumes
+        }, columns = ['symbol', 'take', 'stop', 'armed', 'volume'])
+
+    def set_positions(self, portfolio):
+        """
+            Replaces the positions, e.g. with the ones read after a fill.
+        """
+        thresholds = self.thresholds(portfolio)
+        with self.lock:
+            self.symbols = thresholds['symbol'].values.astype(object)
+            self.take = thresholds['take'].values
+            self.stop = thresholds['stop'].values
+            self.armed = thresholds['armed'].values
+            self.volumes = thresholds['volume'].values
+
+    def check(self, ticks):
+        """
+            Finds the positions crossed by a batch of ticks. Each position is
+            triggered by its first crossing tick and is not triggered again
+            for rearm seconds.
+
+            :param ticks: A dataframe with the symbol, price and stamp columns.
+            :type ticks: pandas.DataFrame
+            :return: A dataframe with the ORDER_COLUMNS columns, the sell
+                orders, and a reason column (take or stop).
+            :rtype: pandas.DataFrame
+        """
+        with self.lock:
+            if self.symbols.shape[0] < 1 or ticks.shape[0] < 1:
+                return pd.DataFrame(columns = ORDER_COLUMNS + ['reason'])
+            ticks = ticks.sort_values('stamp', kind = 'stable')
+            tick_symbols = ticks['symbol'].values.astype(object)
+            prices = ticks['price'].values.astype(float)
+            stamps = ticks['stamp'].values.astype(np.int64)
+            # the position of each tick symbol, if held
+            positions = np.minimum(np.searchsorted(self.symbols, tick_symbols), self.symbols.shape[0] - 1)
+            held = self.symbols[positions] == tick_symbols
+            # the cooldown is the same check as the margin strategy does
+            crossed = held & (stamps > self.armed[positions])
+            take = crossed & (prices >= self.take[positions])
+            stop = crossed & (prices <= self.stop[positions])
+            indices = np.flatnonzero(take | stop)
+            orders = []
+            for index in indices:
+                position = positions[index]
+                symbol = self.symbols[position]
+                fired = self.fired.get(symbol)
+                if fired is not None and stamps[index] < fired + self.rearm * 1000:
+                    continue
+                self.fired[symbol] = int(stamps[index])
+                orders.append({
+                    'symbol': symbol,
+                    'volume': self.volumes[position],
+                    'price': prices[index],
+                    'reason': 'take' if take[index] else 'stop'
+                })
+            return pd.DataFrame(orders, columns = ORDER_COLUMNS + ['reason'])
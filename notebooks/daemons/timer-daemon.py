@@ -2,6 +2,7 @@
 import datetime
 import pika # pylint: disable=import-error
 import sys
+from broker import orders_routing_keys # pylint: disable=import-error
 from config import app_config # pylint: disable=import-error
 from logger import Logger # pylint: disable=import-error
 from pathlib import Path
@@ -79,7 +80,8 @@ if __name__ == '__main__':
             'stamp': current_stamp,
             'params': {
                 'lookahead': int(app_config.orders.lookahead),
-                'lookbehind': int(app_config.orders.lookbehind)
+                'lookbehind': int(app_config.orders.lookbehind),
+                'mode': getattr(app_config.orders, 'mode', 'transactions')
             }
         })
         logger.debug('Sent check trends message.')
@@ -106,17 +108,20 @@ if __name__ == '__main__':
     # if the state is orders, do the same thing as check-orders-timer.py
     elif state == 'orders':
         publisher['queue'] = 'orders'
-        publisher['routing_key'] = 'orders.make'
-        logger.debug('Initialized the Rabbit MQ connection: queue = {queue} / routing key = {routing_key}.'.format(
+        # one message per symbol partition, when the brokers are partitioned
+        routing_keys = orders_routing_keys(getattr(getattr(app_config, 'broker', None), 'partitions', 1))
+        logger.debug('Initialized the Rabbit MQ connection: queue = {queue} / routing keys = {routing_keys}.'.format(
             queue = publisher['queue'],
-            routing_key = publisher['routing_key']
+            routing_keys = ', '.join(routing_keys)
         ))
 
-        # send the Rabbit MQ message
-        logger.debug('Sending check orders message.')
+        # send the Rabbit MQ messages
+        for routing_key in routing_keys:
+            publisher['routing_key'] = routing_key
+            logger.debug('Sending check orders message to {routing_key}.'.format(routing_key = routing_key))
 
-        publisher.publish({
-            'stamp': current_stamp,
-            'lookahead': int(app_config.orders.lookahead)
-        })
-        logger.debug('Sent check orders message.')
\ No newline at end of file
+            publisher.publish({
+                'stamp': current_stamp,
+                'lookahead': int(app_config.orders.lookahead)
+            })
+            logger.debug('Sent check orders message.')
\ No newline at end of file
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+import datetime
+import numpy as np
+import pandas as pd
+from config import app_config # pylint: disable=import-error
+from db import create_db_engine, DatabaseSchema # pylint: disable=import-error
+from logger import Logger # pylint: disable=import-error
+from market import MarketTape, TickArchive # pylint: disable=import-error
+from models import trend_features, ModelStore, TrendModels # pylint: disable=import-error
+from pathlib import Path
+from sqlalchemy import text, MetaData
+
+# initialize the logger so we see what happens
+logger_path = Path(app_config.log.path)
+logger = Logger(path = logger_path / Path(__file__).stem, level = int(app_config.log.level))
+
+# connect to the database
+meta = MetaData()
+db_schema = DatabaseSchema(meta)
+engine = create_db_engine(app_config.db)
+meta.create_all(engine)
+logger.debug('Connected to the database with URL {url}'.format(url = repr(engine.url)))
+
+tf_config = app_config.tensorflow
+store = ModelStore(tf_config.models, keep = int(getattr(tf_config, 'keep_versions', 3)))
+models = TrendModels(
+    epochs = int(getattr(tf_config, 'epochs', 5)),
+    max_models = int(getattr(tf_config, 'max_models', 1024)),
+    intra_op_threads = int(getattr(tf_config, 'intra_op_threads', 0)),
+    inter_op_threads = int(getattr(tf_config, 'inter_op_threads', 0))
+)
+
+# train on the same window check-trends-tf looks at, unless set otherwise
+window = int(getattr(tf_config, 'train_window', int(app_config.orders.lookbehind) + int(app_config.orders.lookahead)))
+end_stamp = int(datetime.datetime.now(tz = datetime.timezone.utc).timestamp() * 1000)
+begin_stamp = end_stamp - window * 1000
+
+# the archive holds the complete days, the rest of the window is still in the database
+today = datetime.datetime.now(tz = datetime.timezone.utc).date()
+today_stamp = int(datetime.datetime(today.year, today.month, today.day, tzinfo = datetime.timezone.utc).timestamp() * 1000)
+frames = []
+if hasattr(app_config, 'archive') and begin_stamp < today_stamp:
+    frames.append(MarketTape.from_archive(TickArchive(app_config.archive.path), begin_stamp, today_stamp).transactions(begin_stamp, today_stamp))
+    begin_stamp = today_stamp
+frames.append(pd.read_sql(text('select\
+    id,\
+    price,\
+    symbol,\
+    stamp,\
+    volume\
+from\
+    {tables.TRANSACTIONS}\
+where\
+    stamp >= :begin and\
+    stamp < :end;'.format(tables = db_schema)),
+    con = engine,
+    params = {
+        'begin': begin_stamp,
+        'end': end_stamp
+    }
+))
+transactions = pd.concat(frames, ignore_index = True)
+logger.debug('Training on {transactions} transactions from the last {window} seconds.'.format(transactions = transactions.shape[0], window = window))
+
+for symbol, symbol_transactions in transactions.groupby('symbol', sort = False):
+    if symbol_transactions.shape[0] < 3:
+        logger.debug('For symbol {symbol} there are fewer than 3 transactions. Skipping.'.format(symbol = symbol))
+        continue
+    symbol_transactions = symbol_transactions.sort_values('stamp')
+    features = trend_features(symbol_transactions['stamp'].values.astype(np.int64), symbol_transactions['volume'].values.astype(np.float64))
+    models.fit(symbol, features, symbol_transactions['price'].values.astype(np.float64))
+
+weights = models.weights()
+if len(weights.symbols) < 1:
+    logger.debug('There are no models to write.')
+else:
+    version = store.write(weights)
+    logger.debug('Wrote the models of {symbols} symbols as version {version}.'.format(symbols = len(weights.symbols), version = version))